@@ -6,11 +6,15 @@ from .planner import AgentPlanner
 from .executor import AgentExecutor
 from .validator import AgentValidator
 from .orchestrator import ParserAgent
+from .tournament import ParserTournament
+from .fix_history import FixHistory
 
 __all__ = [
     'AgentPlanner',
     'AgentExecutor',
     'AgentValidator',
     'ParserAgent',
+    'ParserTournament',
+    'FixHistory',
 ]
 
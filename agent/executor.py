@@ -11,13 +11,23 @@ from tools import (
     extract_json_from_image, # 提取JSON Schema工具
     generate_parser_code, # 生成解析代码工具
 )
+from config.settings import settings
+from utils.field_check import expected_values_from_schema
+from utils.html_diff import build_differential_samples
+from .tournament import ParserTournament
 
 
 class AgentExecutor:
     """Agent执行器，负责执行具体任务"""
     
-    def __init__(self, output_dir: str = "output"):
+    def __init__(self, output_dir: str = "output", validator=None):
+        """
+        Args:
+            output_dir: 输出目录
+            validator: AgentValidator 实例（可选），用于缓存样本HTML和多候选锦标赛
+        """
         self.output_dir = Path(output_dir)
+        self.validator = validator
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
         # 创建子目录
@@ -80,7 +90,11 @@ class AgentExecutor:
         try:
             # 1. 获取HTML源码
             logger.info("  [1/3] 获取HTML源码...")
-            result['html'] = get_webpage_source.invoke({"url": url})
+            if self.validator:
+                # 与验证器共享HTML缓存，复用检查阶段已获取的页面不再重复打开浏览器
+                result['html'] = self.validator.fetch_html(url)
+            else:
+                result['html'] = get_webpage_source.invoke({"url": url})
 
             # 2. 截图
             logger.info("  [2/3] 截图...")
@@ -123,14 +137,38 @@ class AgentExecutor:
             merged_schema = self._merge_schemas(successful_samples)
             logger.info(f"合并后的Schema包含 {len(merged_schema)} 个字段")
 
-            # 使用第一个样本的HTML作为参考
+            # 使用第一个样本的HTML作为参考，其他样本只保留与参考模板不同的区域
             reference_html = successful_samples[0]['html']
+            sample_variations = self._build_sample_variations(successful_samples)
+
+            candidate_count = plan.get('candidate_count', 1)
+            if candidate_count > 1 and self.validator:
+                # 多候选并行生成，在缓存的样本HTML上择优
+                sample_pages = {s['url']: s['html'] for s in successful_samples}
+                parser_result = ParserTournament(self.validator).run(
+                    html_content=reference_html,
+                    target_json=merged_schema,
+                    sample_pages=sample_pages,
+                    output_dir=str(self.parsers_dir),
+                    candidate_count=candidate_count,
+                    domain=plan.get('domain'),
+                    template=plan.get('layout_type'),
+                    sample_variations=sample_variations,
+                    expected_values={
+                        s['url']: expected_values_from_schema(s.get('schema')) for s in successful_samples
+                    }
+                )
+                logger.success(f"解析器生成完成: {parser_result['parser_path']}")
+                return parser_result
 
             # 生成解析代码 - 使用 .invoke() 调用工具
             parser_result = generate_parser_code.invoke({
                 "html_content": reference_html,
                 "target_json": merged_schema,
-                "output_dir": str(self.parsers_dir)
+                "output_dir": str(self.parsers_dir),
+                "domain": plan.get('domain'),
+                "template": plan.get('layout_type'),
+                "sample_variations": sample_variations
             })
 
             logger.success(f"解析器生成完成: {parser_result['parser_path']}")
@@ -140,6 +178,25 @@ class AgentExecutor:
             logger.error(f"生成解析器失败: {str(e)}")
             return None
 
+    def _build_sample_variations(self, samples: List[Dict]) -> str:
+        """对齐多个样本的DOM，提取相对参考样本的差异区域"""
+        if not settings.differential_samples or len(samples) < 2:
+            return ""
+
+        try:
+            variations = build_differential_samples(
+                samples,
+                max_regions=settings.differential_max_regions,
+                max_region_chars=settings.differential_max_region_chars
+            )
+        except Exception as e:
+            logger.warning(f"提取样本差异失败，仅使用参考样本: {str(e)}")
+            return ""
+
+        if variations:
+            logger.info(f"提取样本差异: {len(variations)} 字符")
+        return variations
+
     def _merge_schemas(self, samples: List[Dict]) -> Dict:
         """
         合并多个样本的Schema，提取公共字段
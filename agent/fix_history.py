@@ -0,0 +1,111 @@
+"""
+修复历史
+按 (代码哈希, 错误集合哈希) 记录修复尝试，识别重复调用和版本之间的来回振荡，并决定何时升级修复策略
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from loguru import logger
+from config.settings import settings
+from utils.hashing import content_hash, json_hash
+
+
+# 修复策略，按成本从低到高排列
+STRATEGY_PATCH = "patch"            # 按函数替换
+STRATEGY_FULL = "full"              # 完整重写
+STRATEGY_MODEL = "model"            # 换用升级模型完整重写
+STRATEGY_REGENERATE = "regenerate"  # 多候选重新生成
+
+
+def error_signature(validation_errors: List[Dict]) -> str:
+    """
+    错误集合的哈希
+
+    只使用字段（或URL）和错误类型，不含具体的错误详情，
+    因此同一组字段以相同方式失败时得到相同的哈希
+    """
+    items = sorted(
+        (error.get('field') or error.get('url') or '', error.get('error') or '')
+        for error in validation_errors
+    )
+    return json_hash(items)
+
+
+def build_strategies() -> List[Dict]:
+    """根据配置构建修复策略升级序列"""
+    strategies = []
+    if settings.code_fix_mode == "patch":
+        strategies.append({'name': STRATEGY_PATCH, 'fix_mode': 'patch'})
+    strategies.append({'name': STRATEGY_FULL, 'fix_mode': 'full'})
+    if settings.fix_escalation_model and settings.fix_escalation_model != settings.code_gen_model:
+        strategies.append({
+            'name': STRATEGY_MODEL, 'fix_mode': 'full', 'model_name': settings.fix_escalation_model
+        })
+    if settings.fix_escalation_candidates > 1:
+        strategies.append({'name': STRATEGY_REGENERATE, 'candidate_count': settings.fix_escalation_candidates})
+    return strategies
+
+
+class FixHistory:
+    """
+    单次迭代修复过程中的修复历史
+
+    - 同一份代码遇到同一组错误时，已经尝试过的策略不再重复调用
+    - 修复结果与修复前相同，或回到了之前出现过的版本（振荡），视为没有进展
+    """
+
+    def __init__(self, strategies: List[Dict] = None):
+        self.strategies = strategies if strategies is not None else build_strategies()
+        # (代码哈希, 错误哈希) -> {策略名: 结果代码哈希}
+        self._attempts: Dict[Tuple[str, str], Dict[str, str]] = {}
+        # 出现过的版本哈希
+        self._versions: Set[str] = set()
+        self._level = 0
+
+    @property
+    def strategy(self) -> Optional[Dict]:
+        """当前策略，所有策略都已用尽时返回 None"""
+        return self.strategies[self._level] if self._level < len(self.strategies) else None
+
+    def visit(self, version_hash: str):
+        """记录出现过的版本"""
+        self._versions.add(version_hash)
+
+    def visited(self, version_hash: str) -> bool:
+        return version_hash in self._versions
+
+    def next_strategy(self, code_hash: str, errors_hash: str) -> Optional[Dict]:
+        """
+        选择下一次修复使用的策略
+
+        跳过对当前 (代码, 错误集合) 已经尝试过的策略
+
+        Returns:
+            策略，所有策略都已尝试过时返回 None
+        """
+        attempted = self._attempts.get((code_hash, errors_hash), {})
+        while self.strategy is not None and self.strategy['name'] in attempted:
+            logger.info(f"策略 {self.strategy['name']} 已对相同代码和错误集合尝试过，跳过")
+            self._level += 1
+        return self.strategy
+
+    def record(self, code_hash: str, errors_hash: str, strategy: Dict, result_code: str) -> str:
+        """
+        记录一次修复尝试
+
+        Returns:
+            结果代码的哈希
+        """
+        result_hash = content_hash(result_code)
+        self._attempts.setdefault((code_hash, errors_hash), {})[strategy['name']] = result_hash
+        return result_hash
+
+    def escalate(self, reason: str):
+        """升级到下一个策略"""
+        self._level += 1
+        if self.strategy is not None:
+            logger.warning(f"{reason}，升级修复策略: {self.strategy['name']}")
+        else:
+            logger.warning(f"{reason}，已没有可升级的修复策略")
+
+    def reset(self):
+        """取得进展后回到成本最低的策略"""
+        self._level = 0
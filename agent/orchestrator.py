@@ -2,14 +2,31 @@
 Agent 编排器
 整合规划器、执行器和验证器，提供统一的Agent接口
 """
-from typing import List, Dict
+import json
+from typing import List, Dict, Tuple
 from pathlib import Path
 from loguru import logger
 from .planner import AgentPlanner
 from .executor import AgentExecutor
 from .validator import AgentValidator
+from .tournament import ParserTournament
+from .fix_history import FixHistory, STRATEGY_REGENERATE, error_signature
 from config.settings import settings
 from tools import fix_parser_code
+from utils.parser_registry import DRIFT_DONE, DRIFT_FAILED, ParserRegistry
+from utils.drift_monitor import ACTION_REGENERATE, format_drift_report
+from utils.page_fingerprint import fingerprint_pages
+from utils.field_check import (
+    FIELD_EMPTY, FIELD_MISSING, FIELD_OK, STATUS_LABELS, expected_values_from_schema
+)
+from utils.dom_snippet import distill_page, locate_field_snippet
+from utils.parse_profile import format_profile
+from utils.bs4_transpile import transpile_parser_code
+from utils.token_budget import token_ledger
+
+
+# 处理漂移告警期间，告警样本页面在验证器HTML缓存中的固定分组
+_PIN_DRIFT_SAMPLES = "drift_alert"
 
 
 class ParserAgent:
@@ -27,8 +44,9 @@ class ParserAgent:
             output_dir: 输出目录
         """
         self.planner = AgentPlanner()
-        self.executor = AgentExecutor(output_dir)
         self.validator = AgentValidator()
+        self.executor = AgentExecutor(output_dir, validator=self.validator)
+        self.registry = ParserRegistry(self.executor.parsers_dir)
         self.output_dir = Path(output_dir)
         
         logger.info("ParserAgent 初始化完成")
@@ -38,7 +56,9 @@ class ParserAgent:
         urls: List[str],
         domain: str = None,
         layout_type: str = None,
-        validate: bool = True
+        validate: bool = True,
+        candidates: int = None,
+        validation_pool: List[str] = None
     ) -> Dict:
         """
         生成解析器
@@ -48,6 +68,8 @@ class ParserAgent:
             domain: 域名（可选）
             layout_type: 布局类型（可选）
             validate: 是否验证生成的代码
+            candidates: 并行生成的候选解析器数量（可选，默认使用配置）
+            validation_pool: 大量同类URL（可选），样本验证通过后在其中随机抽样做序贯验证
         
         Returns:
             生成结果
@@ -55,10 +77,19 @@ class ParserAgent:
         logger.info("="*70)
         logger.info("开始生成解析器")
         logger.info("="*70)
+        ledger_mark = token_ledger.mark()
+
+        # 复用检查：结构指纹与已验证解析器相近时，直接验证并复用，不调用LLM
+        if settings.fingerprint_reuse:
+            reused = self._try_reuse_parser(urls, domain, layout_type)
+            if reused:
+                return reused
         
         # 第一步：规划
         logger.info("\n[步骤 1/4] 任务规划")
         plan = self.planner.create_plan(urls, domain, layout_type)
+        if candidates:
+            plan['candidate_count'] = candidates
         
         # 第二步：执行
         logger.info("\n[步骤 2/4] 执行计划")
@@ -77,7 +108,10 @@ class ParserAgent:
         if validate:
             logger.info("\n[步骤 3/4] 验证解析器")
             parser_path = execution_result['final_parser']['parser_path']
-            validation_result = self.validator.validate_parser(parser_path, urls)
+            target_fields, expected_values = self._validation_targets(execution_result)
+            validation_result = self.validator.validate_parser(
+                parser_path, urls, target_fields, expected_values
+            )
             
             # 如果验证未通过，尝试迭代优化
             if not validation_result['passed']:
@@ -87,10 +121,36 @@ class ParserAgent:
                     validation_result,
                     plan
                 )
+
+            if validation_pool and validation_result['passed']:
+                validation_result = self._validate_on_pool(
+                    execution_result, validation_result, validation_pool, target_fields
+                )
+
+            self._record_validation(execution_result['final_parser'], validation_result)
+
+            if validation_result['passed'] and settings.parser_transpile:
+                self._transpile_parser(execution_result, validation_result, plan, validation_pool)
+
+        # 验证通过（或未要求验证）时，将该版本设为当前版本
+        if validation_result is None or validation_result['passed']:
+            version_hash = execution_result['final_parser']['version_hash']
+            self.registry.set_current(plan.get('domain'), plan.get('layout_type'), version_hash)
+
+            # 只为验证通过的解析器记录结构指纹，供后续复用
+            if validation_result is not None:
+                sample_pages = [s['html'] for s in execution_result['samples'] if s.get('success')]
+                self.registry.add_fingerprints(
+                    version_hash,
+                    fingerprint_pages(sample_pages),
+                    plan.get('domain'),
+                    plan.get('layout_type')
+                )
         
         # 第四步：总结
         logger.info("\n[步骤 4/4] 生成总结")
-        summary = self._generate_summary(execution_result, validation_result)
+        token_usage = token_ledger.summary(since=ledger_mark)
+        summary = self._generate_summary(execution_result, validation_result, token_usage)
         
         logger.info("="*70)
         logger.success("解析器生成完成!")
@@ -102,10 +162,266 @@ class ParserAgent:
             'execution_result': execution_result,
             'validation_result': validation_result,
             'summary': summary,
+            'reused': False,
             'parser_path': execution_result['final_parser']['parser_path'],
             'config_path': execution_result['final_parser']['config_path'],
+            'version_hash': execution_result['final_parser']['version_hash'],
+            'transpile': execution_result.get('transpile'),
+            'token_usage': token_usage,
         }
     
+    def _try_reuse_parser(self, urls: List[str], domain: str = None, layout_type: str = None) -> Dict:
+        """
+        尝试复用已验证的解析器
+
+        只在同一 (域名, 模板) 下、与当前版本使用相同 Schema 配置的版本中按结构指纹查找，
+        在样本页面上验证通过后直接返回；(域名, 模板) 还没有当前版本时不复用
+
+        Returns:
+            复用成功时返回与正常生成相同格式的结果，否则返回 None
+        """
+        domain = domain or self.planner._extract_domain(urls[0])
+        # 与规划器一致，未指定布局类型时记为 unknown
+        template = layout_type or 'unknown'
+        current = self.registry.get_current(domain, template)
+        if current is None:
+            logger.info(f"{domain}/{template} 还没有已验证的解析器，不复用")
+            return None
+
+        sample_urls = urls[:min(3, len(urls))]
+        try:
+            pages = [self.validator.fetch_html(url) for url in sample_urls]
+        except Exception as e:
+            logger.warning(f"获取样本页面失败，跳过复用检查: {str(e)}")
+            return None
+
+        fingerprints = fingerprint_pages(pages)
+        matches = self.registry.find_by_fingerprints(
+            fingerprints, settings.fingerprint_max_distance, domain, template, current['schema_hash']
+        )
+        if not matches:
+            logger.info("未找到结构相近的已验证解析器")
+            return None
+
+        for version in matches:
+            logger.info(
+                f"发现结构相近的解析器: {version['hash'][:12]} "
+                f"(平均汉明距离 {version['fingerprint_distance']:.1f})，验证中..."
+            )
+            config = self._load_config(version.get('config_path'))
+            validation_result = self.validator.validate_parser(
+                version['parser_path'], sample_urls, (config or {}).get('fields') or {}
+            )
+            self._record_validation(version, validation_result)
+            if not validation_result['passed']:
+                continue
+
+            self.registry.set_current(domain, template, version['hash'])
+            self.registry.add_fingerprints(version['hash'], fingerprints, domain, template)
+
+            logger.success(f"复用已验证的解析器: {version['parser_path']}")
+            plan = self.planner._parse_plan("复用已验证的解析器，未调用LLM规划", urls, domain, layout_type)
+            execution_result = {
+                'plan': plan,
+                'samples': [
+                    {'url': url, 'html': html, 'success': True} for url, html in zip(sample_urls, pages)
+                ],
+                'final_parser': {
+                    'parser_path': version['parser_path'],
+                    'config_path': version['config_path'],
+                    'version_hash': version['hash'],
+                    'code': Path(version['parser_path']).read_text(encoding='utf-8'),
+                    'config': config,
+                },
+                'success': True,
+            }
+            return {
+                'success': True,
+                'reused': True,
+                'plan': plan,
+                'execution_result': execution_result,
+                'validation_result': validation_result,
+                'summary': f"复用已验证的解析器 {version['hash'][:12]}，成功率: {validation_result['success_rate']:.1%}",
+                'parser_path': version['parser_path'],
+                'config_path': version['config_path'],
+                'version_hash': version['hash'],
+                'transpile': None,
+                'token_usage': {},
+            }
+
+        logger.info("结构相近的解析器均未通过验证，重新生成")
+        return None
+
+    def process_drift_alerts(self, limit: int = None) -> List[Dict]:
+        """
+        处理漂移队列中待处理的告警（见 utils.drift_monitor）
+
+        - fix：以告警中的失败样本页面为验证集，在当前版本上运行迭代修复
+        - regenerate：样本ID是URL时走完整的生成流程，否则基于缓存的样本页面多候选重新生成
+
+        新版本在样本页面上验证通过后设为当前版本；告警按结果标记为 done / failed
+
+        Args:
+            limit: 最多处理的告警数
+
+        Returns:
+            每条告警的处理结果 [{'alert_id', 'success', 'version_hash', 'error'}]
+        """
+        alerts = self.registry.drift_alerts()
+        if limit:
+            alerts = alerts[:limit]
+        results = []
+        for alert in alerts:
+            logger.info(f"\n处理漂移告警 #{alert['id']}: 解析器 {alert['hash'][:12]}（{alert['action']}）")
+            for line in format_drift_report(alert['report']):
+                logger.info(f"  {line}")
+            try:
+                result = self._handle_drift_alert(alert)
+            except Exception as e:
+                logger.error(f"处理漂移告警失败: {str(e)}")
+                result = {'success': False, 'error': str(e)}
+            finally:
+                self.validator.unpin_pages(_PIN_DRIFT_SAMPLES)
+            self.registry.update_drift_alert(
+                alert['id'], DRIFT_DONE if result['success'] else DRIFT_FAILED, result.get('version_hash')
+            )
+            results.append({
+                'alert_id': alert['id'],
+                'success': result['success'],
+                'version_hash': result.get('version_hash'),
+                'error': result.get('error'),
+            })
+        return results
+
+    def _handle_drift_alert(self, alert: Dict) -> Dict:
+        """
+        重新生成或修复一条告警对应的解析器
+
+        告警中的基线页面（漂移前解析正常的页面及当时的结果）与失败样本一起作为验证集，
+        新版本还需在基线页面上单独通过回归检查才会被采用
+        """
+        version = self.registry.get(alert['hash'])
+        if not version:
+            return {'success': False, 'error': f"注册表中没有版本 {alert['hash'][:12]}"}
+        domain, template = alert['domain'] or None, alert['template'] or None
+
+        pages, baseline_pages, baseline_expected = {}, {}, {}
+        for sample in alert['samples']:
+            if not (sample.get('html_path') and Path(sample['html_path']).exists()):
+                continue
+            html = Path(sample['html_path']).read_text(encoding='utf-8')
+            if sample.get('baseline'):
+                baseline_pages[sample['id']] = html
+                baseline_expected[sample['id']] = sample.get('data') or {}
+            else:
+                pages[sample['id']] = html
+        urls = [
+            s['id'] for s in alert['samples']
+            if not s.get('baseline') and str(s['id']).startswith(('http://', 'https://'))
+        ]
+        # 样本页面和基线页面在处理期间固定在验证器缓存中，验证和修复都不再重新获取
+        self.validator.cache_pages({**pages, **baseline_pages}, pin=_PIN_DRIFT_SAMPLES)
+
+        if alert['action'] == ACTION_REGENERATE and urls:
+            result = self.generate_parser(urls, domain=domain, layout_type=template)
+            passed = result['success'] and bool(
+                result.get('validation_result') and result['validation_result']['passed']
+            )
+            if passed and result.get('version_hash') != version['hash']:
+                target_fields = (self._load_config(result.get('config_path')) or {}).get('fields') or {}
+                regression = self._check_baseline_regression(
+                    result['parser_path'], baseline_pages, baseline_expected, target_fields
+                )
+                if regression:
+                    self.registry.rollback(result['plan'].get('domain'), result['plan'].get('layout_type'))
+                    return {'success': False, 'version_hash': result['version_hash'], 'error': regression}
+            return {'success': passed, 'version_hash': result.get('version_hash'), 'error': result.get('error')}
+
+        sample_ids = list(pages) or urls
+        if not sample_ids:
+            return {'success': False, 'error': "告警中没有可用的失败样本"}
+
+        config = self._load_config(version.get('config_path'))
+        execution_result = {
+            'final_parser': {
+                'code': Path(version['parser_path']).read_text(encoding='utf-8'),
+                'parser_path': version['parser_path'],
+                'config_path': version.get('config_path'),
+                'version_hash': version['hash'],
+                'config': config,
+            },
+            'samples': [{'url': doc_id, 'html': html, 'success': True} for doc_id, html in pages.items()],
+        }
+        validation_ids = sample_ids + [doc_id for doc_id in baseline_pages if doc_id not in sample_ids]
+        plan = {'domain': domain, 'layout_type': template, 'sample_urls': validation_ids}
+        target_fields, expected_values = self._validation_targets(execution_result)
+        expected_values.update(baseline_expected)
+
+        if alert['action'] == ACTION_REGENERATE:
+            regenerated = self._regenerate_for_fix(execution_result, plan, max(settings.tournament_candidates, 1))
+            if not regenerated['success']:
+                return {'success': False, 'error': regenerated.get('error')}
+            new_version = self.registry.put(
+                regenerated['fixed_code'], config, domain=domain, template=template,
+                model=settings.code_gen_model, parent_hash=version['hash']
+            )
+            final_parser = execution_result['final_parser']
+            final_parser['code'] = regenerated['fixed_code']
+            final_parser['parser_path'] = new_version['parser_path']
+            final_parser['version_hash'] = new_version['hash']
+
+        final_parser = execution_result['final_parser']
+        validation_result = self.validator.validate_parser(
+            final_parser['parser_path'], validation_ids, target_fields, expected_values
+        )
+        if not validation_result['passed']:
+            validation_result = self._iterate_and_improve(execution_result, validation_result, plan)
+        self._record_validation(final_parser, validation_result)
+
+        if not validation_result['passed']:
+            return {
+                'success': False,
+                'version_hash': final_parser['version_hash'],
+                'error': f"样本页面验证未通过: 成功率 {validation_result['success_rate']:.1%}",
+            }
+        if final_parser['version_hash'] != version['hash']:
+            regression = self._check_baseline_regression(
+                final_parser['parser_path'], baseline_pages, baseline_expected, target_fields
+            )
+            if regression:
+                return {'success': False, 'version_hash': final_parser['version_hash'], 'error': regression}
+            self.registry.set_current(domain, template, final_parser['version_hash'])
+            logger.success(f"漂移处理完成，当前版本切换为 {final_parser['version_hash'][:12]}")
+        else:
+            logger.info("当前版本在失败样本上验证通过，无需修改")
+        return {'success': True, 'version_hash': final_parser['version_hash']}
+
+    def _check_baseline_regression(
+        self,
+        parser_path: str,
+        baseline_pages: Dict[str, str],
+        baseline_expected: Dict[str, Dict],
+        target_fields: Dict
+    ) -> str:
+        """
+        在漂移前解析正常的基线页面上验证新版本（以当时的解析结果为参考值）
+
+        Returns:
+            未通过时返回错误说明，通过或没有基线页面时返回 None
+        """
+        if not baseline_pages:
+            logger.warning("告警中没有基线页面，跳过回归检查")
+            return None
+        logger.info(f"在 {len(baseline_pages)} 个基线页面上做回归检查...")
+        # 基线页面放入验证器缓存，不重新获取
+        self.validator.cache_pages(baseline_pages, pin=_PIN_DRIFT_SAMPLES)
+        regression = self.validator.validate_parser(
+            parser_path, list(baseline_pages), target_fields, baseline_expected
+        )
+        if regression['passed']:
+            return None
+        return f"基线页面回归检查未通过: 成功率 {regression['success_rate']:.1%}"
+
     def _iterate_and_improve(
         self,
         execution_result: Dict,
@@ -123,8 +439,11 @@ class ParserAgent:
         """
         max_iterations = plan.get('max_iterations', settings.max_iterations)
         current_validation = validation_result
-        current_parser_path = execution_result['final_parser']['parser_path']
-        current_code = execution_result['final_parser']['code']
+        target_fields, expected_values = self._validation_targets(execution_result)
+        start_hash = execution_result['final_parser']['version_hash']
+        iterations_used = 0
+        history = FixHistory()
+        history.visit(start_hash)
 
         logger.info(f"开始迭代优化，最大迭代次数: {max_iterations}")
 
@@ -149,35 +468,85 @@ class ParserAgent:
 
             logger.info(f"发现 {len(validation_errors)} 个验证错误")
 
+            # 只针对未通过的字段修复，已通过的字段保持不变
+            failing = sorted({e['field'] for e in validation_errors if e.get('field')})
+            if failing:
+                logger.info(f"需要修复的字段: {', '.join(failing)}")
+
+            # 从缓存中提取失败页面与字段相关的HTML区域，不重新获取页面
+            html_sample = None
+            if settings.fix_html_context:
+                html_sample = self._build_fix_html_context(
+                    current_validation, failing or list(target_fields), expected_values
+                )
+
+            # 相同代码 + 相同错误集合下已尝试过的策略不再重复调用
+            final_parser = execution_result['final_parser']
+            code_hash = final_parser['version_hash']
+            errors_hash = error_signature(validation_errors)
+            strategy = history.next_strategy(code_hash, errors_hash)
+            if strategy is None:
+                logger.warning("所有修复策略都已尝试过，停止迭代")
+                break
+
             # 使用LLM修复代码
-            logger.info("调用LLM修复代码...")
-            fix_result = fix_parser_code.invoke({
-                "original_code": current_code,
-                "validation_errors": validation_errors,
-                "target_json": execution_result['final_parser'].get('config', {}),
-                "html_sample": None  # 可以传入HTML样本
-            })
+            logger.info(f"调用LLM修复代码（策略: {strategy['name']}）...")
+            iterations_used = iteration
+            if strategy['name'] == STRATEGY_REGENERATE:
+                fix_result = self._regenerate_for_fix(execution_result, plan, strategy['candidate_count'])
+            else:
+                fix_result = fix_parser_code.invoke({
+                    "original_code": final_parser['code'],
+                    "validation_errors": validation_errors,
+                    "target_json": final_parser.get('config', {}),
+                    "html_sample": html_sample,
+                    "failing_fields": failing or None,
+                    "fix_mode": strategy['fix_mode'],
+                    "model_name": strategy.get('model_name')
+                })
 
             if not fix_result.get('success'):
                 logger.error(f"代码修复失败: {fix_result.get('error')}")
-                break
+                history.record(code_hash, errors_hash, strategy, final_parser['code'])
+                history.escalate("修复调用失败")
+                continue
 
-            # 保存修复后的代码
             fixed_code = fix_result['fixed_code']
-            logger.info("保存修复后的代码...")
+            fixed_hash = history.record(code_hash, errors_hash, strategy, fixed_code)
+            if fixed_hash == code_hash:
+                history.escalate("修复结果与原代码相同")
+                continue
+            if history.visited(fixed_hash):
+                # 回到了之前出现过的版本，再验证也只会得到相同的结果
+                history.escalate(f"修复结果回到了之前的版本 {fixed_hash[:12]}（振荡）")
+                continue
 
-            # 更新解析器文件
-            with open(current_parser_path, 'w', encoding='utf-8') as f:
-                f.write(fixed_code)
-
-            logger.success(f"代码已更新: {current_parser_path}")
+            # 修复后的代码作为新版本存入注册表，不覆盖原文件
+            version = self.registry.put(
+                fixed_code,
+                final_parser.get('config'),
+                domain=plan.get('domain'),
+                template=plan.get('layout_type'),
+                model=strategy.get('model_name') or settings.code_gen_model,
+                parent_hash=code_hash
+            )
+            logger.success(f"修复版本已注册: {version['parser_path']}")
 
             # 重新验证
             logger.info("重新验证修复后的代码...")
             new_validation = self.validator.validate_parser(
-                current_parser_path,
-                plan.get('sample_urls', [])
+                version['parser_path'],
+                plan.get('sample_urls', []),
+                target_fields,
+                expected_values
             )
+            history.visit(version['hash'])
+
+            if new_validation.get('counts', {}).get('skipped'):
+                # 之前失败的页面仍然全部失败，新版本不可能比当前版本更好；回归检查已跳过，成功率不完整，不写入注册表
+                history.escalate("之前失败的页面仍然全部失败")
+                continue
+            self._record_validation(version, new_validation)
 
             # 检查是否有改进
             old_rate = current_validation['success_rate']
@@ -185,42 +554,345 @@ class ParserAgent:
 
             logger.info(f"成功率变化: {old_rate:.1%} -> {new_rate:.1%}")
 
-            if new_rate > old_rate:
-                logger.success(f"✓ 成功率提升了 {(new_rate - old_rate):.1%}")
+            if new_rate >= old_rate:
+                if new_rate > old_rate:
+                    logger.success(f"✓ 成功率提升了 {(new_rate - old_rate):.1%}")
+                    history.reset()
+                elif error_signature(self._collect_validation_errors(new_validation)) == errors_hash:
+                    # 成功率和错误集合都没有变化，继续同样的调用不会有进展
+                    history.escalate("成功率和错误集合都没有变化")
+                else:
+                    logger.warning("成功率没有变化，但错误集合发生了变化")
                 current_validation = new_validation
-                current_code = fixed_code
 
-                # 更新execution_result中的代码
-                execution_result['final_parser']['code'] = fixed_code
-            elif new_rate == old_rate:
-                logger.warning("成功率没有变化")
-                current_validation = new_validation
-                current_code = fixed_code
+                # 切换到新版本
+                final_parser['code'] = fixed_code
+                final_parser['parser_path'] = version['parser_path']
+                final_parser['version_hash'] = version['hash']
             else:
-                logger.error(f"✗ 成功率下降了 {(old_rate - new_rate):.1%}，回滚修改")
-                # 回滚代码
-                with open(current_parser_path, 'w', encoding='utf-8') as f:
-                    f.write(current_code)
-                logger.info("已回滚到上一个版本")
-                break
+                # 旧版本仍保存在注册表中，保持引用即可完成回滚
+                logger.error(f"✗ 成功率下降了 {(old_rate - new_rate):.1%}，保留上一个版本")
+                history.escalate("成功率下降")
+
+        # 记录修复所需的迭代次数，用于比较不同修复策略的效果
+        current_validation['fix_iterations'] = iterations_used
+        if iterations_used:
+            self.registry.record_fix_run(
+                start_hash,
+                execution_result['final_parser']['version_hash'],
+                iterations_used,
+                current_validation['passed'],
+                html_context=settings.fix_html_context,
+                domain=plan.get('domain'),
+                template=plan.get('layout_type')
+            )
+            for stats in self.registry.fix_run_stats():
+                message = (
+                    f"历史修复统计（HTML上下文: {'有' if stats['html_context'] else '无'}）: "
+                    f"{stats['runs']} 次, 通过率 {stats['pass_rate']:.1%}"
+                )
+                if stats['avg_iterations_to_pass'] is not None:
+                    message += f", 平均通过迭代次数 {stats['avg_iterations_to_pass']:.2f}"
+                logger.info(message)
 
         return current_validation
 
+    def _regenerate_for_fix(self, execution_result: Dict, plan: Dict, candidate_count: int) -> Dict:
+        """
+        修复策略的最后一级：基于缓存的样本页面多候选重新生成
+
+        Returns:
+            与 fix_parser_code 相同格式的结果
+        """
+        samples = [s for s in execution_result.get('samples', []) if s.get('success')]
+        if not samples:
+            return {'success': False, 'error': '没有可用于重新生成的样本'}
+
+        final_parser = execution_result['final_parser']
+        try:
+            parser_result = ParserTournament(self.validator).run(
+                html_content=samples[0]['html'],
+                target_json=(final_parser.get('config') or {}).get('fields') or {},
+                sample_pages={s['url']: s['html'] for s in samples},
+                output_dir=str(self.executor.parsers_dir),
+                candidate_count=candidate_count,
+                domain=plan.get('domain'),
+                template=plan.get('layout_type')
+            )
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+        return {
+            'success': True,
+            'fixed_code': parser_result['code'],
+            'original_code': final_parser['code'],
+            'changes_made': f"{candidate_count} 个候选重新生成",
+            'fix_mode': STRATEGY_REGENERATE
+        }
+
+    def _build_fix_html_context(
+        self,
+        validation_result: Dict,
+        field_names: List[str],
+        expected_values: Dict[str, Dict]
+    ) -> str:
+        """
+        为修复构建紧凑的HTML上下文
+
+        只使用验证器缓存中失败页面的HTML，并提炼为字段所在的区域
+
+        Returns:
+            HTML上下文，没有可用的失败页面时返回 None
+        """
+        # 失败样本只包含未通过的页面和存在异常字段的页面
+        failed_urls = [
+            t['url'] for t in validation_result.get('failures', [])
+            if t['url'] in self.validator.html_cache
+        ][:settings.fix_html_context_pages]
+        if not failed_urls:
+            return None
+
+        max_chars = settings.fix_html_context_chars // len(failed_urls)
+        parts = []
+        for url in failed_urls:
+            region = distill_page(
+                self.validator.html_cache[url], field_names, expected_values.get(url), max_chars
+            )
+            if region:
+                parts.append(f"<!-- 失败页面: {url} -->\n{region}")
+
+        if not parts:
+            return None
+        logger.info(f"提供 {len(parts)} 个失败页面的HTML上下文（{sum(len(p) for p in parts)} 字符）")
+        return "\n\n".join(parts)
+
+    def _validate_on_pool(
+        self,
+        execution_result: Dict,
+        validation_result: Dict,
+        validation_pool: List[str],
+        target_fields: Dict
+    ) -> Dict:
+        """在URL池上做序贯验证，没有通过时整体验证记为未通过"""
+        logger.info(f"\n样本验证通过，在 {len(validation_pool)} 个URL中抽样做序贯验证")
+        pool_result = self.validator.validate_parser_sequential(
+            execution_result['final_parser']['parser_path'], validation_pool, target_fields
+        )
+        validation_result['pool_validation'] = pool_result['sequential']
+        if not pool_result['passed']:
+            validation_result['passed'] = False
+            validation_result['issues'] = validation_result.get('issues', []) + pool_result['issues'] + [
+                f"URL池验证未通过: 成功率 {pool_result['success_rate']:.1%}"
+            ]
+        return validation_result
+
+    def _transpile_parser(
+        self,
+        execution_result: Dict,
+        validation_result: Dict,
+        plan: Dict,
+        validation_pool: List[str] = None
+    ):
+        """
+        把验证通过的 BeautifulSoup 解析器转译为直接使用 lxml 的版本
+
+        转译版本作为子版本存入注册表，在已缓存的验证页面（不足 TRANSPILE_MIN_PAGES 个时从URL池补充）上
+        与原版本逐页对比输出；页面数达到 TRANSPILE_MIN_PAGES、输出完全一致且加速比不低于 TRANSPILE_MIN_SPEEDUP 时
+        切换到转译版本，否则保留原版本。报告写入 execution_result['transpile']
+        """
+        final_parser = execution_result['final_parser']
+        result = transpile_parser_code(final_parser['code'])
+        report = {'transpilable': result['transpilable'], 'reasons': result['reasons'], 'adopted': False}
+        execution_result['transpile'] = report
+        if not result['transpilable']:
+            logger.info("解析器无法转译为 lxml: " + "; ".join(result['reasons']))
+            return
+
+        documents = self._transpile_documents(validation_pool)
+        if len(documents) < settings.transpile_min_pages:
+            report['reasons'] = [
+                f"只有 {len(documents)} 个页面可用于对比，少于 TRANSPILE_MIN_PAGES={settings.transpile_min_pages}"
+            ]
+            logger.info("转译版本不对比: " + report['reasons'][0])
+            return
+
+        original_hash = final_parser['version_hash']
+        version = self.registry.put(
+            result['code'],
+            final_parser.get('config'),
+            domain=plan.get('domain'),
+            template=plan.get('layout_type'),
+            model="bs4-transpile",
+            parent_hash=original_hash
+        )
+        report['version_hash'] = version['hash']
+        report['rewrites'] = result['rewrites']
+
+        logger.info(f"在 {len(documents)} 个已缓存页面上对比转译版本 {version['hash'][:12]} 与原版本...")
+        try:
+            comparison = self.validator.compare_parsers(
+                final_parser['parser_path'],
+                version['parser_path'],
+                documents,
+                rounds=settings.transpile_benchmark_rounds
+            )
+        except Exception as e:
+            logger.warning(f"转译版本对比失败: {e}")
+            report['reasons'] = [f"对比失败: {e}"]
+            return
+        report.update(comparison)
+
+        speedup = comparison['speedup']
+        speedup_text = f"{speedup:.2f}x" if speedup else "未知"
+        if not comparison['equivalent']:
+            logger.warning(
+                f"转译版本输出与原版本不一致（{comparison['mismatched_pages']}/{comparison['pages']} 个页面），保留原版本"
+            )
+            return
+        if not speedup or speedup < settings.transpile_min_speedup:
+            logger.info(f"转译版本加速 {speedup_text}，低于 {settings.transpile_min_speedup:.2f}x，保留原版本")
+            return
+
+        logger.success(
+            f"转译版本输出一致，解析耗时 {comparison['original_ms']:.1f}ms -> {comparison['candidate_ms']:.1f}ms"
+            f"（加速 {speedup_text}），切换到转译版本"
+        )
+        report['adopted'] = True
+        final_parser['code'] = result['code']
+        final_parser['parser_path'] = version['parser_path']
+        final_parser['version_hash'] = version['hash']
+        validation_result['avg_parse_time_ms'] = comparison['candidate_ms'] / comparison['pages']
+        validation_result.pop('max_parse_time_ms', None)
+        self._record_validation(version, validation_result)
+
+    def _transpile_documents(self, validation_pool: List[str] = None) -> List[str]:
+        """转译对比使用的页面：已缓存的验证页面，不足 TRANSPILE_MIN_PAGES 个时从URL池中补充获取"""
+        pages = dict(self.validator.html_cache)
+        for url in validation_pool or []:
+            if len(pages) >= settings.transpile_min_pages:
+                break
+            if url in pages:
+                continue
+            try:
+                pages[url] = self.validator.fetch_html(url)
+            except Exception as e:
+                logger.warning(f"获取转译对比页面失败: {url} ({str(e)})")
+        return list(pages.values())
+
+    def _record_validation(self, version: Dict, validation_result: Dict):
+        """将验证指标写入注册表"""
+        version_hash = version.get('version_hash') or version.get('hash')
+        self.registry.update_metrics(
+            version_hash,
+            validation_score=(
+                validation_result['score'] if validation_result.get('score') is not None
+                else validation_result['success_rate']
+            ),
+            success_rate=validation_result['success_rate'],
+            avg_parse_time_ms=validation_result.get('avg_parse_time_ms'),
+            max_parse_time_ms=validation_result.get('max_parse_time_ms')
+        )
+
+    def _validation_targets(self, execution_result: Dict) -> Tuple[Dict, Dict[str, Dict]]:
+        """
+        逐字段验证所需的目标字段和参考值
+
+        Returns:
+            (字段名 -> 字段定义, URL -> {字段名: 视觉提取的参考值})
+        """
+        config = execution_result['final_parser'].get('config') or {}
+        target_fields = config.get('fields') or {}
+        expected_values = {
+            s['url']: expected_values_from_schema(s.get('schema'))
+            for s in execution_result.get('samples', []) if s.get('success')
+        }
+        return target_fields, expected_values
+
+    @staticmethod
+    def _load_config(config_path: str = None) -> Dict:
+        """读取Schema配置文件，不存在时返回 None"""
+        if not config_path or not Path(config_path).exists():
+            return None
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
     def _collect_validation_errors(self, validation_result: Dict) -> List[Dict]:
         """收集验证错误信息"""
         errors = []
+        field_failures: Dict[str, List[Tuple[str, Dict]]] = {}
+
+        for test in validation_result.get('failures', []):
+            field_results = test.get('field_results') or {}
+            for name, field_result in field_results.items():
+                # 可选字段在部分页面上缺失是正常的
+                optional_absent = (
+                    not field_result['required'] and field_result['status'] in (FIELD_MISSING, FIELD_EMPTY)
+                )
+                if field_result['status'] != FIELD_OK and not optional_absent:
+                    field_failures.setdefault(name, []).append((test['url'], field_result))
 
-        for test in validation_result.get('tests', []):
-            if not test.get('success'):
+            # 解析耗时超出预算时附上剖析结果，由修复器优化最慢的提取函数
+            if test.get('latency_error'):
+                errors.append({
+                    'url': test.get('url'),
+                    'error': "解析耗时超出预算",
+                    'details': f"{test['latency_error']}\n" + format_profile(
+                        test.get('profile'), test['parse_time_ms'], test.get('cpu_time_ms')
+                    )
+                })
+
+            # 有逐字段结果时按字段汇总，否则按页面报告
+            if not test.get('success') and not field_results and test.get('error') != test.get('latency_error'):
                 errors.append({
                     'url': test.get('url'),
                     'error': test.get('error', 'Unknown error'),
                     'details': test.get('details', '')
                 })
 
+        for name, failures in field_failures.items():
+            errors.append(self._field_error(name, failures, validation_result.get('field_stats', {}).get(name)))
+
+        # 静态检查发现的性能问题也交给修复器处理
+        for finding in validation_result.get('lint_findings', []):
+            errors.append({
+                'url': '静态性能检查',
+                'error': f"[{finding['severity']}] {finding['rule']}",
+                'details': f"第{finding['line']}行: {finding['message']}"
+            })
+
         return errors
     
-    def _generate_summary(self, execution_result: Dict, validation_result: Dict = None) -> str:
+    def _field_error(self, name: str, failures: List[Tuple[str, Dict]], stats: Dict[str, int] = None) -> Dict:
+        """
+        汇总单个字段在各页面上的失败情况，并附上该字段所在的DOM片段
+
+        失败样本数量有限，页面总数优先取自字段统计
+        """
+        urls = [url for url, _ in failures]
+        total = sum(count for status, count in (stats or {}).items() if status != FIELD_OK) or len(urls)
+        lines = [
+            f"{url}: {STATUS_LABELS[r['status']]} - {r['message']}" for url, r in failures[:3]
+        ]
+
+        # 优先在有参考值的页面上定位字段
+        url, field_result = next(((u, r) for u, r in failures if r['expected'] is not None), failures[0])
+        html = self.validator.html_cache.get(url)
+        snippet = locate_field_snippet(html, name, field_result['expected']) if html else None
+        if field_result['expected'] is not None:
+            lines.append(f"参考值: {str(field_result['expected'])[:200]}")
+        if snippet:
+            lines.append(f"字段所在的DOM片段（{url}）:\n{snippet}")
+
+        statuses = sorted({STATUS_LABELS[r['status']] for _, r in failures})
+        return {
+            'url': ", ".join(urls[:3]) + (f" 等 {total} 个页面" if total > 3 else ""),
+            'error': f"字段 {name}: {'/'.join(statuses)}",
+            'details': "\n".join(lines),
+            'field': name
+        }
+
+    def _generate_summary(self, execution_result: Dict, validation_result: Dict = None,
+                          token_usage: Dict = None) -> str:
         """生成执行总结"""
         lines = []
         lines.append("\n" + "="*70)
@@ -243,6 +915,34 @@ class ParserAgent:
             passed = validation_result.get('passed', False)
             lines.append(f"\n验证结果: {'通过' if passed else '未通过'}")
             lines.append(f"成功率: {success_rate:.1%}")
+            pool = validation_result.get('pool_validation')
+            if pool:
+                low, high = pool['interval']
+                lines.append(
+                    f"URL池序贯验证: 成功率 {pool['success_rate']:.1%}，"
+                    f"{pool['confidence']:.0%} 置信区间 [{low:.1%}, {high:.1%}]，"
+                    f"使用 {pool['trials']}/{pool['pool_size']} 个URL"
+                )
+        
+        transpile = execution_result.get('transpile')
+        if transpile:
+            if transpile.get('adopted'):
+                lines.append(
+                    f"lxml 转译: 已采用，{transpile['pages']} 个页面输出一致，加速 {transpile['speedup']:.2f}x"
+                )
+            elif transpile.get('pages'):
+                speedup = f"{transpile['speedup']:.2f}x" if transpile.get('speedup') else "未知"
+                lines.append(
+                    f"lxml 转译: 未采用（{transpile['mismatched_pages']}/{transpile['pages']} 个页面输出不一致，"
+                    f"加速 {speedup}）"
+                )
+            else:
+                lines.append("lxml 转译: 不适用（" + "; ".join(transpile['reasons'][:3]) + "）")
+        
+        # LLM token 用量（按调用名称）
+        if token_usage:
+            lines.append("\nToken用量:")
+            lines.extend(f"  {line}" for line in token_ledger.format_summary(token_usage))
         
         lines.append("="*70)
         
@@ -7,6 +7,7 @@ from typing import List, Dict
 from loguru import logger
 from langchain_openai import ChatOpenAI
 from config.settings import settings
+from utils.token_budget import PromptSection, TokenBudget, count_message_tokens, token_ledger
 
 
 class AgentPlanner:
@@ -48,6 +49,7 @@ class AgentPlanner:
             {"role": "user", "content": prompt}
         ]
         response = self.llm.invoke(messages)
+        token_ledger.record("planning", count_message_tokens(messages), response)
         
         # 解析计划
         plan = self._parse_plan(response.content, urls, domain, layout_type)
@@ -64,13 +66,20 @@ class AgentPlanner:
     def _build_planning_prompt(self, urls: List[str], domain: str, layout_type: str) -> str:
         """构建规划提示词"""
         urls_text = "\n".join([f"- {url}" for url in urls[:5]])  # 最多显示5个
-        
+        parts = TokenBudget(settings.agent_prompt_tokens).allocate([
+            PromptSection("instructions", self._render_planning_prompt("", domain, layout_type, len(urls)), shrinkable=False),
+            PromptSection("urls", urls_text, priority=1, min_tokens=50),
+        ])
+        return self._render_planning_prompt(parts["urls"], domain, layout_type, len(urls))
+
+    def _render_planning_prompt(self, urls_text: str, domain: str, layout_type: str, url_count: int) -> str:
+        """渲染规划提示词模板"""
         prompt = f"""
 你需要为以下网页解析任务创建执行计划：
 
 域名: {domain or '未指定'}
 布局类型: {layout_type or '未指定'}
-URL数量: {len(urls)}
+URL数量: {url_count}
 示例URL:
 {urls_text}
 
@@ -110,6 +119,7 @@ URL数量: {len(urls)}
             'llm_analysis': response,
             'max_iterations': settings.max_iterations,
             'success_threshold': settings.success_threshold,
+            'candidate_count': settings.tournament_candidates,
         }
         
         return plan
@@ -0,0 +1,204 @@
+"""
+多候选解析器锦标赛
+并行生成多个候选解析器，在缓存的样本HTML上并行验证，按字段级得分择优
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+from loguru import logger
+from config.settings import settings
+from tools import generate_parser_code
+from utils.code_stream import stream_cancellation
+from utils.parser_registry import ParserRegistry
+
+
+# 不同候选使用的生成策略，增加候选之间的多样性
+_PROMPT_HINTS = [
+    None,
+    "优先使用CSS选择器（soup.select / select_one），并为每个字段准备2-3个备选选择器。",
+    "优先使用 lxml 的 XPath 定位字段，并基于文本特征（如标签、相邻标题）做兜底提取。",
+    "优先利用页面中的结构化数据（JSON-LD、meta标签、Open Graph）提取字段，再用DOM选择器补充。",
+]
+
+
+class ParserTournament:
+    """
+    候选解析器锦标赛
+
+    每个候选使用不同的温度、模型或提示策略并行生成，
+    生成完成后立即在缓存的样本HTML上验证，得分满分的候选会提前结束比赛
+
+    提前结束时，尚未开始的候选被取消；正在流式生成的候选通过共享的取消信号在下一个分片到达时中止，
+    不再消耗token。已经开始的非流式生成（CODE_GEN_STREAM=false）和已进入验证阶段的候选仍会运行完成，
+    但结果不再参与比较
+    """
+
+    def __init__(self, validator):
+        """
+        Args:
+            validator: AgentValidator 实例，用于在缓存HTML上打分
+        """
+        self.validator = validator
+
+    def build_variants(self, candidate_count: int) -> List[Dict]:
+        """为每个候选分配温度、模型和提示策略"""
+        temperatures = settings.tournament_temperatures or [settings.code_gen_temperature]
+        models = settings.tournament_models or [settings.code_gen_model]
+
+        return [
+            {
+                'index': i,
+                'temperature': temperatures[i % len(temperatures)],
+                'model_name': models[i % len(models)],
+                'prompt_hint': _PROMPT_HINTS[i % len(_PROMPT_HINTS)],
+            }
+            for i in range(candidate_count)
+        ]
+
+    def run(
+        self,
+        html_content: str,
+        target_json: Dict,
+        sample_pages: Dict[str, str],
+        output_dir: str,
+        candidate_count: int,
+        domain: str = None,
+        template: str = None,
+        sample_variations: str = None,
+        expected_values: Dict[str, Dict] = None
+    ) -> Dict:
+        """
+        运行锦标赛
+
+        Args:
+            html_content: 参考HTML
+            target_json: 目标JSON结构
+            sample_pages: 用于验证的样本页面 URL -> HTML
+            output_dir: 解析器注册表目录
+            candidate_count: 候选数量
+            domain: 域名（可选）
+            template: 模板/布局类型（可选）
+            sample_variations: 样本差异说明（可选）
+            expected_values: URL -> {字段名: 视觉提取的参考值}（可选），用于字段评分
+
+        Returns:
+            最优候选的生成结果（与 generate_parser_code 返回格式一致），附带 tournament 统计
+        """
+        variants = self.build_variants(candidate_count)
+        logger.info(f"锦标赛开始: 并行生成 {len(variants)} 个候选解析器")
+
+        results = []
+        # 提前结束时通知仍在流式生成的候选中止
+        cancel_event = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=len(variants))
+        try:
+            futures = [
+                pool.submit(
+                    self._run_candidate, variant, html_content, target_json, sample_pages,
+                    output_dir, domain, template, sample_variations, expected_values, cancel_event
+                )
+                for variant in variants
+            ]
+            for future in as_completed(futures):
+                candidate = future.result()
+                results.append(candidate)
+                if candidate['success']:
+                    logger.info(
+                        f"  候选 {candidate['index']} 完成: 得分 {candidate['score']:.2f}, "
+                        f"成功率 {candidate['success_rate']:.1%}"
+                    )
+                else:
+                    logger.warning(f"  候选 {candidate['index']} 失败: {candidate['error']}")
+
+                if candidate['success'] and candidate['score'] >= 1.0:
+                    logger.success(f"  候选 {candidate['index']} 获得满分，提前结束锦标赛")
+                    break
+        finally:
+            # 已有满分候选时不再等待其余候选：取消未开始的候选，并让正在生成的候选在下一个分片中止
+            cancel_event.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        finished = [r for r in results if r['success']]
+        if not finished:
+            raise Exception("所有候选解析器均生成失败")
+
+        best = max(finished, key=lambda r: (r['score'], r['success_rate']))
+        logger.success(f"锦标赛结束: 选中候选 {best['index']} (得分 {best['score']:.2f})")
+
+        return self._finalize(best, results, output_dir)
+
+    def _run_candidate(
+        self,
+        variant: Dict,
+        html_content: str,
+        target_json: Dict,
+        sample_pages: Dict[str, str],
+        output_dir: str,
+        domain: str,
+        template: str,
+        sample_variations: str = None,
+        expected_values: Dict[str, Dict] = None,
+        cancel_event: threading.Event = None
+    ) -> Dict:
+        """生成并验证单个候选（cancel_event 设置后中止流式生成并跳过验证）"""
+        candidate = dict(variant, success=False, score=0.0, success_rate=0.0, error=None, parser_result=None)
+
+        try:
+            with stream_cancellation(cancel_event):
+                parser_result = generate_parser_code.invoke({
+                    "html_content": html_content,
+                    "target_json": target_json,
+                    "output_dir": output_dir,
+                    "temperature": variant['temperature'],
+                    "model_name": variant['model_name'],
+                    "prompt_hint": variant['prompt_hint'],
+                    "domain": domain,
+                    "template": template,
+                    "sample_variations": sample_variations,
+                })
+            if cancel_event is not None and cancel_event.is_set():
+                candidate['error'] = "锦标赛已提前结束，跳过验证"
+                return candidate
+            scored = self.validator.score_parser_on_pages(
+                parser_result['parser_path'], sample_pages, target_json, expected_values
+            )
+            candidate.update(
+                success=True,
+                score=scored['score'],
+                success_rate=scored['success_rate'],
+                error=scored['error'],
+                parser_result=parser_result,
+            )
+        except Exception as e:
+            candidate['error'] = str(e)
+
+        return candidate
+
+    def _finalize(self, best: Dict, results: List[Dict], output_dir: str) -> Dict:
+        """记录各候选得分到注册表，并返回最优候选"""
+        registry = ParserRegistry(output_dir)
+        for r in results:
+            if r['success']:
+                registry.update_metrics(
+                    r['parser_result']['version_hash'],
+                    validation_score=r['score'],
+                    success_rate=r['success_rate']
+                )
+
+        parser_result = dict(best['parser_result'])
+        parser_result['tournament'] = {
+            'winner': best['index'],
+            'candidates': [
+                {
+                    'index': r['index'],
+                    'temperature': r['temperature'],
+                    'model_name': r['model_name'],
+                    'success': r['success'],
+                    'score': r['score'],
+                    'success_rate': r['success_rate'],
+                    'error': r['error'],
+                }
+                for r in sorted(results, key=lambda r: r['index'])
+            ],
+        }
+        return parser_result
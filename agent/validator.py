@@ -2,15 +2,32 @@
 Agent 验证器
 负责验证生成的解析代码是否正确
 """
-import sys
 import os
-import importlib.util
-from typing import Dict, List
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Set
 from pathlib import Path
 from loguru import logger
 from tools import get_webpage_source
 from langchain_openai import ChatOpenAI
 from config.settings import settings
+from utils.batch_parse import parse_documents, benchmark_batch_parse
+from utils.bs4_transpile import compare_outcomes
+from utils.hashing import content_hash
+from utils.field_check import FIELD_MISMATCH, FIELD_OK, STATUS_LABELS, check_fields, failing_fields
+from utils.field_scoring import score_records
+from utils.parse_profile import format_profile, profile_document
+from utils.parser_loader import get_parser_loader
+from utils.sequential_test import DECISION_PASS, SequentialTest
+from utils.validation_cache import ValidationCache, page_key
+from utils.validation_report import ValidationReport
+from utils.sandbox import SandboxPool
+from utils.parser_lint import lint_parser_code, has_blocking_findings, format_findings
+from utils.token_budget import PromptSection, TokenBudget, count_message_tokens, token_ledger
+
+# 最近一次验证的失败样本页面在HTML缓存中的固定分组，保留到下一次验证，供修复时构建HTML上下文
+_PIN_FAILURES = "validation_failures"
 
 
 class AgentValidator:
@@ -24,50 +41,118 @@ class AgentValidator:
             base_url=os.getenv("OPENAI_API_BASE"),
             temperature=settings.agent_temperature
         )
-    
-    def validate_parser(self, parser_path: str, test_urls: List[str]) -> Dict:
+        # URL -> HTML 缓存，避免重复验证时反复打开浏览器；超过 HTML_CACHE_PAGES 个页面时淘汰最久未使用的，
+        # 固定的页面（最近一次验证的失败样本、正在处理的漂移告警样本）不淘汰
+        self.html_cache: "OrderedDict[str, str]" = OrderedDict()
+        # 固定分组 -> URL 集合
+        self._pinned: Dict[str, Set[str]] = {}
+        self._load_lock = threading.Lock()
+        self._sandbox = None
+        self._validation_cache = None
+
+    def fetch_html(self, url: str) -> str:
+        """获取页面HTML，优先使用缓存"""
+        if url in self.html_cache:
+            self.html_cache.move_to_end(url)
+            return self.html_cache[url]
+        # 使用 .invoke() 调用工具
+        html = get_webpage_source.invoke({"url": url})
+        self._cache_put(url, html)
+        return html
+
+    def cache_pages(self, pages: Dict[str, str], pin: str = None):
+        """
+        把已有的页面HTML放入缓存（验证和修复时不再获取）
+
+        Args:
+            pages: URL（或文档ID） -> HTML
+            pin: 固定分组名（可选），该分组的页面在 unpin_pages 之前不会被淘汰
+        """
+        if pin:
+            self._pinned.setdefault(pin, set()).update(pages)
+        for url, html in pages.items():
+            self._cache_put(url, html)
+
+    def pin_pages(self, group: str, urls: Iterable[str]):
+        """把分组固定的页面替换为 urls（只固定已在缓存中的页面）"""
+        self._pinned[group] = {url for url in urls if url in self.html_cache}
+
+    def unpin_pages(self, group: str):
+        """取消一个分组的固定，超出容量的页面随后按最近使用淘汰"""
+        self._pinned.pop(group, None)
+        self._evict()
+
+    def _cache_put(self, url: str, html: str):
+        """写入HTML缓存（所有写入都经过这里），随后淘汰超出容量的页面"""
+        self.html_cache[url] = html
+        self.html_cache.move_to_end(url)
+        self._evict()
+
+    def _evict(self):
+        excess = len(self.html_cache) - max(1, settings.html_cache_pages)
+        if excess <= 0:
+            return
+        pinned = set().union(*self._pinned.values())
+        for url in [url for url in self.html_cache if url not in pinned][:excess]:
+            del self.html_cache[url]
+
+    def validate_parser(
+        self,
+        parser_path: str,
+        test_urls: List[str],
+        target_fields: Dict = None,
+        expected_values: Dict[str, Dict] = None
+    ) -> Dict:
         """
         验证解析器
         
         Args:
             parser_path: 解析器代码路径
             test_urls: 测试URL列表
+            target_fields: 目标字段定义（可选），提供时逐字段检查，必需字段失败则该页面失败
+            expected_values: URL -> {字段名: 视觉提取的参考值}（可选）
         
         Returns:
             验证结果
         """
         logger.info(f"验证解析器: {parser_path}")
         
-        results = {
-            'parser_path': parser_path,
-            'tests': [],  # 使用'tests'而不是'test_results'以保持一致性
-            'test_results': [],  # 保留向后兼容
-            'success_rate': 0.0,
-            'passed': False,
-            'issues': [],
-        }
+        results = self._new_results(parser_path)
+
+        # 静态性能检查，存在严重问题时不执行解析器
+        results['lint_findings'] = self.lint_parser(parser_path)
+        if has_blocking_findings(results['lint_findings']):
+            logger.error("静态检查未通过，拒绝执行解析器")
+            results['issues'].append("静态检查未通过")
+            return results
 
-        # 加载解析器
+        # 按批获取HTML并通过 parse_many 解析（沙箱模式下在工作进程池中并行运行），每批完成后写入报告；
+        # 逐个URL的完整结果写入报告文件，内存中只保留聚合统计和失败样本
+        report = self._new_report(parser_path, target_fields)
+        self.pin_pages(_PIN_FAILURES, [])
         try:
-            parser_class = self._load_parser(parser_path)
+            for batch_results in self._test_urls(
+                parser_path, test_urls, target_fields, expected_values,
+                fail_fast=settings.validation_fail_fast
+            ):
+                for test_result in batch_results:
+                    report.add(test_result)
+                # 失败样本页面固定在缓存中，后续批次不会把它们淘汰
+                self.pin_pages(_PIN_FAILURES, [failure['url'] for failure in report.failures])
         except Exception as e:
             logger.error(f"加载解析器失败: {str(e)}")
             results['issues'].append(f"加载失败: {str(e)}")
             return results
-
-        # 测试每个URL
-        success_count = 0
-        for url in test_urls:
-            test_result = self._test_url(parser_class, url)
-            results['tests'].append(test_result)
-            results['test_results'].append(test_result)  # 向后兼容
-            if test_result['success']:
-                success_count += 1
+        finally:
+            report.close()
+        report.apply(results)
 
         # 计算成功率
-        results['success_rate'] = success_count / len(test_urls) if test_urls else 0
+        results['success_rate'] = results['counts']['passed'] / len(test_urls) if test_urls else 0
         results['passed'] = results['success_rate'] >= settings.success_threshold
         
+        if results['score'] is not None:
+            logger.info(f"字段得分: {results['score']:.2f}")
         if results['passed']:
             logger.success(f"验证通过! 成功率: {results['success_rate']:.1%}")
         else:
@@ -75,57 +160,675 @@ class AgentValidator:
         
         return results
     
-    def _load_parser(self, parser_path: str):
-        """动态加载解析器类"""
-        spec = importlib.util.spec_from_file_location("parser_module", parser_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules["parser_module"] = module
-        spec.loader.exec_module(module)
-        
-        # 获取WebPageParser类
-        if hasattr(module, 'WebPageParser'):
-            return module.WebPageParser()
+    def validate_parser_sequential(
+        self,
+        parser_path: str,
+        url_pool: List[str],
+        target_fields: Dict = None,
+        expected_values: Dict[str, Dict] = None,
+        seed: int = None
+    ) -> Dict:
+        """
+        在大量URL上以序贯检验验证解析器
+
+        从URL池中随机抽取页面，按批获取并解析，每批之后更新序贯检验（Wilson 区间或 SPRT），
+        成功率相对 settings.success_threshold 的高低有统计结论时立即停止
+
+        Args:
+            parser_path: 解析器代码路径
+            url_pool: 候选URL池
+            target_fields: 目标字段定义（可选）
+            expected_values: URL -> {字段名: 视觉提取的参考值}（可选）
+            seed: 随机抽样种子（可选，便于复现）
+
+        Returns:
+            与 validate_parser 相同的结果，另含 sequential：
+            {method, decision, successes, trials, success_rate, confidence, interval, threshold,
+             urls_used, pool_size, stopped_early}
+        """
+        urls = list(dict.fromkeys(url_pool))
+        random.Random(seed).shuffle(urls)
+        max_urls = min(settings.sequential_max_urls or len(urls), len(urls))
+        batch_size = max(1, settings.sequential_batch_size)
+        logger.info(f"序贯验证解析器: {parser_path}（URL池 {len(urls)} 个，最多验证 {max_urls} 个）")
+
+        test = SequentialTest(
+            settings.success_threshold,
+            method=settings.sequential_method,
+            confidence=settings.sequential_confidence,
+            indifference=settings.sequential_indifference,
+            min_trials=settings.sequential_min_urls
+        )
+        results = self._new_results(parser_path)
+        results['sequential'] = None
+        results['lint_findings'] = self.lint_parser(parser_path)
+        if has_blocking_findings(results['lint_findings']):
+            logger.error("静态检查未通过，拒绝执行解析器")
+            results['issues'].append("静态检查未通过")
+            return results
+
+        report = self._new_report(parser_path, target_fields)
+        self.pin_pages(_PIN_FAILURES, [])
+        urls_used = []
+        position = 0
+        try:
+            while position < len(urls) and test.trials < max_urls and test.decision is None:
+                batch = urls[position:position + min(batch_size, max_urls - test.trials)]
+                position += len(batch)
+                try:
+                    batch_results = [
+                        result for results_chunk in self._test_urls(parser_path, batch, target_fields, expected_values)
+                        for result in results_chunk
+                    ]
+                except Exception as e:
+                    logger.error(f"加载解析器失败: {str(e)}")
+                    results['issues'].append(f"加载失败: {str(e)}")
+                    return results
+
+                for test_result in batch_results:
+                    report.add(test_result)
+                    urls_used.append(test_result['url'])
+                    # 页面获取失败与解析器无关，不计入检验
+                    if not test_result.get('fetch_failed') and not test_result.get('skipped'):
+                        test.update(test_result['success'])
+                self.pin_pages(_PIN_FAILURES, [failure['url'] for failure in report.failures])
+
+                low, high = test.interval
+                logger.info(
+                    f"  已验证 {test.trials} 个页面，成功率 {test.rate:.1%}，"
+                    f"{test.confidence:.0%} 置信区间 [{low:.1%}, {high:.1%}]"
+                )
+        finally:
+            report.close()
+        report.apply(results)
+
+        summary = test.summary()
+        summary.update(
+            urls_used=urls_used,
+            pool_size=len(urls),
+            stopped_early=summary['decision'] is not None and len(urls_used) < len(urls)
+        )
+        results['sequential'] = summary
+        results['success_rate'] = test.rate
+
+        low, high = summary['interval']
+        if summary['decision'] is None:
+            # URL池耗尽仍无结论时按点估计判定
+            results['passed'] = test.trials > 0 and test.rate >= settings.success_threshold
+            logger.warning(
+                f"序贯验证在 {test.trials} 个页面后仍无统计结论，按点估计判定: "
+                f"{'通过' if results['passed'] else '未通过'}"
+            )
         else:
-            raise Exception("解析器中未找到WebPageParser类")
-    
-    def _test_url(self, parser, url: str) -> Dict:
-        """测试单个URL"""
+            results['passed'] = summary['decision'] == DECISION_PASS
+
+        message = (
+            f"成功率 {test.rate:.1%}（{test.confidence:.0%} 置信区间 [{low:.1%}, {high:.1%}]，"
+            f"阈值 {settings.success_threshold:.1%}），使用 {test.trials}/{len(urls)} 个URL"
+        )
+        if results['passed']:
+            logger.success(f"序贯验证通过! {message}")
+        else:
+            logger.warning(f"序贯验证未通过. {message}")
+        return results
+
+    def score_parser_on_pages(
+        self,
+        parser_path: str,
+        pages: Dict[str, str],
+        target_json: Dict,
+        expected_values: Dict[str, Dict] = None
+    ) -> Dict:
+        """
+        在已缓存的HTML上验证解析器，并计算字段级得分（不访问网络）
+
+        Args:
+            parser_path: 解析器代码路径
+            pages: URL -> HTML
+            target_json: 目标JSON结构
+            expected_values: URL -> {字段名: 视觉提取的参考值}（可选）
+
+        Returns:
+            包含 score（加权的字段级平均得分）、field_scores 和 success_rate 的结果
+        """
         result = {
+            'parser_path': parser_path,
+            'score': 0.0,
+            'success_rate': 0.0,
+            'page_scores': {},
+            'field_scores': {},
+            'error': None,
+            'lint_findings': self.lint_parser(parser_path),
+        }
+
+        if has_blocking_findings(result['lint_findings']):
+            result['error'] = "静态检查未通过"
+            return result
+
+        try:
+            outcomes = self._parse_pages(parser_path, list(pages.values()))
+        except Exception as e:
+            result['error'] = f"加载失败: {str(e)}"
+            return result
+
+        expected_values = expected_values or {}
+        report = score_records(
+            [outcome['data'] for outcome in outcomes],
+            target_json,
+            [expected_values.get(url) for url in pages],
+            number_tolerance=settings.field_number_tolerance,
+            list_length_tolerance=settings.field_list_length_tolerance
+        )
+        result['page_scores'] = dict(zip(pages, report['page_scores']))
+        result['field_scores'] = report['field_scores']
+
+        success_count = 0
+        for outcome in outcomes:
+            if outcome['error']:
+                result['error'] = outcome['error']
+            if outcome['data'] and isinstance(outcome['data'], dict):
+                success_count += 1
+
+        if pages:
+            result['score'] = report['score']
+            result['success_rate'] = success_count / len(pages)
+        return result
+
+    def lint_parser(self, parser_path: str) -> List[Dict]:
+        """对解析器代码做静态性能检查"""
+        if not settings.parser_lint:
+            return []
+
+        code = Path(parser_path).read_text(encoding='utf-8')
+        findings = lint_parser_code(code)
+        if findings:
+            logger.warning(f"静态检查发现 {len(findings)} 个问题:\n{format_findings(findings)}")
+        return findings
+
+    @staticmethod
+    def score_fields(data, target_json: Dict, expected: Dict = None) -> float:
+        """
+        单个页面的字段级得分（见 utils.field_scoring.score_records）
+
+        必需字段权重为1，可选字段权重为0.5；有参考值时按与参考值的相似度计分
+        """
+        if not isinstance(data, dict) or not target_json:
+            return 0.0
+        return score_records(
+            [data], target_json, [expected],
+            number_tolerance=settings.field_number_tolerance,
+            list_length_tolerance=settings.field_list_length_tolerance
+        )['score']
+
+    @staticmethod
+    def _score_tests(tests: List[Dict], target_fields: Dict, expected_values: Dict[str, Dict] = None) -> Dict:
+        """
+        按视觉参考值为各页面逐字段评分
+
+        得分写入 test['score'] 和 field_results[字段]['score']；与参考值差距较大的字段标记为不一致，
+        有参考值且页面得分低于 settings.field_score_threshold 的页面记为失败
+        """
+        expected_values = expected_values or {}
+        report = score_records(
+            [test['data'] for test in tests],
+            target_fields,
+            [expected_values.get(test['url']) for test in tests],
+            number_tolerance=settings.field_number_tolerance,
+            list_length_tolerance=settings.field_list_length_tolerance
+        )
+
+        threshold = settings.field_score_threshold
+        for test, page_score, cells in zip(tests, report['page_scores'], report['cell_scores']):
+            test['score'] = page_score
+            for name, cell_score in cells.items():
+                field_result = test['field_results'].get(name)
+                if field_result is None:
+                    continue
+                field_result['score'] = cell_score
+                if field_result['status'] == FIELD_OK and field_result['expected'] is not None \
+                        and threshold and cell_score < threshold:
+                    field_result['status'] = FIELD_MISMATCH
+                    field_result['message'] = (
+                        f"与参考值 {str(field_result['expected'])[:80]!r} 的相似度仅 {cell_score:.2f}"
+                    )
+
+            if test['success'] and threshold and expected_values.get(test['url']) and page_score < threshold:
+                low = sorted((name for name in cells if cells[name] < 1.0), key=cells.get)[:5]
+                test['success'] = False
+                test['error'] = f"字段得分 {page_score:.2f} 低于阈值 {threshold:.2f}"
+                test['details'] = "得分最低的字段: " + ", ".join(f"{name}={cells[name]:.2f}" for name in low)
+                logger.warning(f"  ✗ {test['url']} {test['error']}")
+
+        return report
+
+    def _parse_pages(
+        self,
+        parser_path: str,
+        documents: List[str],
+        profile_fields: List[str] = None
+    ) -> List[Dict]:
+        """
+        批量解析文档
+
+        沙箱模式下在工作进程池中运行，受CPU时间、内存和墙钟时间限制；否则在当前进程中运行。
+        profile_fields 不为 None 时，解析成功的文档再剖析一次（峰值内存和最慢的提取函数）
+
+        Raises:
+            Exception: 解析器加载失败
+        """
+        if settings.validation_sandbox:
+            return self.sandbox.parse_documents(parser_path, documents, profile_fields)
+        parser = self._load_parser(parser_path)
+        outcomes = list(parse_documents(parser, documents))
+        if profile_fields is not None:
+            for outcome, html in zip(outcomes, documents):
+                if not outcome['error']:
+                    outcome['profile'] = profile_document(parser, html, profile_fields)
+        return outcomes
+
+    @property
+    def sandbox(self) -> SandboxPool:
+        """懒加载的沙箱进程池"""
+        with self._load_lock:
+            if self._sandbox is None:
+                self._sandbox = SandboxPool(
+                    workers=settings.sandbox_workers or None,
+                    cpu_seconds=settings.sandbox_cpu_seconds,
+                    memory_mb=settings.sandbox_memory_mb,
+                    timeout_seconds=settings.sandbox_timeout_seconds
+                )
+            return self._sandbox
+
+    def close(self):
+        """关闭沙箱进程池"""
+        if self._sandbox is not None:
+            self._sandbox.close()
+            self._sandbox = None
+
+    def _load_parser(self, parser_path: str):
+        """动态加载解析器类（每个版本使用独立的模块命名空间，字节码缓存在磁盘上）"""
+        return get_parser_loader().load_parser(parser_path)
+
+    def _test_urls(
+        self,
+        parser_path: str,
+        urls: List[str],
+        target_fields: Dict = None,
+        expected_values: Dict[str, Dict] = None,
+        fail_fast: bool = False
+    ) -> Iterator[List[Dict]]:
+        """
+        按 VALIDATION_BATCH_SIZE 分批获取各URL的HTML并批量解析，每批完成后产出该批结果，
+        该批的HTML随即释放，内存占用与URL总数无关
+
+        启用验证缓存时，同一解析器版本在同一页面上的已知结果直接复用；分批之前先按各URL最近一次的成败
+        对整个列表排序，之前失败过的（以及从未验证过的）URL先运行，之前通过的URL随后作为回归检查运行，
+        批内再按页面内容的历史结果细分。结果按运行顺序产出。
+        fail_fast 时，如果之前失败的页面没有一个通过、且剩余页面全部通过也达不到阈值，则跳过回归检查
+        （整批都是回归检查时不再获取HTML）
+        """
+        batch_size = max(1, settings.validation_batch_size)
+        url_history = {}
+        if settings.validation_cache:
+            url_history = self.validation_cache.last_url_outcomes(urls)
+            urls = [url for url in urls if not url_history.get(url, False)] + \
+                   [url for url in urls if url_history.get(url, False)]
+        # 之前各批的页面数、通过数，以及已运行的之前失败页面数和其中的通过数，用于 fail_fast 判断
+        tally = {'done': 0, 'passed': 0, 'total': len(urls), 'failing_run': 0, 'failing_passed': 0}
+        for start in range(0, len(urls), batch_size):
+            batch = urls[start:start + batch_size]
+            if fail_fast and all(url_history.get(url, False) for url in batch) and self._cannot_improve(tally):
+                skipped = urls[start:]
+                logger.warning(f"  之前失败的页面仍然失败，跳过 {len(skipped)} 个页面的回归检查")
+                yield [self._skipped_result(url) for url in skipped]
+                return
+            yield self._test_batch(parser_path, batch, target_fields, expected_values, fail_fast, tally)
+
+    def _test_batch(
+        self,
+        parser_path: str,
+        urls: List[str],
+        target_fields: Dict,
+        expected_values: Dict[str, Dict],
+        fail_fast: bool,
+        tally: Dict
+    ) -> List[Dict]:
+        """获取并解析一批URL（见 _test_urls），完成后更新 tally"""
+        results = {}
+        pages = {}
+        for url in urls:
+            try:
+                logger.info(f"  获取URL: {url}")
+                # 获取HTML（优先使用缓存）
+                pages[url] = self.fetch_html(url)
+            except Exception as e:
+                import traceback
+                results[url] = self._new_test_result(url)
+                results[url]['fetch_failed'] = True
+                results[url]['error'] = str(e)
+                results[url]['details'] = traceback.format_exc()
+                logger.error(f"  ✗ 获取HTML失败: {str(e)}")
+
+        if not settings.validation_cache:
+            results.update(self._run_pages(parser_path, pages, target_fields, expected_values))
+            return self._finish_batch(urls, pages, results, [], tally)
+
+        cache = self.validation_cache
+        parser_hash = content_hash(Path(parser_path).read_text(encoding='utf-8'))
+        keys = {
+            url: self._page_key(html, target_fields, (expected_values or {}).get(url))
+            for url, html in pages.items()
+        }
+        known = cache.lookup(parser_hash, list(keys.values()))
+        for url, key in keys.items():
+            if key in known:
+                results[url] = dict(known[key], url=url, cached=True)
+        if known:
+            logger.info(f"  复用 {len(known)} 个页面的已知验证结果")
+
+        pending = [url for url in pages if url not in results]
+        history = cache.last_outcomes([keys[url] for url in pending])
+        previously_failing = [url for url in pending if not history.get(keys[url], False)]
+        previously_passing = [url for url in pending if history.get(keys[url], False)]
+        known_failing = [url for url in previously_failing if keys[url] in history]
+
+        for phase, phase_urls in enumerate((previously_failing, previously_passing)):
+            if not phase_urls:
+                continue
+            if phase == 1 and fail_fast and self._cannot_improve(
+                tally,
+                failing_run=len(known_failing),
+                failing_passed=sum(1 for url in known_failing if results[url]['success']),
+                passed=sum(1 for r in results.values() if r['success']),
+                done=len(results)
+            ):
+                logger.warning(f"  之前失败的页面仍然失败，跳过 {len(phase_urls)} 个页面的回归检查")
+                for url in phase_urls:
+                    results[url] = self._skipped_result(url)
+                break
+
+            phase_results = self._run_pages(
+                parser_path, {url: pages[url] for url in phase_urls}, target_fields, expected_values
+            )
+            # 耗时超出预算或超时的失败受机器负载影响，不缓存，下次重新运行
+            cache.store(parser_hash, {
+                keys[url]: result for url, result in phase_results.items()
+                if not result.get('latency_error') and not result.get('timed_out')
+            })
+            results.update(phase_results)
+
+        cache.store_url_outcomes({
+            url: result['success'] for url, result in results.items()
+            if not result.get('fetch_failed') and not result.get('skipped')
+            and not result.get('latency_error') and not result.get('timed_out')
+        })
+        return self._finish_batch(urls, pages, results, known_failing, tally)
+
+    def _finish_batch(
+        self,
+        urls: List[str],
+        pages: Dict[str, str],
+        results: Dict,
+        known_failing: List[str],
+        tally: Dict
+    ) -> List[Dict]:
+        """按 urls 顺序整理一批结果，并把该批计入 tally"""
+        # 失败（或存在异常字段）的页面重新放入缓存，获取本批其他页面时可能已被淘汰，随后由 validate_parser 固定
+        self.cache_pages({
+            url: html for url, html in pages.items()
+            if not results[url]['success']
+            or any(r['status'] != FIELD_OK for r in (results[url].get('field_results') or {}).values())
+        })
+        tally['done'] += len(urls)
+        tally['passed'] += sum(1 for url in urls if results[url]['success'])
+        tally['failing_run'] += len(known_failing)
+        tally['failing_passed'] += sum(1 for url in known_failing if results[url]['success'])
+        return [results[url] for url in urls]
+
+    def _skipped_result(self, url: str) -> Dict:
+        """因 fail_fast 跳过的回归检查页面"""
+        result = self._new_test_result(url)
+        result['skipped'] = True
+        result['error'] = "未运行：之前失败的页面仍然失败，跳过回归检查"
+        return result
+
+    @staticmethod
+    def _cannot_improve(tally: Dict, failing_run: int = 0, failing_passed: int = 0, passed: int = 0, done: int = 0) -> bool:
+        """
+        之前失败的页面（含之前各批）没有一个通过，且剩余页面全部通过也达不到成功率阈值
+
+        failing_run / failing_passed / passed / done 为当前批中已有的结果，尚未计入 tally
+        """
+        if tally['failing_run'] + failing_run == 0 or tally['failing_passed'] + failing_passed:
+            return False
+        remaining = tally['total'] - tally['done'] - done
+        best = (tally['passed'] + passed + remaining) / tally['total']
+        return best < settings.success_threshold
+
+    @staticmethod
+    def _page_key(html: str, target_fields: Dict = None, expected: Dict = None) -> str:
+        """页面内容与检查条件组成的缓存键（评分阈值和容差变化后不复用旧结果）"""
+        return page_key(content_hash(html), {
+            'fields': target_fields or {},
+            'expected': expected or {},
+            'score_threshold': settings.field_score_threshold,
+            'number_tolerance': settings.field_number_tolerance,
+            'latency_budget_ms': settings.parse_latency_budget_ms,
+            'list_length_tolerance': settings.field_list_length_tolerance,
+        })
+
+    def _run_pages(
+        self,
+        parser_path: str,
+        pages: Dict[str, str],
+        target_fields: Dict = None,
+        expected_values: Dict[str, Dict] = None
+    ) -> Dict[str, Dict]:
+        """批量解析页面、逐字段检查，并与视觉参考值评分（得分过低的页面记为失败）"""
+        profile_fields = list(target_fields or {}) if settings.parse_profile else None
+        outcomes = self._parse_pages(parser_path, list(pages.values()), profile_fields)
+        results = {
+            url: self._check_outcome(url, outcome, target_fields, (expected_values or {}).get(url))
+            for url, outcome in zip(pages, outcomes)
+        }
+        if target_fields and results:
+            self._score_tests(list(results.values()), target_fields, expected_values)
+        for result in results.values():
+            self._check_latency_budget(result)
+        return results
+
+    @staticmethod
+    def _check_latency_budget(result: Dict):
+        """
+        单页解析耗时超出预算时该页面失败，剖析结果附在 details 中交给修复器
+
+        按CPU时间判断（沙箱外运行、没有CPU时间时退回墙钟时间），不受机器上其他进程的影响
+        """
+        budget = settings.parse_latency_budget_ms
+        elapsed = result['cpu_time_ms'] if result['cpu_time_ms'] is not None else result['parse_time_ms']
+        if not budget or elapsed is None or elapsed <= budget:
+            return
+
+        message = f"解析CPU耗时 {elapsed:.0f}ms 超出预算 {budget:.0f}ms"
+        profile_text = format_profile(result['profile'], result['parse_time_ms'], result['cpu_time_ms'])
+        result['latency_error'] = message
+        if result['success']:
+            result['success'] = False
+            result['error'] = message
+            result['details'] = profile_text
+        else:
+            result['details'] = f"{result['details']}\n{message}\n{profile_text}".strip()
+        logger.warning(f"  ✗ {result['url']} {message}")
+
+    @property
+    def validation_cache(self) -> ValidationCache:
+        """懒加载的验证结果缓存"""
+        with self._load_lock:
+            if self._validation_cache is None:
+                self._validation_cache = ValidationCache(settings.validation_cache_path)
+            return self._validation_cache
+
+    @staticmethod
+    def _new_test_result(url: str) -> Dict:
+        return {
             'url': url,
             'success': False,
             'data': None,
             'error': None,
             'details': '',  # 添加详细信息字段
+            'parse_time_ms': None,
+            'cpu_time_ms': None,
+            'profile': None,
+            'field_results': {},
         }
 
-        try:
-            logger.info(f"  测试URL: {url}")
+    def _check_outcome(
+        self,
+        url: str,
+        outcome: Dict,
+        target_fields: Dict = None,
+        expected: Dict = None
+    ) -> Dict:
+        """检查单个URL的解析结果"""
+        result = self._new_test_result(url)
+        result['parse_time_ms'] = outcome['parse_time_ms']
+        result['cpu_time_ms'] = outcome.get('cpu_time_ms')
+        result['profile'] = outcome.get('profile')
+        data = outcome['data']
 
-            # 获取HTML - 使用 .invoke() 调用工具
-            html = get_webpage_source.invoke({"url": url})
+        if outcome['error']:
+            result['error'] = outcome['error']
+            result['details'] = outcome['details']
+            if outcome.get('timed_out'):
+                result['timed_out'] = True
+            logger.error(f"  ✗ {url} 解析失败: {outcome['error']}")
+        elif not (data and isinstance(data, dict) and len(data) > 0):
+            result['error'] = "解析结果为空或格式错误"
+            result['details'] = f"返回类型: {type(data)}, 内容: {str(data)[:100]}"
+            logger.warning(f"  ✗ {url} {result['error']}")
+        elif target_fields:
+            result['data'] = data
+            result['field_results'] = check_fields(data, target_fields, expected)
+            failed = failing_fields(result['field_results'], target_fields)
+            mismatched = [
+                name for name, r in result['field_results'].items() if r['status'] == FIELD_MISMATCH
+            ]
+            if failed:
+                result['error'] = f"{len(failed)} 个必需字段未通过: {', '.join(failed)}"
+                result['details'] = "\n".join(
+                    f"{name}: {STATUS_LABELS[result['field_results'][name]['status']]} - "
+                    f"{result['field_results'][name]['message']}"
+                    for name in failed
+                )
+                logger.warning(f"  ✗ {url} {result['error']}")
+            else:
+                result['success'] = True
+                result['details'] = f"{len(target_fields)} 个字段检查通过"
+                if mismatched:
+                    result['details'] += f"，{len(mismatched)} 个字段与参考值不一致: {', '.join(mismatched)}"
+                logger.success(f"  ✓ {url} {result['details']}")
+        else:
+            result['data'] = data
+            filled = [name for name, value in data.items() if value not in (None, '', [], {})]
+            if not filled:
+                # 只有字段名、没有值的结果（如 {"title": None}）不算成功
+                result['error'] = "解析结果中所有字段均为空"
+                result['details'] = f"内容: {str(data)[:100]}"
+                logger.warning(f"  ✗ {url} {result['error']}")
+                return result
+            result['success'] = True
+            result['details'] = f"成功提取 {len(filled)}/{len(data)} 个非空字段: {', '.join(filled)}"
+            logger.success(f"  ✓ {url} 解析成功，提取 {len(filled)} 个非空字段")
 
-            # 解析
-            data = parser.parse(html)
+        return result
 
-            # 检查结果
-            if data and isinstance(data, dict) and len(data) > 0:
-                result['success'] = True
-                result['data'] = data
-                result['details'] = f"成功提取 {len(data)} 个字段: {', '.join(data.keys())}"
-                logger.success(f"  ✓ 解析成功，提取 {len(data)} 个字段")
-            else:
-                result['error'] = "解析结果为空或格式错误"
-                result['details'] = f"返回类型: {type(data)}, 内容: {str(data)[:100]}"
-                logger.warning(f"  ✗ {result['error']}")
+    @staticmethod
+    def _new_results(parser_path: str) -> Dict:
+        """验证结果的初始结构（逐个URL的结果见 report_path 指向的 JSONL 文件）"""
+        return {
+            'parser_path': parser_path,
+            'success_rate': 0.0,
+            'passed': False,
+            'issues': [],
+            'counts': {},
+            'error_counts': {},
+            'failures': [],  # 有限数量的精简失败样本
+            'report_path': None,
+            'avg_parse_time_ms': None,
+            'max_parse_time_ms': None,
+            'avg_cpu_time_ms': None,
+            'max_peak_memory_kb': None,
+            'slowest_extractors': [],
+            'lint_findings': [],
+            'field_stats': {},
+            'score': None,
+            'field_scores': {},
+        }
 
-        except Exception as e:
-            import traceback
-            result['error'] = str(e)
-            result['details'] = traceback.format_exc()
-            logger.error(f"  ✗ 解析失败: {str(e)}")
+    @staticmethod
+    def _new_report(parser_path: str, target_fields: Dict = None) -> ValidationReport:
+        return ValidationReport(
+            parser_path,
+            target_fields,
+            report_dir=settings.validation_report_dir or None,
+            max_samples=settings.validation_failure_samples,
+            max_detail_chars=settings.validation_detail_chars
+        )
+
+    def benchmark_parser(self, parser_path: str, pages: Dict[str, str], rounds: int = 3) -> Dict:
+        """
+        在已缓存的HTML上对比逐个 parse 与 parse_many 的吞吐量
+
+        Args:
+            parser_path: 解析器代码路径
+            pages: URL -> HTML
+            rounds: 每种方式运行的轮数
+
+        Returns:
+            基准测试结果（见 benchmark_batch_parse）
+        """
+        parser = self._load_parser(parser_path)
+        report = benchmark_batch_parse(parser, list(pages.values()), rounds=rounds)
+        if report['speedup']:
+            logger.info(
+                f"批量解析基准: parse {report['parse_docs_per_sec']:.1f} 页/秒, "
+                f"parse_many {report['parse_many_docs_per_sec']:.1f} 页/秒, 加速 {report['speedup']:.2f}x"
+            )
+        else:
+            logger.info(f"批量解析基准: parse {report['parse_docs_per_sec'] or 0:.1f} 页/秒（未实现 parse_many）")
+        return report
+
+    def compare_parsers(
+        self,
+        original_path: str,
+        candidate_path: str,
+        documents: List[str],
+        rounds: int = 3
+    ) -> Dict:
+        """
+        在相同文档上对比两个解析器的输出和耗时
+
+        两个解析器交替运行 rounds 轮，各取总解析耗时最少的一轮；输出以第一轮为准逐页比较（见 compare_outcomes）
+
+        Returns:
+            compare_outcomes 的结果，另含 original_ms / candidate_ms（每轮总耗时，毫秒）和 speedup
+        """
+        timings = {original_path: [], candidate_path: []}
+        outputs = {}
+        for _ in range(max(1, rounds)):
+            for path in (original_path, candidate_path):
+                outcomes = self._parse_pages(path, documents)
+                outputs.setdefault(path, outcomes)
+                timings[path].append(sum(o['parse_time_ms'] or 0.0 for o in outcomes))
+
+        comparison = compare_outcomes(outputs[original_path], outputs[candidate_path])
+        original_ms = min(timings[original_path])
+        candidate_ms = min(timings[candidate_path])
+        comparison['original_ms'] = original_ms
+        comparison['candidate_ms'] = candidate_ms
+        comparison['speedup'] = original_ms / candidate_ms if candidate_ms else None
+        return comparison
 
-        return result
-    
     def diagnose_issues(self, validation_result: Dict) -> List[str]:
         """
         诊断验证中发现的问题
@@ -138,17 +841,8 @@ class AgentValidator:
         """
         issues = []
         
-        # 分析失败的测试
-        failed_tests = [t for t in validation_result['test_results'] if not t['success']]
-        
-        if not failed_tests:
-            return issues
-        
-        # 统计错误类型
-        error_types = {}
-        for test in failed_tests:
-            error = test.get('error', 'Unknown error')
-            error_types[error] = error_types.get(error, 0) + 1
+        # 按错误信息统计的失败页面数（验证时已聚合）
+        error_types = validation_result.get('error_counts') or {}
         
         # 生成诊断
         for error, count in error_types.items():
@@ -172,24 +866,36 @@ class AgentValidator:
         if not issues:
             return "代码运行良好，无需改进"
         
-        # 使用LLM分析问题并给出建议
-        prompt = f"""
-解析器验证发现以下问题：
-{chr(10).join([f"- {issue}" for issue in issues])}
-
-当前解析器代码片段：
-```python
-{parser_code[:1000]}...
-```
-
-请分析可能的原因并给出改进建议。
-"""
+        # 使用LLM分析问题并给出建议，代码片段按token预算压缩
+        issues_text = chr(10).join([f"- {issue}" for issue in issues])
+        parts = TokenBudget(settings.agent_prompt_tokens).allocate([
+            PromptSection("instructions", self._render_improvement_prompt("", ""), shrinkable=False),
+            PromptSection("issues", issues_text, priority=2, min_tokens=200),
+            PromptSection("code", parser_code, priority=1, min_tokens=300),
+        ])
+        prompt = self._render_improvement_prompt(parts["issues"], parts["code"])
 
         messages = [
             {"role": "system", "content": "你是一个专业的代码审查和优化助手。"},
             {"role": "user", "content": prompt}
         ]
         response = self.llm.invoke(messages)
+        token_ledger.record("suggest_improvements", count_message_tokens(messages), response)
 
         return response.content
 
+    @staticmethod
+    def _render_improvement_prompt(issues_text: str, parser_code: str) -> str:
+        """渲染改进建议提示词模板"""
+        return f"""
+解析器验证发现以下问题：
+{issues_text}
+
+当前解析器代码片段：
+```python
+{parser_code}
+```
+
+请分析可能的原因并给出改进建议。
+"""
+
@@ -2,7 +2,7 @@
 HtmlParserAgent 配置管理模块
 """
 import os
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 from pathlib import Path
 from dotenv import load_dotenv
@@ -27,11 +27,24 @@ class Settings(BaseModel):
     # Agent
     agent_model: str = Field(default_factory=lambda: os.getenv("AGENT_MODEL", "claude-sonnet-4-5-20250929"))
     agent_temperature: float = Field(default_factory=lambda: float(os.getenv("AGENT_TEMPERATURE", "0")))
+    agent_prompt_tokens: int = Field(default_factory=lambda: int(os.getenv("AGENT_PROMPT_TOKENS", "4000")))
 
     # 代码生成
     code_gen_model: str = Field(default_factory=lambda: os.getenv("CODE_GEN_MODEL", "claude-sonnet-4-5-20250929"))
     code_gen_temperature: float = Field(default_factory=lambda: float(os.getenv("CODE_GEN_TEMPERATURE", "0.3")))
     code_gen_max_tokens: int = Field(default_factory=lambda: int(os.getenv("CODE_GEN_MAX_TOKENS", "8192")))
+    # 代码生成/修复提示词的token预算（超出时按优先级压缩HTML等段落）
+    code_gen_prompt_tokens: int = Field(default_factory=lambda: int(os.getenv("CODE_GEN_PROMPT_TOKENS", "24000")))
+    # 提示词前缀缓存标记: off（默认）/ auto（Claude系列且 API Base 在 PROMPT_CACHE_HOSTS 中）/ on
+    prompt_cache_mode: str = Field(default_factory=lambda: os.getenv("PROMPT_CACHE_MODE", "off").lower())
+    # 已知会透传 cache_control 标记的 OpenAI 兼容后端（逗号分隔的主机名）
+    prompt_cache_hosts: List[str] = Field(default_factory=lambda: [
+        h.strip().lower() for h in os.getenv("PROMPT_CACHE_HOSTS", "openrouter.ai").split(",") if h.strip()
+    ])
+    # 流式生成：边生成边检查，明显错误时提前中止并重试
+    code_gen_stream: bool = Field(default_factory=lambda: os.getenv("CODE_GEN_STREAM", "true").lower() == "true")
+    code_gen_stream_retries: int = Field(default_factory=lambda: int(os.getenv("CODE_GEN_STREAM_RETRIES", "2")))
+    code_gen_stream_check_interval: int = Field(default_factory=lambda: int(os.getenv("CODE_GEN_STREAM_CHECK_INTERVAL", "800")))
 
     # 视觉理解
     vision_model: str = Field(default_factory=lambda: os.getenv("VISION_MODEL", "qwen-vl-max"))
@@ -45,6 +58,115 @@ class Settings(BaseModel):
     success_threshold: float = Field(default_factory=lambda: float(os.getenv("SUCCESS_THRESHOLD", "0.8")))
     min_sample_size: int = Field(default_factory=lambda: int(os.getenv("MIN_SAMPLE_SIZE", "2")))
 
+    # 代码修复模式：patch 只请求需要修改的函数并在本地应用，冲突时退回 full（完整重写）
+    code_fix_mode: str = Field(default_factory=lambda: os.getenv("CODE_FIX_MODE", "patch").lower())
+    code_fix_patch_max_tokens: int = Field(default_factory=lambda: int(os.getenv("CODE_FIX_PATCH_MAX_TOKENS", "4000")))
+
+    # 修复没有进展时的策略升级：补丁 → 完整重写 → 升级模型 → 多候选重新生成
+    fix_escalation_model: str = Field(default_factory=lambda: os.getenv("FIX_ESCALATION_MODEL", ""))
+    fix_escalation_candidates: int = Field(default_factory=lambda: int(os.getenv("FIX_ESCALATION_CANDIDATES", "3")))
+
+    # 修复时提供失败页面的HTML上下文（来自验证缓存，按字段位置提炼）
+    fix_html_context: bool = Field(default_factory=lambda: os.getenv("FIX_HTML_CONTEXT", "true").lower() == "true")
+    fix_html_context_pages: int = Field(default_factory=lambda: int(os.getenv("FIX_HTML_CONTEXT_PAGES", "2")))
+    fix_html_context_chars: int = Field(default_factory=lambda: int(os.getenv("FIX_HTML_CONTEXT_CHARS", "6000")))
+
+    # 多样本差异提示：对齐样本DOM，只把其他样本中与参考样本不同的区域加入提示词
+    differential_samples: bool = Field(default_factory=lambda: os.getenv("DIFFERENTIAL_SAMPLES", "true").lower() == "true")
+    differential_max_regions: int = Field(default_factory=lambda: int(os.getenv("DIFFERENTIAL_MAX_REGIONS", "8")))
+    differential_max_region_chars: int = Field(default_factory=lambda: int(os.getenv("DIFFERENTIAL_MAX_REGION_CHARS", "1500")))
+
+    # 解析器模块加载：编译后的字节码缓存目录（为空则不缓存）与常驻模块数量上限
+    parser_bytecode_cache_dir: str = Field(default_factory=lambda: os.getenv("PARSER_BYTECODE_CACHE_DIR", ".cache/parser_bytecode"))
+    parser_loader_max_modules: int = Field(default_factory=lambda: int(os.getenv("PARSER_LOADER_MAX_MODULES", "512")))
+
+    # 在沙箱进程池中验证解析器：每次解析限制CPU时间和墙钟时间，工作进程限制内存
+    validation_sandbox: bool = Field(default_factory=lambda: os.getenv("VALIDATION_SANDBOX", "true").lower() == "true")
+    sandbox_workers: int = Field(default_factory=lambda: int(os.getenv("SANDBOX_WORKERS", "0")))  # 0 表示自动
+    sandbox_cpu_seconds: float = Field(default_factory=lambda: float(os.getenv("SANDBOX_CPU_SECONDS", "10")))
+    sandbox_memory_mb: int = Field(default_factory=lambda: int(os.getenv("SANDBOX_MEMORY_MB", "1024")))  # 0 表示不限制
+    sandbox_timeout_seconds: float = Field(default_factory=lambda: float(os.getenv("SANDBOX_TIMEOUT_SECONDS", "30")))
+
+    # 验证结果缓存：按 (解析器哈希, 页面哈希) 复用已知结果，新版本先运行之前失败的页面
+    validation_cache: bool = Field(default_factory=lambda: os.getenv("VALIDATION_CACHE", "true").lower() == "true")
+    validation_cache_path: str = Field(default_factory=lambda: os.getenv("VALIDATION_CACHE_PATH", ".cache/validation.db"))
+    validation_fail_fast: bool = Field(default_factory=lambda: os.getenv("VALIDATION_FAIL_FAST", "true").lower() == "true")
+
+    # 验证报告：逐个URL的完整结果流式写入 JSONL 文件（默认不写，设置目录后开启），内存中只保留聚合统计和有限的失败样本
+    validation_report_dir: str = Field(default_factory=lambda: os.getenv("VALIDATION_REPORT_DIR", ""))
+    validation_failure_samples: int = Field(default_factory=lambda: int(os.getenv("VALIDATION_FAILURE_SAMPLES", "20")))
+    validation_detail_chars: int = Field(default_factory=lambda: int(os.getenv("VALIDATION_DETAIL_CHARS", "1000")))
+    # 验证时每批获取和解析的URL数；验证器最多缓存的页面HTML数（按最近使用淘汰）
+    validation_batch_size: int = Field(default_factory=lambda: int(os.getenv("VALIDATION_BATCH_SIZE", "20")))
+    html_cache_pages: int = Field(default_factory=lambda: int(os.getenv("HTML_CACHE_PAGES", "64")))
+
+    # 批量解析（python main.py parse）：文档分块后在沙箱进程池中并行解析，每块完成后更新检查点
+    bulk_workers: int = Field(default_factory=lambda: int(os.getenv("BULK_WORKERS", "0")))  # 0 表示CPU核数
+    bulk_chunk_size: int = Field(default_factory=lambda: int(os.getenv("BULK_CHUNK_SIZE", "64")))
+    bulk_progress_seconds: float = Field(default_factory=lambda: float(os.getenv("BULK_PROGRESS_SECONDS", "10")))
+    # 本次解析的错误率超过该值时命令以非零状态退出（默认 0：任何错误都视为失败）
+    bulk_max_error_rate: float = Field(default_factory=lambda: float(os.getenv("BULK_MAX_ERROR_RATE", "0")))
+    # 输出格式 jsonl / parquet / arrow；列式输出按解析器 Schema 的字段类型建列
+    bulk_output_format: str = Field(default_factory=lambda: os.getenv("BULK_OUTPUT_FORMAT", "jsonl").lower())
+    bulk_compression: str = Field(default_factory=lambda: os.getenv("BULK_COMPRESSION", "zstd").lower())
+    bulk_row_group_size: int = Field(default_factory=lambda: int(os.getenv("BULK_ROW_GROUP_SIZE", "10000")))
+    bulk_row_groups_per_file: int = Field(default_factory=lambda: int(os.getenv("BULK_ROW_GROUPS_PER_FILE", "10")))
+    # 流式解析规格（带 selector 的 Schema JSON）每次送入增量解析器的字符数
+    stream_parse_chunk_size: int = Field(default_factory=lambda: int(os.getenv("STREAM_PARSE_CHUNK_SIZE", "65536")))
+
+    # 字段漂移监控：批量解析结果按解析器版本统计字段填充率和取值形态，与基线相差超过阈值时加入漂移队列
+    drift_monitor: bool = Field(default_factory=lambda: os.getenv("DRIFT_MONITOR", "true").lower() == "true")
+    drift_baseline_size: int = Field(default_factory=lambda: int(os.getenv("DRIFT_BASELINE_SIZE", "1000")))
+    drift_window_size: int = Field(default_factory=lambda: int(os.getenv("DRIFT_WINDOW_SIZE", "1000")))
+    drift_window_buckets: int = Field(default_factory=lambda: int(os.getenv("DRIFT_WINDOW_BUCKETS", "10")))
+    drift_min_records: int = Field(default_factory=lambda: int(os.getenv("DRIFT_MIN_RECORDS", "200")))
+    drift_fill_drop_threshold: float = Field(default_factory=lambda: float(os.getenv("DRIFT_FILL_DROP_THRESHOLD", "0.2")))
+    drift_shape_threshold: float = Field(default_factory=lambda: float(os.getenv("DRIFT_SHAPE_THRESHOLD", "0.3")))
+    drift_length_threshold: float = Field(default_factory=lambda: float(os.getenv("DRIFT_LENGTH_THRESHOLD", "1.0")))
+    drift_max_samples: int = Field(default_factory=lambda: int(os.getenv("DRIFT_MAX_SAMPLES", "5")))
+    drift_baseline_pages: int = Field(default_factory=lambda: int(os.getenv("DRIFT_BASELINE_PAGES", "10")))
+
+    # 大量URL上的序贯验证：随机抽取页面，成功率相对 success_threshold 有统计结论时提前停止
+    sequential_method: str = Field(default_factory=lambda: os.getenv("SEQUENTIAL_METHOD", "wilson").lower())
+    sequential_confidence: float = Field(default_factory=lambda: float(os.getenv("SEQUENTIAL_CONFIDENCE", "0.95")))
+    sequential_indifference: float = Field(default_factory=lambda: float(os.getenv("SEQUENTIAL_INDIFFERENCE", "0.1")))
+    sequential_min_urls: int = Field(default_factory=lambda: int(os.getenv("SEQUENTIAL_MIN_URLS", "5")))
+    sequential_max_urls: int = Field(default_factory=lambda: int(os.getenv("SEQUENTIAL_MAX_URLS", "200")))
+    sequential_batch_size: int = Field(default_factory=lambda: int(os.getenv("SEQUENTIAL_BATCH_SIZE", "5")))
+
+    # 解析性能剖析：记录每页的CPU时间、峰值内存和最慢的提取函数；单页CPU耗时超出预算时验证失败（默认 0，不限制）
+    parse_profile: bool = Field(default_factory=lambda: os.getenv("PARSE_PROFILE", "true").lower() == "true")
+    parse_latency_budget_ms: float = Field(default_factory=lambda: float(os.getenv("PARSE_LATENCY_BUDGET_MS", "0")))
+
+    # 与视觉参考值逐字段评分：页面加权得分低于阈值时该页面验证失败（0 表示只记录得分）
+    field_score_threshold: float = Field(default_factory=lambda: float(os.getenv("FIELD_SCORE_THRESHOLD", "0.5")))
+    field_number_tolerance: float = Field(default_factory=lambda: float(os.getenv("FIELD_NUMBER_TOLERANCE", "0.01")))
+    field_list_length_tolerance: float = Field(default_factory=lambda: float(os.getenv("FIELD_LIST_LENGTH_TOLERANCE", "0.2")))
+
+    # 验证前对解析器代码做静态性能检查，严重问题直接拒绝执行
+    parser_lint: bool = Field(default_factory=lambda: os.getenv("PARSER_LINT", "true").lower() == "true")
+
+    # 验证通过的 BeautifulSoup 解析器转译为 lxml 版本，在缓存页面上输出一致且加速达到阈值时采用
+    parser_transpile: bool = Field(default_factory=lambda: os.getenv("PARSER_TRANSPILE", "true").lower() == "true")
+    transpile_min_speedup: float = Field(default_factory=lambda: float(os.getenv("TRANSPILE_MIN_SPEEDUP", "1.2")))
+    transpile_benchmark_rounds: int = Field(default_factory=lambda: int(os.getenv("TRANSPILE_BENCHMARK_ROUNDS", "3")))
+    # 采用转译版本前至少需要对比的页面数（样本页面不足时从URL池补充）
+    transpile_min_pages: int = Field(default_factory=lambda: int(os.getenv("TRANSPILE_MIN_PAGES", "10")))
+
+    # 结构指纹复用：与已验证解析器的页面结构足够相近时直接复用，不调用LLM
+    fingerprint_reuse: bool = Field(default_factory=lambda: os.getenv("FINGERPRINT_REUSE", "true").lower() == "true")
+    fingerprint_max_distance: int = Field(default_factory=lambda: int(os.getenv("FINGERPRINT_MAX_DISTANCE", "6")))
+
+    # 多候选并行生成（锦标赛选择），候选数为1时关闭
+    tournament_candidates: int = Field(default_factory=lambda: int(os.getenv("TOURNAMENT_CANDIDATES", "1")))
+    tournament_temperatures: List[float] = Field(default_factory=lambda: [
+        float(t) for t in os.getenv("TOURNAMENT_TEMPERATURES", "0.2,0.5,0.8").split(",") if t.strip()
+    ])
+    # 逗号分隔的候选模型列表，为空时使用 code_gen_model
+    tournament_models: List[str] = Field(default_factory=lambda: [
+        m.strip() for m in os.getenv("TOURNAMENT_MODELS", "").split(",") if m.strip()
+    ])
+
     # ============================================
     # 浏览器配置
     # ============================================
@@ -2,6 +2,7 @@
 HtmlParserAgent 主程序
 通过给定URL列表，自动生成网页解析代码
 """
+import argparse
 import sys
 from pathlib import Path
 from loguru import logger
@@ -92,9 +93,139 @@ def example_custom_usage():
     )
 
 
+def bulk_parse_command(argv):
+    """
+    批量解析命令
+
+    python main.py parse <解析器路径> <输入> -o <输出路径> [--format jsonl|parquet|arrow] [--schema <Schema配置>]
+                         [--workers N] [--chunk-size N] [--no-resume] [--max-error-rate R]
+
+    本次解析的文档错误率超过 --max-error-rate（默认 BULK_MAX_ERROR_RATE，即 0）时返回 1
+    """
+    from config.settings import settings
+    from utils.bulk_parse import bulk_parse
+
+    arg_parser = argparse.ArgumentParser(prog="main.py parse", description="用已生成的解析器批量解析存档的HTML")
+    arg_parser.add_argument("parser", help="解析器代码路径，或手工补充了 selector 的 Schema JSON（流式解析；生成的配置不含 selector）")
+    arg_parser.add_argument("input", help="输入：目录、glob 模式、tar 包、JSONL 或单个HTML文件")
+    arg_parser.add_argument("-o", "--output", required=True, help="输出路径（jsonl 为文件，parquet / arrow 为目录）")
+    arg_parser.add_argument("--format", choices=["jsonl", "parquet", "arrow"], default=settings.bulk_output_format,
+                            help="输出格式")
+    arg_parser.add_argument("--schema", help="列式输出使用的 Schema 配置（默认从注册表查找）")
+    arg_parser.add_argument("--compression", default=settings.bulk_compression, help="列式输出的压缩算法")
+    arg_parser.add_argument("--row-group-size", type=int, default=settings.bulk_row_group_size, help="每个行组的行数")
+    arg_parser.add_argument("--workers", type=int, default=settings.bulk_workers, help="工作进程数（0 表示CPU核数）")
+    arg_parser.add_argument("--chunk-size", type=int, default=settings.bulk_chunk_size, help="每块文档数")
+    arg_parser.add_argument("--no-resume", action="store_true", help="忽略已有检查点，从头开始")
+    arg_parser.add_argument("--no-drift", action="store_true", help="不把结果送入字段漂移监控")
+    arg_parser.add_argument("--max-error-rate", type=float, default=settings.bulk_max_error_rate,
+                            help="允许的文档错误率（0~1），超过时以非零状态退出")
+    args = arg_parser.parse_args(argv)
+
+    setup_logger()
+    stats = bulk_parse(
+        args.parser,
+        args.input,
+        args.output,
+        resume=not args.no_resume,
+        output_format=args.format,
+        schema_path=args.schema,
+        compression=args.compression,
+        row_group_size=args.row_group_size,
+        row_groups_per_file=settings.bulk_row_groups_per_file,
+        drift_monitor=settings.drift_monitor and not args.no_drift,
+        workers=args.workers or None,
+        chunk_size=args.chunk_size,
+        cpu_seconds=settings.sandbox_cpu_seconds,
+        memory_mb=settings.sandbox_memory_mb,
+        timeout_seconds=settings.sandbox_timeout_seconds,
+        progress_seconds=settings.bulk_progress_seconds,
+    )
+    for error, count in sorted(stats['error_counts'].items(), key=lambda item: item[1], reverse=True)[:5]:
+        logger.warning(f"  {count} 次: {error}")
+    error_rate = stats['errors'] / stats['documents'] if stats['documents'] else 0.0
+    if error_rate > args.max_error_rate:
+        logger.error(f"错误率 {error_rate:.1%} 超过允许的 {args.max_error_rate:.1%}（{stats['errors']}/{stats['documents']} 个文档）")
+        return 1
+    return 0
+
+
+def drift_command(argv):
+    """
+    字段漂移命令
+
+    python main.py drift <解析器路径> <批量解析输出> [--input <输入>] [--force]   把已有的批量解析输出送入漂移监控
+    python main.py drift --process [--limit N]                                  处理漂移队列（修复或重新生成）
+    """
+    arg_parser = argparse.ArgumentParser(prog="main.py drift", description="字段漂移监控与漂移队列处理")
+    arg_parser.add_argument("parser", nargs="?", help="解析器代码路径（注册表中的版本）")
+    arg_parser.add_argument("output", nargs="?", help="批量解析输出（JSONL 文件或 parquet / arrow 目录）")
+    arg_parser.add_argument("--process", action="store_true", help="处理漂移队列中待处理的告警")
+    arg_parser.add_argument("--limit", type=int, help="最多处理的告警数")
+    arg_parser.add_argument("--input", help="批量解析的原始输入，提供后告警附带失败页面的HTML，可以直接处理")
+    arg_parser.add_argument("--force", action="store_true",
+                            help="即使该输出已送入过监控（批量解析默认会送入）也再次统计")
+    args = arg_parser.parse_args(argv)
+
+    setup_logger()
+    if args.process:
+        results = ParserAgent().process_drift_alerts(limit=args.limit)
+        logger.info(f"处理了 {len(results)} 条漂移告警，成功 {sum(r['success'] for r in results)} 条")
+        return 0 if all(r['success'] for r in results) else 1
+
+    if not args.parser or not args.output:
+        arg_parser.error("需要解析器路径和批量解析输出，或使用 --process")
+    from utils.bulk_parse import iter_documents
+    from utils.drift_monitor import feed_records, format_drift_report, iter_output_records, monitor_for_parser
+
+    monitor = monitor_for_parser(args.parser)
+    if not monitor.mark_fed(args.output) and not args.force:
+        logger.error("该输出已送入过漂移监控（批量解析默认会送入），重复统计会使结果失真；确需再次统计请使用 --force")
+        return 1
+    documents = iter_documents(args.input) if args.input else None
+    report = feed_records(monitor, iter_output_records(args.output), documents=documents)
+    logger.info(f"已统计 {report['records']} 条记录（窗口 {report['window_records']} 条）")
+    for line in format_drift_report(report):
+        logger.warning(f"  {line}")
+    return 1 if report['drifted'] else 0
+
+
+def benchmark_command(argv):
+    """
+    批量解析基准命令
+
+    python main.py benchmark <解析器路径> <输入> [--limit N] [--rounds N]
+    在存档的HTML上对比逐个 parse 与 parse_many 的吞吐量
+    """
+    from itertools import islice
+    from agent.validator import AgentValidator
+    from utils.bulk_parse import iter_documents
+
+    arg_parser = argparse.ArgumentParser(prog="main.py benchmark", description="对比逐个 parse 与 parse_many 的吞吐量")
+    arg_parser.add_argument("parser", help="解析器代码路径，或手工补充了 selector 的 Schema JSON（流式解析；生成的配置不含 selector）")
+    arg_parser.add_argument("input", help="输入：目录、glob 模式、tar 包、JSONL 或单个HTML文件")
+    arg_parser.add_argument("--limit", type=int, default=200, help="最多使用的文档数")
+    arg_parser.add_argument("--rounds", type=int, default=3, help="每种方式运行的轮数")
+    args = arg_parser.parse_args(argv)
+
+    setup_logger()
+    pages = dict(islice(iter_documents(args.input), max(1, args.limit)))
+    if not pages:
+        arg_parser.error(f"输入中没有文档: {args.input}")
+    report = AgentValidator().benchmark_parser(args.parser, pages, rounds=args.rounds)
+    logger.info(f"基准文档数: {report['documents']}")
+    return 0
+
+
 if __name__ == "__main__":
     # 检查命令行参数
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == "parse":
+        sys.exit(bulk_parse_command(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "drift":
+        sys.exit(drift_command(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        sys.exit(benchmark_command(sys.argv[2:]))
+    elif len(sys.argv) > 1:
         # 从命令行读取URL
         urls = sys.argv[1:]
         
@@ -47,7 +47,7 @@ def test_iteration_with_multiple_urls():
         if result['validation_result']:
             print(f"  成功率: {result['validation_result']['success_rate']:.1%}")
             print(f"  是否通过: {result['validation_result']['passed']}")
-            print(f"  测试数量: {len(result['validation_result']['tests'])}")
+            print(f"  测试数量: {result['validation_result']['counts'].get('total', 0)}")
     else:
         print(f"\n✗ 失败: {result.get('error')}")
 
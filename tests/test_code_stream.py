@@ -0,0 +1,42 @@
+"""
+流式代码检查的回归测试
+"""
+import pytest
+
+from utils.code_stream import StreamingCodeChecker
+
+
+DECORATED_CODE = '''from dataclasses import dataclass
+from bs4 import BeautifulSoup
+
+
+@dataclass
+class Item:
+    title: str = None
+
+
+class WebPageParser:
+    @staticmethod
+    def _text(node):
+        return node.get_text(strip=True) if node else None
+
+    def parse(self, html):
+        soup = BeautifulSoup(html, "lxml")
+        return {"title": self._text(soup.find("h1"))}
+
+
+@dataclass
+class Extra:
+    name: str = None
+'''
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 16, 64])
+def test_stream_decorated_class(chunk_size):
+    """顶层装饰器与其后的类定义一起编译，不因悬空的装饰器中止"""
+    checker = StreamingCodeChecker(check_interval=1)
+    text = "```python\n" + DECORATED_CODE + "```\n"
+    for i in range(0, len(text), chunk_size):
+        checker.feed(text[i:i + chunk_size])
+    assert checker.finalize() == DECORATED_CODE.strip()
+    assert checker.class_found and checker.method_found
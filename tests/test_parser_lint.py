@@ -0,0 +1,90 @@
+"""
+解析器静态检查的回归测试
+parse_many 中逐个文档解析的常见写法不应被判为阻止运行的 html-parse-in-loop
+"""
+import textwrap
+
+from utils.parser_lint import has_blocking_findings, lint_parser_code
+
+
+def _lint(body: str):
+    code = textwrap.dedent('''
+        from bs4 import BeautifulSoup
+
+
+        class WebPageParser:
+            def _extract(self, soup):
+                return {"title": soup.title.string if soup.title else None}
+
+            def parse(self, html):
+                return self._extract(BeautifulSoup(html, "lxml"))
+
+    ''') + textwrap.indent(textwrap.dedent(body), "    ")
+    return lint_parser_code(code)
+
+
+def _in_loop(findings):
+    return [f for f in findings if f['rule'] == 'html-parse-in-loop']
+
+
+def test_parse_many_plain_loop():
+    """for html in htmls: 逐个文档解析"""
+    findings = _lint('''
+        def parse_many(self, htmls):
+            for html in htmls:
+                yield self._extract(BeautifulSoup(html, "lxml"))
+    ''')
+    assert not _in_loop(findings)
+    assert not has_blocking_findings(findings)
+
+
+def test_parse_many_enumerate_loop():
+    """for i, html in enumerate(htmls): 逐个文档解析"""
+    findings = _lint('''
+        def parse_many(self, htmls):
+            results = []
+            for i, html in enumerate(htmls):
+                results.append(self._extract(BeautifulSoup(html, "lxml")))
+            return results
+    ''')
+    assert not _in_loop(findings)
+    assert not has_blocking_findings(findings)
+
+
+def test_parse_many_comprehension():
+    """列表推导式遍历文档参数"""
+    findings = _lint('''
+        def parse_many(self, htmls):
+            return [self._extract(BeautifulSoup(h, "lxml")) for h in htmls]
+    ''')
+    assert not _in_loop(findings)
+    assert not has_blocking_findings(findings)
+
+
+def test_parse_many_inner_loop_is_warning():
+    """parse_many 中每个文档内部的循环解析只作为警告"""
+    findings = _lint('''
+        def parse_many(self, htmls):
+            for html in htmls:
+                for part in html.split("<hr>"):
+                    yield self._extract(BeautifulSoup(part, "lxml"))
+    ''')
+    assert [f['severity'] for f in _in_loop(findings)] == ['warning']
+    assert not has_blocking_findings(findings)
+
+
+def test_parse_loop_outside_parse_many_is_error():
+    """parse 中的循环解析仍然阻止运行"""
+    findings = lint_parser_code(textwrap.dedent('''
+        from bs4 import BeautifulSoup
+
+
+        class WebPageParser:
+            def parse(self, html):
+                items = []
+                for block in html.split("<hr>"):
+                    items.append(BeautifulSoup(block, "lxml").get_text())
+                return {"items": items}
+    '''))
+    assert [f['severity'] for f in _in_loop(findings)] == ['error']
+    assert has_blocking_findings(findings)
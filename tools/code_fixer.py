@@ -2,20 +2,99 @@
 代码修复工具
 基于验证结果和错误信息，使用LLM修复生成的解析器代码
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI
 from config.settings import settings
 from loguru import logger
+from utils.code_patch import PATCH_FORMAT_INSTRUCTIONS, PatchConflict, apply_patch, parse_patch
+from utils.prompt_cache import build_cached_messages
+from utils.token_budget import PromptSection, TokenBudget, count_message_tokens, count_tokens, token_ledger
 import json
 
 
+# 静态系统指令：所有修复调用逐字节一致，可命中后端的前缀缓存
+_FIX_SYSTEM_PROMPT = """你是一个专业的Python代码调试和修复专家，擅长BeautifulSoup和网页解析。请根据用户提供的目标结构、原始代码和验证错误修复BeautifulSoup解析器代码。
+
+## 修复要求
+1. 分析错误原因（选择器失效、字段缺失、类型错误等）
+2. 修复代码中的问题
+3. 确保代码能够正确提取所有必需字段
+4. 添加更健壮的错误处理
+5. 使用更可靠的选择器策略（优先使用多个备选选择器）
+6. 修复"静态性能检查"指出的问题：只构建一次文档树、循环中不使用 `find_all(True)`、
+   不对 `str(soup)` 运行正则、网络相关的导入只放在 `if __name__ == '__main__'` 部分
+
+## 输出格式 - 重要！
+**严格要求：**
+1. 直接输出修复后的完整Python代码，从 `import` 语句开始
+2. **绝对不要**使用任何markdown标记，包括：
+   - 不要使用 ```python
+   - 不要使用 ```
+   - 不要使用任何反引号
+3. 不要包含任何说明文字、注释或解释（代码内注释除外）
+4. 代码必须可以直接保存为.py文件并运行
+5. 保持原有的类名 `WebPageParser` 以及 `parse`、`parse_many` 方法
+"""
+
+# 补丁模式的静态系统指令：只输出需要修改的函数，输出大小与修改范围成正比
+_PATCH_FIX_SYSTEM_PROMPT = f"""你是一个专业的Python代码调试和修复专家，擅长BeautifulSoup和网页解析。请根据用户提供的目标结构、原始代码和验证错误，以补丁形式修复BeautifulSoup解析器代码。
+
+## 修复要求
+1. 分析错误原因（选择器失效、字段缺失、类型错误等）
+2. 只修改与失败字段和错误相关的方法，其余代码保持不变
+3. 使用更可靠的选择器策略（优先使用多个备选选择器），添加必要的错误处理
+4. 修复"静态性能检查"指出的问题：只构建一次文档树、循环中不使用 `find_all(True)`、
+   不对 `str(soup)` 运行正则、网络相关的导入只放在 `if __name__ == '__main__'` 部分
+5. 保持原有的类名 `WebPageParser` 以及 `parse`、`parse_many` 方法
+
+## 输出格式 - 重要！
+{PATCH_FORMAT_INSTRUCTIONS}
+"""
+
+
+def _render_fix_payload(
+    original_code: str,
+    errors_text: str,
+    html_sample: str,
+    patch_mode: bool = False,
+    failing_fields: List[str] = None,
+    model_name: str = None
+) -> str:
+    """渲染每次修复都会变化的负载"""
+    fields_section = f"""
+## 需要修复的字段
+只修改以下字段的提取逻辑，其余字段已通过验证，必须保持不变：{', '.join(failing_fields)}
+""" if failing_fields else ""
+
+    html_section = f"""
+## 失败页面的HTML参考
+```html
+{html_sample}
+```
+""" if html_sample else ""
+
+    return f"""## 原始代码
+```python
+{original_code}
+```
+
+## 验证错误
+{errors_text}
+{fields_section}{html_section}
+{"请输出补丁块：" if patch_mode else "请直接输出修复后的代码："}
+"""
+
+
 @tool
 def fix_parser_code(
     original_code: str,
     validation_errors: List[Dict],
     target_json: Dict,
-    html_sample: str = None
+    html_sample: Optional[str] = None,
+    failing_fields: Optional[List[str]] = None,
+    fix_mode: Optional[str] = None,
+    model_name: Optional[str] = None
 ) -> Dict:
     """
     修复解析器代码
@@ -25,6 +104,9 @@ def fix_parser_code(
         validation_errors: 验证错误列表
         target_json: 目标JSON结构
         html_sample: HTML样本（可选，用于参考）
+        failing_fields: 未通过验证的字段（可选），只重新生成这些字段的提取逻辑
+        fix_mode: 修复模式 patch / full（可选，默认使用配置）
+        model_name: 模型名称（可选，默认使用配置）
     
     Returns:
         修复后的代码和相关信息
@@ -41,78 +123,47 @@ def fix_parser_code(
         )
     
     errors_text = "\n".join(error_descriptions)
-    
-    # 构建修复提示词
-    prompt = f"""你是一个专业的Python代码调试专家。请修复以下BeautifulSoup解析器代码。
 
-## 原始代码
-```python
-{original_code[:5000]}  # 限制长度
-```
+    if (fix_mode or settings.code_fix_mode) == "patch":
+        try:
+            fixed_code, changes = _fix_with_patch(
+                original_code, errors_text, target_json, html_sample, failing_fields, model_name
+            )
+            logger.success(f"代码修复完成（补丁）: {', '.join(changes)}")
+            return {
+                'success': True,
+                'fixed_code': fixed_code,
+                'original_code': original_code,
+                'changes_made': '; '.join(changes),
+                'fix_mode': 'patch'
+            }
+        except PatchConflict as e:
+            logger.warning(f"补丁无法应用，改为完整重写: {str(e)}")
+        except Exception as e:
+            logger.warning(f"补丁修复失败，改为完整重写: {str(e)}")
 
-## 目标JSON结构
-```json
-{json.dumps(target_json, ensure_ascii=False, indent=2)[:2000]}
-```
-
-## 验证错误
-{errors_text}
-
-## 修复要求
-1. 分析错误原因（选择器失效、字段缺失、类型错误等）
-2. 修复代码中的问题
-3. 确保代码能够正确提取所有必需字段
-4. 添加更健壮的错误处理
-5. 使用更可靠的选择器策略（优先使用多个备选选择器）
-
-## 输出格式 - 重要！
-**严格要求：**
-1. 直接输出修复后的完整Python代码，从 `import` 语句开始
-2. **绝对不要**使用任何markdown标记，包括：
-   - 不要使用 ```python
-   - 不要使用 ```
-   - 不要使用任何反引号
-3. 不要包含任何说明文字、注释或解释（代码内注释除外）
-4. 代码必须可以直接保存为.py文件并运行
-5. 保持原有的类名 `WebPageParser` 和方法名 `parse`
-
-请直接输出修复后的代码：
-"""
-    
     try:
-        # 创建LLM实例
-        llm = ChatOpenAI(
-            model=settings.code_gen_model,
-            temperature=settings.code_gen_temperature,
-            api_key=settings.openai_api_key,
-            base_url=settings.openai_api_base,
-            max_tokens=settings.code_gen_max_tokens
+        fixed_code = _invoke_fix(
+            _FIX_SYSTEM_PROMPT, original_code, errors_text, target_json, html_sample,
+            patch_mode=False, failing_fields=failing_fields, model_name=model_name
         )
-        
-        # 调用LLM
-        messages = [
-            {"role": "system", "content": "你是一个专业的Python代码调试和修复专家，擅长BeautifulSoup和网页解析。"},
-            {"role": "user", "content": prompt}
-        ]
-        
-        response = llm.invoke(messages)
-        fixed_code = response.content
-        
+
         # 清理可能的markdown标记（备用安全措施）
         if "```python" in fixed_code:
             fixed_code = fixed_code.split("```python")[1].split("```")[0].strip()
         elif "```" in fixed_code:
             fixed_code = fixed_code.split("```")[1].split("```")[0].strip()
-        
+
         logger.success("代码修复完成")
-        
+
         return {
             'success': True,
             'fixed_code': fixed_code,
             'original_code': original_code,
-            'changes_made': '基于验证错误进行了修复'
+            'changes_made': '基于验证错误进行了修复',
+            'fix_mode': 'full'
         }
-        
+
     except Exception as e:
         logger.error(f"代码修复失败: {str(e)}")
         return {
@@ -121,3 +172,77 @@ def fix_parser_code(
             'fixed_code': original_code  # 返回原始代码
         }
 
+
+def _fix_with_patch(
+    original_code: str,
+    errors_text: str,
+    target_json: Dict,
+    html_sample: str = None,
+    failing_fields: List[str] = None,
+    model_name: str = None
+):
+    """
+    请求函数粒度的补丁并在本地应用
+
+    Returns:
+        (修复后的代码, 修改说明列表)
+
+    Raises:
+        PatchConflict: 补丁格式错误或无法干净地应用
+    """
+    patch_text = _invoke_fix(
+        _PATCH_FIX_SYSTEM_PROMPT, original_code, errors_text, target_json, html_sample,
+        patch_mode=True, failing_fields=failing_fields, model_name=model_name
+    )
+    ops = parse_patch(patch_text)
+    return apply_patch(original_code, ops)
+
+
+def _invoke_fix(
+    system_prompt: str,
+    original_code: str,
+    errors_text: str,
+    target_json: Dict,
+    html_sample: str = None,
+    patch_mode: bool = False,
+    failing_fields: List[str] = None,
+    model_name: str = None
+) -> str:
+    """构建修复提示词并调用LLM，返回响应文本"""
+    # 按token预算分配各段落：原始代码最重要，其次是错误信息，HTML样本最先被压缩
+    target_text = f"## 目标JSON结构\n```json\n{json.dumps(target_json, ensure_ascii=False, indent=2)}\n```\n"
+    parts = TokenBudget(settings.code_gen_prompt_tokens).allocate([
+        PromptSection("instructions", system_prompt, shrinkable=False),
+        PromptSection("payload", _render_fix_payload("", "", "", patch_mode, failing_fields), shrinkable=False),
+        # 补丁模式需要完整的原始代码才能定位要替换的方法
+        PromptSection("code", original_code, priority=4, min_tokens=2000, shrinkable=not patch_mode),
+        PromptSection("errors", errors_text, priority=3, min_tokens=500),
+        PromptSection("target_json", target_text, priority=2, min_tokens=500),
+        PromptSection("html_sample", html_sample or "", priority=1),
+    ])
+
+    # 稳定前缀（系统指令 + 目标结构）在同一任务的多次修复之间保持不变
+    messages = build_cached_messages(
+        system_prompt,
+        parts["target_json"],
+        _render_fix_payload(
+            parts["code"], parts["errors"], parts["html_sample"], patch_mode, failing_fields
+        ),
+        model_name or settings.code_gen_model
+    )
+    prefix_tokens = count_tokens(system_prompt) + count_tokens(parts["target_json"])
+
+    llm = ChatOpenAI(
+        model=model_name or settings.code_gen_model,
+        temperature=settings.code_gen_temperature,
+        api_key=settings.openai_api_key,
+        base_url=settings.openai_api_base,
+        max_tokens=settings.code_fix_patch_max_tokens if patch_mode else settings.code_gen_max_tokens
+    )
+
+    response = llm.invoke(messages)
+    token_ledger.record(
+        "code_fix_patch" if patch_mode else "code_fix",
+        count_message_tokens(messages), response, prefix_tokens
+    )
+    return response.content
@@ -4,41 +4,33 @@
 """
 import json
 import os
-from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
 from config.settings import settings
 from langchain_core.tools import tool
+from utils.code_stream import StreamingCodeChecker, StreamAbort, StreamCancelled, current_cancel_event, stream_code
+from utils.parser_registry import ParserRegistry
+from utils.prompt_cache import build_cached_messages
+from utils.token_budget import PromptSection, TokenBudget, count_message_tokens, count_tokens, token_ledger
 
 
-def _build_code_generation_prompt(html_content: str, target_json: Dict) -> str:
-    """构建代码生成提示词"""
-    # 截断过长的HTML
-    if len(html_content) > 30000:
-        html_content = html_content[:30000] + "\n... (截断)"
-
-    prompt = f"""
-你是一个专业的HTML解析代码生成器。请根据以下信息生成一个Python类，用于解析同类网页。
-
-## 目标结构
-需要提取以下字段（JSON格式）：
-```json
-{json.dumps(target_json, ensure_ascii=False, indent=2)}
-```
-
-## HTML示例
-```html
-{html_content}
-```
+# 静态系统指令：所有代码生成调用逐字节一致，可命中后端的前缀缓存
+_CODE_GEN_SYSTEM_PROMPT = """你是一个专业的HTML解析代码生成器。请根据用户提供的目标结构和HTML示例生成一个Python类，用于解析同类网页。
 
 ## 要求
 1. 生成一个名为 `WebPageParser` 的Python类
 2. 使用 BeautifulSoup 和 lxml 进行解析
 3. 实现 `parse(html: str) -> dict` 方法
-4. 为每个字段编写提取逻辑，使用CSS选择器或XPath
-5. 尽量使用类名、ID等稳定属性，避免使用绝对索引
-6. 代码尽量简洁，减少冗余
-7. 添加适当的错误处理
+4. 实现 `parse_many(htmls: Iterable[str]) -> Iterator[dict]` 生成器，按输入顺序为每个文档产出一个结果；
+   选择器在 `__init__` 中预编译一次（如 `soupsieve.compile`、`lxml.etree.XPath`），
+   `parse` 与 `parse_many` 共用同一套提取逻辑，批量解析时复用同一个实例
+5. 为每个字段编写提取逻辑，使用CSS选择器或XPath
+6. 尽量使用类名、ID等稳定属性，避免使用绝对索引
+7. 代码尽量简洁，减少冗余
+8. 添加适当的错误处理
+9. 性能要求：每次 `parse` 只构建一次文档树；不要在循环中使用 `find_all(True)` 或重新解析HTML；
+   不要对 `str(soup)` 运行正则；避免含嵌套量词的正则
+10. 网络相关的导入和调用（如 DrissionPage）只能放在 `if __name__ == '__main__'` 部分或其调用的辅助函数中
 
 ## 输出格式 - 重要！
 **严格要求：**
@@ -54,7 +46,6 @@ def _build_code_generation_prompt(html_content: str, target_json: Dict) -> str:
 **正确示例（直接从import开始）：**
 import sys
 import json
-from pathlib import Path
 ...
 
 ## 使用示例要求
@@ -64,21 +55,143 @@ from pathlib import Path
 3. 如果是文件路径，直接读取文件
 4. 默认参数示例：使用命令行参数 sys.argv[1]，默认为当前目录的 'sample.html'
 """
-    return prompt
+
+# 为可变负载（如候选策略提示）预留的token数，保证稳定负载的截断结果与其无关
+_VARIABLE_RESERVE_TOKENS = 300
+
+
+def _build_code_generation_messages(
+    html_content: str,
+    target_json: Dict,
+    prompt_hint: Optional[str] = None,
+    model_name: Optional[str] = None,
+    sample_variations: Optional[str] = None
+) -> Tuple[List[Dict], int]:
+    """
+    构建代码生成消息
+
+    布局为：静态系统指令 → 目标结构、HTML和样本差异（同一任务的所有候选共享）→ 候选策略提示，
+    并按token预算压缩HTML、样本差异和目标结构
+
+    Returns:
+        (消息列表, 可缓存前缀的token数)
+    """
+    target_text = json.dumps(target_json, ensure_ascii=False, indent=2)
+
+    # 预算不足时优先压缩HTML，其次是样本差异，目标结构尽量完整保留
+    parts = TokenBudget(settings.code_gen_prompt_tokens - _VARIABLE_RESERVE_TOKENS).allocate([
+        PromptSection("instructions", _CODE_GEN_SYSTEM_PROMPT, shrinkable=False),
+        PromptSection("payload", _render_code_generation_payload("", "", ""), shrinkable=False),
+        PromptSection("target_json", target_text, priority=3, min_tokens=1000),
+        PromptSection("variations", sample_variations or "", priority=2, min_tokens=500),
+        PromptSection("html", html_content, priority=1, min_tokens=2000),
+    ])
+    stable_text = _render_code_generation_payload(parts["target_json"], parts["html"], parts["variations"])
+    variable_text = f"## 额外策略要求\n{prompt_hint}\n" if prompt_hint else ""
+
+    messages = build_cached_messages(
+        _CODE_GEN_SYSTEM_PROMPT,
+        stable_text,
+        variable_text,
+        model_name or settings.code_gen_model
+    )
+    return messages, count_tokens(_CODE_GEN_SYSTEM_PROMPT) + count_tokens(stable_text)
+
+
+def _render_code_generation_payload(target_text: str, html_content: str, variations: str = "") -> str:
+    """渲染代码生成的任务负载"""
+    variations_text = f"""
+## 样本差异
+同一模板的其他样本与上面的HTML示例存在以下差异，生成的选择器需要同时兼容这些变化：
+{variations}
+""" if variations else ""
+
+    return f"""## 目标结构
+需要提取以下字段（JSON格式）：
+```json
+{target_text}
+```
+
+## HTML示例
+```html
+{html_content}
+```
+{variations_text}"""
+
+
+def _strip_markdown_fences(generated_code: str) -> str:
+    """提取生成的代码并清理 markdown 标记"""
+    generated_code = generated_code.strip()
+
+    # 移除 markdown 代码块标记
+    if generated_code.startswith("```python"):
+        generated_code = generated_code[len("```python"):].strip()
+    elif generated_code.startswith("```"):
+        generated_code = generated_code[3:].strip()
+
+    if generated_code.endswith("```"):
+        generated_code = generated_code[:-3].strip()
+
+    return generated_code
+
+
+def _generate_code_streaming(model, messages, prefix_tokens: int = None) -> str:
+    """
+    流式生成代码
+
+    生成过程中持续做增量编译和结构检查，一旦发现明显错误立即中止本次生成并重试，
+    不必等待完整响应（最长可达 code_gen_max_tokens 个token）
+
+    调用方通过 stream_cancellation 设置的取消信号在每个分片到达时检查，设置后抛出 StreamCancelled，不再重试
+    """
+    attempts = settings.code_gen_stream_retries + 1
+    estimated_tokens = count_message_tokens(messages)
+    last_error = None
+    cancel_event = current_cancel_event()
+
+    for attempt in range(1, attempts + 1):
+        if cancel_event is not None and cancel_event.is_set():
+            raise StreamCancelled("生成已取消")
+        checker = StreamingCodeChecker(check_interval=settings.code_gen_stream_check_interval)
+        try:
+            return stream_code(model, messages, checker, cancel_event)
+        except StreamAbort as e:
+            last_error = e
+            logger.warning(f"流式生成中止 ({attempt}/{attempts}): {str(e)}")
+        finally:
+            token_ledger.record("code_generation", estimated_tokens, checker.usage, prefix_tokens)
+
+    raise Exception(f"流式生成多次失败: {str(last_error)}")
 
 
 @tool
-def generate_parser_code(html_content: str, target_json: Dict, output_dir: str = "generated_parsers") -> Dict:
+def generate_parser_code(
+    html_content: str,
+    target_json: Dict,
+    output_dir: str = "generated_parsers",
+    temperature: Optional[float] = None,
+    model_name: Optional[str] = None,
+    prompt_hint: Optional[str] = None,
+    domain: Optional[str] = None,
+    template: Optional[str] = None,
+    sample_variations: Optional[str] = None
+) -> Dict:
     """
     从HTML和目标JSON生成BeautifulSoup解析代码
 
     Args:
         html_content: HTML内容
         target_json: 目标JSON结构
-        output_dir: 输出目录
+        output_dir: 解析器注册表目录
+        temperature: 温度参数（可选，默认使用配置）
+        model_name: 模型名称（可选，默认使用配置）
+        prompt_hint: 额外的生成策略提示（可选）
+        domain: 域名（可选，记录到注册表元数据）
+        template: 模板/布局类型（可选，记录到注册表元数据）
+        sample_variations: 其他样本相对参考HTML的差异说明（可选）
 
     Returns:
-        生成结果，包括代码路径和配置路径
+        生成结果，包括代码路径、配置路径和版本哈希
     """
     try:
         logger.info("正在生成解析代码...")
@@ -87,49 +200,34 @@ def generate_parser_code(html_content: str, target_json: Dict, output_dir: str =
         from langchain_openai import ChatOpenAI
 
         model = ChatOpenAI(
-            model=settings.code_gen_model,
+            model=model_name or settings.code_gen_model,
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_API_BASE"),
-            temperature=settings.code_gen_temperature
+            temperature=settings.code_gen_temperature if temperature is None else temperature,
+            stream_usage=settings.code_gen_stream
         )
 
-        # 构建提示词
-        prompt = _build_code_generation_prompt(html_content, target_json)
+        # 构建提示词（稳定前缀在前，可变负载在后）
+        messages, prefix_tokens = _build_code_generation_messages(
+            html_content, target_json, prompt_hint, model_name, sample_variations
+        )
 
         # 调用 LLM 生成代码
-        messages = [
-            {"role": "system", "content": "你是一个专业的Python代码生成助手。"},
-            {"role": "user", "content": prompt}
-        ]
-
-        response = model.invoke(messages)
+        if settings.code_gen_stream:
+            generated_code = _generate_code_streaming(model, messages, prefix_tokens)
+        else:
+            response = model.invoke(messages)
+            token_ledger.record("code_generation", count_message_tokens(messages), response, prefix_tokens)
+            generated_code = _strip_markdown_fences(response.content)
 
-        # 提取生成的代码并清理 markdown 标记
-        generated_code = response.content.strip()
-
-        # 移除 markdown 代码块标记
-        if generated_code.startswith("```python"):
-            generated_code = generated_code[len("```python"):].strip()
-        elif generated_code.startswith("```"):
-            generated_code = generated_code[3:].strip()
-
-        if generated_code.endswith("```"):
-            generated_code = generated_code[:-3].strip()
-
-        # 保存生成的代码
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
-        parser_path = output_path / "generated_parser.py"
-        parser_path.write_text(generated_code, encoding='utf-8')
-
-        # 生成配置文件
+        # 生成配置文件（required 沿用合并Schema时按样本出现频率得出的结果）
         config = {
             'version': '1.0',
             'fields': {
                 key: {
                     'type': value.get('type', 'string'),
                     'description': value.get('description', ''),
-                    'required': True
+                    'required': value.get('required', True)
                 }
                 for key, value in target_json.items()
             },
@@ -139,15 +237,22 @@ def generate_parser_code(html_content: str, target_json: Dict, output_dir: str =
                 'retry': 3
             }
         }
-        config_path = output_path / "schema.json"
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
 
-        logger.success(f"代码生成完成: {parser_path}")
+        # 按内容哈希存入注册表，并发生成不会互相覆盖
+        version = ParserRegistry(output_dir).put(
+            generated_code,
+            config,
+            domain=domain,
+            template=template,
+            model=model_name or settings.code_gen_model
+        )
+
+        logger.success(f"代码生成完成: {version['parser_path']}")
 
         return {
-            'parser_path': str(parser_path),
-            'config_path': str(config_path),
+            'parser_path': version['parser_path'],
+            'config_path': version['config_path'],
+            'version_hash': version['hash'],
             'code': generated_code,
             'config': config
         }
@@ -9,6 +9,7 @@ from typing import Dict
 from loguru import logger
 from langchain_core.tools import tool
 from config.settings import settings
+from utils.token_budget import count_message_tokens, token_ledger
 
 
 def _image_to_base64(image_path: str) -> str:
@@ -106,6 +107,7 @@ def extract_json_from_image(image_path: str) -> Dict:
         ]
 
         response = model.invoke(messages)
+        token_ledger.record("vision_extraction", count_message_tokens(messages), response)
 
         # 5. 提取 JSON
         # 处理不同类型的响应
@@ -1,6 +1,8 @@
 from .llm_client import LLMClient
+from .parser_registry import ParserRegistry
 
 __all__ = [
     "LLMClient",
+    "ParserRegistry",
 ]
 
@@ -0,0 +1,131 @@
+"""
+批量解析
+统一调用生成解析器的 parse_many 接口，并在其不可用或中途出错时退化为逐个 parse
+"""
+import time
+import traceback
+from typing import Dict, Iterable, Iterator, List
+
+
+def _outcome(
+    data=None,
+    error: str = None,
+    details: str = '',
+    parse_time_ms: float = None,
+    cpu_time_ms: float = None
+) -> Dict:
+    return {
+        'data': data, 'error': error, 'details': details,
+        'parse_time_ms': parse_time_ms, 'cpu_time_ms': cpu_time_ms,
+    }
+
+
+def _elapsed(start: float, cpu_start: float) -> Dict:
+    return {
+        'parse_time_ms': (time.perf_counter() - start) * 1000,
+        'cpu_time_ms': (time.process_time() - cpu_start) * 1000,
+    }
+
+
+def _parse_one(parser, html: str) -> Dict:
+    """逐个解析单个文档"""
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        data = parser.parse(html)
+    except Exception as e:
+        return _outcome(error=str(e) or type(e).__name__, details=traceback.format_exc(),
+                        **_elapsed(start, cpu_start))
+    return _outcome(data=data, **_elapsed(start, cpu_start))
+
+
+def parse_documents(parser, documents: Iterable[str]) -> Iterator[Dict]:
+    """
+    批量解析文档，按输入顺序逐个产出结果
+
+    优先使用解析器的 parse_many 生成器（复用同一个实例和预编译的选择器）；
+    parse_many 抛出异常时，当前文档记为失败，其余文档改为逐个调用 parse
+
+    Args:
+        parser: WebPageParser 实例
+        documents: HTML 文档序列
+
+    Yields:
+        {'data', 'error', 'details', 'parse_time_ms', 'cpu_time_ms'}，耗时为产出该结果所用的墙钟时间和CPU时间
+    """
+    documents = list(documents)
+    if not documents:
+        return
+    if not hasattr(parser, 'parse_many'):
+        for html in documents:
+            yield _parse_one(parser, html)
+        return
+
+    done = 0
+    results = parser.parse_many(iter(documents))
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        for data in results:
+            yield _outcome(data=data, **_elapsed(start, cpu_start))
+            done += 1
+            if done >= len(documents):
+                break
+            start, cpu_start = time.perf_counter(), time.process_time()
+    except Exception as e:
+        yield _outcome(error=str(e) or type(e).__name__, details=traceback.format_exc(),
+                       **_elapsed(start, cpu_start))
+        done += 1
+    finally:
+        close = getattr(results, 'close', None)
+        if close:
+            close()
+
+    # parse_many 提前结束或出错时，剩余文档逐个解析
+    for html in documents[done:]:
+        yield _parse_one(parser, html)
+
+
+def benchmark_batch_parse(parser, documents: List[str], rounds: int = 3) -> Dict:
+    """
+    对比逐个 parse 与 parse_many 的吞吐量
+
+    每种方式运行 rounds 轮，取最快一轮的耗时
+
+    Returns:
+        {'documents', 'parse_seconds', 'parse_many_seconds', 'parse_docs_per_sec',
+         'parse_many_docs_per_sec', 'speedup'}，解析器没有 parse_many 时相关字段为 None
+    """
+    def best_of(run) -> float:
+        timings = []
+        for _ in range(max(rounds, 1)):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def run_parse():
+        for html in documents:
+            try:
+                parser.parse(html)
+            except Exception:
+                pass
+
+    def run_parse_many():
+        for _ in parse_documents(parser, documents):
+            pass
+
+    count = len(documents)
+    parse_seconds = best_of(run_parse)
+    parse_many_seconds = best_of(run_parse_many) if hasattr(parser, 'parse_many') else None
+
+    return {
+        'documents': count,
+        'parse_seconds': parse_seconds,
+        'parse_many_seconds': parse_many_seconds,
+        'parse_docs_per_sec': count / parse_seconds if parse_seconds else None,
+        'parse_many_docs_per_sec': (
+            count / parse_many_seconds if parse_many_seconds else None
+        ),
+        'speedup': (
+            parse_seconds / parse_many_seconds if parse_many_seconds else None
+        ),
+    }
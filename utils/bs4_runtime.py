@@ -0,0 +1,412 @@
+"""
+BeautifulSoup 兼容运行时
+bs4_transpile 把生成解析器中的 BeautifulSoup 调用改写为本模块的函数，本模块的源码会原样内联到转译后的解析器中，
+因此只能依赖 lxml 和 cssselect，且所有顶层名称（包括导入的模块）都以 _bs / _Bs / _BS 开头，避免与解析器自身的名称冲突
+
+- 文档用 lxml.etree.HTMLParser 构建，元素类为 _BsElement，真值和字符串形式与 bs4 Tag 一致
+- find / find_all 等按 bs4 的匹配规则编译为 XPath（按过滤条件的结构缓存，值通过 XPath 变量传入）
+- select / select_one 通过 cssselect 编译为 XPath
+- 改写后的调用在接收者不是 _BsElement 时（如 dict.get、str.find）回退到原来的方法
+"""
+import re as _bs_re
+from functools import lru_cache as _bs_lru_cache
+from cssselect import HTMLTranslator as _BsHTMLTranslator
+from lxml import etree as _bs_etree
+
+
+class _BsElement(_bs_etree.ElementBase):
+    """lxml 元素，补充与 bs4 Tag 一致的行为"""
+
+    def __bool__(self):
+        # bs4 的 Tag 总为真；lxml 元素按子元素数量判断真值
+        return True
+
+    def __str__(self):
+        return _bs_etree.tostring(self, encoding="unicode", method="html", with_tail=False)
+
+    def __call__(self, *args, **kwargs):
+        return _bs_find_all(self, *args, **kwargs)
+
+    def decompose(self):
+        _bs_remove(self)
+
+    def extract(self):
+        _bs_remove(self)
+        return self
+
+    def has_attr(self, key):
+        return key in self.attrib
+
+
+class _BsEmptyDocument(_BsElement):
+    """空文档的占位根元素，bs4 中空文档不含任何标签，查找时不匹配它本身"""
+
+
+_BS_PARSER = _bs_etree.HTMLParser()
+_BS_PARSER.set_element_class_lookup(_bs_etree.ElementDefaultClassLookup(element=_BsElement))
+_BS_EMPTY_PARSER = _bs_etree.HTMLParser()
+_BS_EMPTY_PARSER.set_element_class_lookup(_bs_etree.ElementDefaultClassLookup(element=_BsEmptyDocument))
+_BS_XML_DECLARATION = _bs_re.compile(r"^\s*<\?xml[^>]*\?>")
+_BS_TRANSLATOR = _BsHTMLTranslator()
+_BS_NON_WHITESPACE = _bs_re.compile(r"\S+")
+_BS_IDENTIFIER = _bs_re.compile(r"^[A-Za-z_][\w.-]*$")
+
+# bs4 按空白拆分为列表的属性
+_BS_MULTI_VALUED = {"class", "accesskey", "dropzone"}
+_BS_MULTI_VALUED_BY_TAG = {
+    "a": {"rel", "rev"}, "link": {"rel", "rev"}, "td": {"headers"}, "th": {"headers"},
+    "form": {"accept-charset"}, "object": {"archive"}, "area": {"rel"}, "icon": {"sizes"},
+    "iframe": {"sandbox"}, "output": {"for"},
+}
+# 按属性过滤时按单个取值匹配的属性（过滤条件中不区分标签）
+_BS_TOKEN_ATTRIBUTES = _BS_MULTI_VALUED | {"rel", "rev", "headers", "accept-charset"}
+# bs4 的 get_text 不包含这些元素中的文本（对元素本身调用时除外）
+_BS_NON_TEXT_TAGS = ("script", "style", "template")
+_BS_TEXT_NODES = _bs_etree.XPath(
+    "descendant-or-self::text()[not(ancestor::script or ancestor::style or ancestor::template)]",
+    smart_strings=False
+)
+_BS_ALL_TEXT_NODES = _bs_etree.XPath("descendant-or-self::text()", smart_strings=False)
+# bs4 构建文档时把只含 ASCII 空白的文本节点折叠为 "\n" 或 " "（pre / textarea 中除外）
+_BS_ASCII_SPACES = " \t\n\r\f"
+_BS_PRESERVES_WHITESPACE = _bs_etree.XPath(
+    "boolean(ancestor-or-self::pre or ancestor-or-self::textarea or descendant::pre or descendant::textarea)"
+)
+_BS_PRESERVED_CONTAINER = _bs_etree.XPath("boolean(ancestor-or-self::pre or ancestor-or-self::textarea)")
+_BS_TEXT_NODES_SMART = _bs_etree.XPath(
+    "descendant-or-self::text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+)
+_BS_ALL_TEXT_NODES_SMART = _bs_etree.XPath("descendant-or-self::text()")
+
+# find 系列方法 -> (XPath 轴, 是否只取第一个, 是否为逆序轴)
+_BS_SEARCHES = {
+    "find": ("descendant", True, False),
+    "find_all": ("descendant", False, False),
+    "find_next_sibling": ("following-sibling", True, False),
+    "find_next_siblings": ("following-sibling", False, False),
+    "find_previous_sibling": ("preceding-sibling", True, True),
+    "find_previous_siblings": ("preceding-sibling", False, True),
+    "find_parent": ("ancestor", True, True),
+    "find_parents": ("ancestor", False, True),
+    "find_next": ("following", True, False),
+    "find_all_next": ("following", False, False),
+    "find_previous": ("preceding", True, True),
+    "find_all_previous": ("preceding", False, True),
+}
+
+
+def _bs_document(markup="", *args, **kwargs):
+    """BeautifulSoup(markup, ...) 的替代：返回根元素 <html>，它同时代表 bs4 中的文档对象"""
+    if hasattr(markup, "read"):
+        markup = markup.read()
+    if isinstance(markup, str):
+        markup = _BS_XML_DECLARATION.sub("", markup, count=1)
+    root = None
+    if markup and markup.strip():
+        try:
+            root = _bs_etree.fromstring(markup, _BS_PARSER)
+        except _bs_etree.XMLSyntaxError:
+            root = None
+    if root is None:
+        root = _bs_etree.fromstring("<html></html>", _BS_EMPTY_PARSER)
+    return root
+
+
+def _bs_is_document(element):
+    return element.getparent() is None and not isinstance(element, _BsEmptyDocument)
+
+
+def _bs_remove(element):
+    """从树中移除元素，保留其后的文本"""
+    parent = element.getparent()
+    if parent is None:
+        return
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+        element.tail = None
+    parent.remove(element)
+
+
+def _bs_attribute(element, key, default=None):
+    value = element.get(key)
+    if value is None:
+        return default
+    if key in _BS_MULTI_VALUED or key in _BS_MULTI_VALUED_BY_TAG.get(element.tag, ()):
+        return _BS_NON_WHITESPACE.findall(value)
+    return value
+
+
+def _bs_collapse(text):
+    if text and not text.strip(_BS_ASCII_SPACES):
+        return "\n" if "\n" in text else " "
+    return text
+
+
+def _bs_strings_of(element, strip=False):
+    if element.tag in _BS_NON_TEXT_TAGS:
+        strings = _BS_ALL_TEXT_NODES(element)
+    else:
+        strings = _BS_TEXT_NODES(element)
+    if strip:
+        return [s.strip() for s in strings if s.strip()]
+    if not _BS_PRESERVES_WHITESPACE(element):
+        return [_bs_collapse(s) for s in strings]
+    # 涉及 pre / textarea 时逐个文本节点判断所在的元素
+    nodes = (_BS_ALL_TEXT_NODES_SMART if element.tag in _BS_NON_TEXT_TAGS else _BS_TEXT_NODES_SMART)(element)
+    return [str(s) if _bs_preserved(s) else _bs_collapse(str(s)) for s in nodes]
+
+
+def _bs_preserved(text):
+    container = text.getparent()
+    if text.is_tail:
+        container = container.getparent()
+    return container is not None and _BS_PRESERVED_CONTAINER(container)
+
+
+def _bs_text_of(element, separator="", strip=False, types=None):
+    return separator.join(_bs_strings_of(element, strip))
+
+
+@_bs_lru_cache(maxsize=2048)
+def _bs_css_xpath(selector, include_self, first):
+    selector = selector.replace(":-soup-contains(", ":contains(")
+    prefix = "descendant-or-self::" if include_self else "descendant::"
+    expression = _BS_TRANSLATOR.css_to_xpath(selector, prefix=prefix)
+    if first:
+        expression = f"({expression})[1]"
+    return _bs_etree.XPath(expression, smart_strings=False)
+
+
+def _bs_css(element, selector, limit=None):
+    matches = _bs_css_xpath(selector, _bs_is_document(element), False)(element)
+    return matches[:limit] if limit else matches
+
+
+def _bs_css_first(element, selector):
+    matches = _bs_css_xpath(selector, _bs_is_document(element), True)(element)
+    return matches[0] if matches else None
+
+
+def _bs_name_test(name, variables):
+    """标签名过滤 -> XPath 节点测试"""
+    if name is None or name is True:
+        return "*"
+    names = [name] if isinstance(name, str) else name
+    if not isinstance(names, (list, tuple, set, frozenset)) or not all(isinstance(n, str) for n in names):
+        raise NotImplementedError(f"lxml 转译不支持的标签名过滤: {name!r}")
+    names = list(names)
+    if len(names) == 1 and _BS_IDENTIFIER.match(names[0]):
+        return names[0]
+    tests = []
+    for n in names:
+        variable = f"v{len(variables)}"
+        variables[variable] = n
+        tests.append(f"name()=${variable}")
+    return f"*[{' or '.join(tests)}]"
+
+
+def _bs_attribute_test(key, value, variables):
+    """属性过滤 -> XPath 谓词"""
+    multi_valued = key in _BS_TOKEN_ATTRIBUTES
+    attribute = f"@{key}" if _BS_IDENTIFIER.match(key) else None
+    if attribute is None:
+        variable = f"v{len(variables)}"
+        variables[variable] = key
+        attribute = f"@*[name()=${variable}]"
+    if value is True:
+        return attribute
+    if value is None or value is False:
+        return f"not({attribute})"
+    values = [value] if isinstance(value, str) else value
+    if not isinstance(values, (list, tuple, set, frozenset)) or not all(isinstance(v, str) for v in values):
+        raise NotImplementedError(f"lxml 转译不支持的属性过滤: {key}={value!r}")
+    tests = []
+    for v in values:
+        variable = f"v{len(variables)}"
+        variables[variable] = v
+        if multi_valued and not _BS_NON_WHITESPACE.fullmatch(v):
+            # 含空白的值与整个属性值（空白归一后）比较
+            tests.append(f"normalize-space({attribute})=${variable}")
+        elif multi_valued:
+            tests.append(f"contains(concat(' ', normalize-space({attribute}), ' '), concat(' ', ${variable}, ' '))")
+        else:
+            tests.append(f"{attribute}=${variable}")
+    return f"({' or '.join(tests)})"
+
+
+@_bs_lru_cache(maxsize=2048)
+def _bs_search_xpath(expression):
+    return _bs_etree.XPath(expression, smart_strings=False)
+
+
+def _bs_search(element, method, args, kwargs):
+    """
+    bs4 find 系列方法：过滤条件编译为 XPath（结构相同的过滤条件共用一个编译结果），按 bs4 的顺序返回
+
+    find / find_all 的位置参数为 (name, attrs, recursive, string, limit)，其余方法为 (name, attrs, string, limit)
+    """
+    axis, first, reverse = _BS_SEARCHES[method]
+    positional = ("name", "attrs", "recursive", "string", "limit") if axis == "descendant" \
+        else ("name", "attrs", "string", "limit")
+    kwargs = dict(kwargs, **dict(zip(positional, args)))
+    name = kwargs.pop("name", None)
+    attrs = kwargs.pop("attrs", None)
+    recursive = kwargs.pop("recursive", True)
+    limit = kwargs.pop("limit", None)
+    string = kwargs.pop("string", None)
+    text = kwargs.pop("text", None)
+    if string is not None or text is not None:
+        raise NotImplementedError("lxml 转译不支持按文本内容过滤（string / text）")
+
+    filters = {}
+    if isinstance(attrs, dict):
+        filters.update(attrs)
+    elif attrs is not None:
+        filters["class"] = attrs
+    if "class_" in kwargs:
+        kwargs["class"] = kwargs.pop("class_")
+    filters.update(kwargs)
+
+    if axis == "descendant":
+        if _bs_is_document(element):
+            axis = "descendant-or-self" if recursive else "self"
+        elif not recursive:
+            axis = "child"
+
+    variables = {}
+    test = _bs_name_test(name, variables)
+    predicates = [f"[{_bs_attribute_test(key, value, variables)}]" for key, value in filters.items()]
+    expression = f"{axis}::{test}{''.join(predicates)}"
+    if first or limit == 1:
+        expression += "[1]"
+
+    matches = _bs_search_xpath(expression)(element, **variables)
+    if first:
+        # 逆序轴上的 [1] 即最近的节点
+        return matches[0] if matches else None
+    if reverse:
+        matches.reverse()
+    return matches[:limit] if limit else matches
+
+
+def _bs_find(target, *args, **kwargs):
+    if isinstance(target, _BsElement):
+        return _bs_search(target, "find", args, kwargs)
+    return target.find(*args, **kwargs)
+
+
+def _bs_find_all(target, *args, **kwargs):
+    if isinstance(target, _BsElement):
+        return _bs_search(target, "find_all", args, kwargs)
+    return target.find_all(*args, **kwargs)
+
+
+def _bs_find_related(target, method, *args, **kwargs):
+    """find_parent / find_next_sibling 等沿其他方向查找的方法"""
+    if isinstance(target, _BsElement):
+        return _bs_search(target, method, args, kwargs)
+    return getattr(target, method)(*args, **kwargs)
+
+
+def _bs_select(target, *args, **kwargs):
+    if isinstance(target, _BsElement):
+        return _bs_css(target, *args, **kwargs)
+    return target.select(*args, **kwargs)
+
+
+def _bs_select_one(target, *args, **kwargs):
+    if isinstance(target, _BsElement):
+        return _bs_css_first(target, *args, **kwargs)
+    return target.select_one(*args, **kwargs)
+
+
+def _bs_get(target, *args, **kwargs):
+    if isinstance(target, _BsElement):
+        return _bs_attribute(target, *args, **kwargs)
+    return target.get(*args, **kwargs)
+
+
+def _bs_get_text(target, *args, **kwargs):
+    if isinstance(target, _BsElement):
+        return _bs_text_of(target, *args, **kwargs)
+    return target.get_text(*args, **kwargs)
+
+
+def _bs_text(target):
+    if isinstance(target, _BsElement):
+        return _bs_text_of(target)
+    return target.text
+
+
+def _bs_string(target):
+    """bs4 Tag.string：只有一个子节点时返回其文本，否则为 None"""
+    if not isinstance(target, _BsElement):
+        return target.string
+    children = len(target)
+    if children == 0:
+        text = target.text
+    elif children == 1 and not target.text and not target[0].tail:
+        child = target[0]
+        if isinstance(child, _BsElement):
+            return _bs_string(child)
+        text = child.text
+    else:
+        return None
+    return text if _BS_PRESERVED_CONTAINER(target) else _bs_collapse(text)
+
+
+def _bs_strings(target, strip=False):
+    if isinstance(target, _BsElement):
+        return iter(_bs_strings_of(target, strip))
+    return target.stripped_strings if strip else target.strings
+
+
+def _bs_attrs(target):
+    if isinstance(target, _BsElement):
+        return {key: _bs_attribute(target, key) for key in target.attrib}
+    return target.attrs
+
+
+def _bs_item(target, key):
+    if isinstance(target, _BsElement):
+        value = _bs_attribute(target, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+    return target[key]
+
+
+def _bs_name(target):
+    return target.tag if isinstance(target, _BsElement) else target.name
+
+
+def _bs_parent(target):
+    return target.getparent() if isinstance(target, _BsElement) else target.parent
+
+
+def _bs_child(target, name):
+    """soup.title 形式的子标签访问"""
+    if isinstance(target, _BsElement):
+        return _bs_search(target, "find", (name,), {})
+    return getattr(target, name)
+
+
+class _BsSelector:
+    """soupsieve.compile 的替代"""
+
+    def __init__(self, pattern, *args, **kwargs):
+        self.pattern = pattern
+
+    def select(self, tag, limit=0):
+        return _bs_css(tag, self.pattern, limit or None)
+
+    def select_one(self, tag):
+        return _bs_css_first(tag, self.pattern)
+
+
+def _bs_compile(pattern, *args, **kwargs):
+    return _BsSelector(pattern)
@@ -0,0 +1,454 @@
+"""
+BeautifulSoup -> lxml 转译
+基于AST把生成解析器中常见的 BeautifulSoup 用法改写为 lxml / cssselect 实现（运行时见 bs4_runtime，内联到转译结果中），
+遇到无法等价改写的用法时标记为不可转译。转译结果需要在缓存页面上与原解析器逐页比对一致后才能采用
+"""
+import ast
+import inspect
+import json
+from collections import Counter
+from typing import Dict, List, Optional
+from cssselect import HTMLTranslator
+from . import bs4_runtime
+from .parser_lint import _is_main_guard
+
+
+# 改写为运行时函数的方法调用：方法名 -> 运行时函数
+_METHOD_CALLS = {
+    "select_one": "_bs_select_one",
+    "select": "_bs_select",
+    "find": "_bs_find",
+    "findChild": "_bs_find",
+    "find_all": "_bs_find_all",
+    "findAll": "_bs_find_all",
+    "findChildren": "_bs_find_all",
+    "get_text": "_bs_get_text",
+    "getText": "_bs_get_text",
+    "get": "_bs_get",
+}
+
+# 沿其他方向查找的方法，改写为 _bs_find_related(接收者, 方法名, ...)
+_RELATED_CALLS = {
+    name: name for name in (
+        "find_parent", "find_parents", "find_next_sibling", "find_next_siblings",
+        "find_previous_sibling", "find_previous_siblings", "find_next", "find_all_next",
+        "find_previous", "find_all_previous",
+    )
+}
+_RELATED_CALLS.update({
+    "findParent": "find_parent", "findParents": "find_parents",
+    "findNextSibling": "find_next_sibling", "findNextSiblings": "find_next_siblings",
+    "findPreviousSibling": "find_previous_sibling", "findPreviousSiblings": "find_previous_siblings",
+    "findNext": "find_next", "findAllNext": "find_all_next",
+    "findPrevious": "find_previous", "findAllPrevious": "find_all_previous",
+})
+
+# 接受 string / text 过滤条件的方法（按文本过滤无法转译）
+_SEARCH_METHODS = {"find", "findChild", "find_all", "findAll", "findChildren", *_RELATED_CALLS}
+
+# 属性访问 -> 运行时函数
+_ATTRIBUTE_ACCESS = {
+    "text": "_bs_text",
+    "string": "_bs_string",
+    "name": "_bs_name",
+    "parent": "_bs_parent",
+    "attrs": "_bs_attrs",
+}
+
+# soup.title 形式的子标签访问
+_TAG_NAMES = {
+    "head", "body", "title", "h1", "h2", "h3", "h4", "h5", "h6", "article", "main", "header", "footer",
+    "nav", "section", "aside", "table", "thead", "tbody", "tr", "td", "th", "ul", "ol", "li", "dl", "dt", "dd",
+    "img", "time", "span", "div", "p", "a", "meta", "figure", "figcaption", "blockquote", "pre", "strong",
+}
+
+# 无法等价转译的 bs4 用法（主要是会产出文本节点的导航）
+_UNSUPPORTED = {
+    "next_sibling", "previous_sibling", "next_siblings", "previous_siblings",
+    "next_element", "previous_element", "next_elements", "previous_elements",
+    "nextSibling", "previousSibling", "children", "contents", "descendants", "parents",
+    "replace_with", "replaceWith", "unwrap", "wrap", "insert_before", "insert_after",
+    "prettify", "decode_contents", "encode_contents", "new_tag", "new_string", "smooth", "css",
+}
+
+# 可改写的 soupsieve 函数
+_SOUPSIEVE_CALLS = {"compile", "select", "select_one"}
+
+# 查找方法中不是过滤条件的关键字参数
+_NON_FILTER_KEYWORDS = {"limit", "recursive"}
+
+
+def _helper_call(name: str, node: ast.AST, args: List[ast.AST], keywords: List[ast.keyword] = None) -> ast.Call:
+    call = ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=list(args), keywords=list(keywords or []))
+    return ast.copy_location(call, node)
+
+
+def _is_regex_or_callable(node: ast.AST) -> bool:
+    """re.compile(...) 或 lambda 表达式"""
+    if isinstance(node, ast.Lambda):
+        return True
+    if isinstance(node, ast.Call):
+        func = node.func
+        return (isinstance(func, ast.Attribute) and func.attr == "compile") or (
+            isinstance(func, ast.Name) and func.id == "compile"
+        )
+    return False
+
+
+def _constant_string(node: Optional[ast.AST]) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+class _Imports(ast.NodeVisitor):
+    """
+    收集导入：BeautifulSoup 的别名、bs4 / soupsieve 模块别名、其他从 bs4 导入的名称和全部模块名；
+    另外收集函数名和赋值为正则表达式或 lambda 的名称，这些名称作为查找过滤条件时无法转译
+    """
+
+    def __init__(self):
+        self.soup_names = set()
+        self.bs4_modules = set()
+        self.soupsieve_modules = set()
+        self.bs4_other_names = set()
+        self.module_names = set()
+        self.callable_names = set()
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self.callable_names.add(node.name)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node: ast.Assign):
+        if _is_regex_or_callable(node.value):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.callable_names.add(target.id)
+                elif isinstance(target, ast.Attribute):
+                    self.callable_names.add(target.attr)
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            bound = alias.asname or alias.name.split(".")[0]
+            self.module_names.add(bound)
+            if alias.name == "bs4":
+                self.bs4_modules.add(bound)
+            elif alias.name == "soupsieve":
+                self.soupsieve_modules.add(bound)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        for alias in node.names:
+            bound = alias.asname or alias.name
+            self.module_names.add(bound)
+            if node.module == "bs4" and alias.name == "BeautifulSoup":
+                self.soup_names.add(bound)
+            elif node.module in ("bs4", "soupsieve") or (node.module or "").startswith("bs4."):
+                self.bs4_other_names.add(bound)
+
+
+class _Transpiler(ast.NodeTransformer):
+    """把 BeautifulSoup 用法改写为 bs4_runtime 中的函数"""
+
+    def __init__(self, imports: _Imports):
+        self.imports = imports
+        self.rewrites: Counter = Counter()
+        self.reasons: List[str] = []
+        self._translator = HTMLTranslator()
+        # 接收者是这些名称时不改写（模块、self、cls）
+        self._skip_receivers = imports.module_names | {"self", "cls"}
+
+    def _unsupported(self, node: ast.AST, message: str):
+        self.reasons.append(f"第 {getattr(node, 'lineno', '?')} 行: {message}")
+
+    def _skip_receiver(self, node: ast.AST) -> bool:
+        return isinstance(node, ast.Name) and node.id in self._skip_receivers
+
+    def _is_soup_constructor(self, func: ast.AST) -> bool:
+        if isinstance(func, ast.Name):
+            return func.id in self.imports.soup_names
+        return (
+            isinstance(func, ast.Attribute) and func.attr == "BeautifulSoup"
+            and isinstance(func.value, ast.Name) and func.value.id in self.imports.bs4_modules
+        )
+
+    def _check_selector(self, node: ast.AST, selector: Optional[ast.AST]):
+        """常量选择器在转译时检查能否转换为 XPath"""
+        css = _constant_string(selector)
+        if css is None:
+            return
+        try:
+            self._translator.css_to_xpath(css.replace(":-soup-contains(", ":contains("))
+        except Exception as e:
+            self._unsupported(node, f"CSS 选择器 {css!r} 无法转换为 XPath: {e}")
+
+    def _filter_is_dynamic(self, node: ast.AST) -> bool:
+        """过滤条件是正则表达式或可调用对象（运行时只支持字符串、列表和 True/False/None）"""
+        if _is_regex_or_callable(node):
+            return True
+        if isinstance(node, ast.Name):
+            return node.id in self.imports.callable_names
+        if isinstance(node, ast.Attribute):
+            return node.attr in self.imports.callable_names
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return any(self._filter_is_dynamic(e) for e in node.elts)
+        if isinstance(node, ast.Dict):
+            return any(self._filter_is_dynamic(v) for v in node.values)
+        return False
+
+    def _check_filters(self, node: ast.Call, method: str):
+        """查找方法的标签名 / 属性过滤条件（前两个位置参数和其余关键字参数）"""
+        filters = node.args[:2] + [k.value for k in node.keywords if k.arg not in _NON_FILTER_KEYWORDS]
+        if any(self._filter_is_dynamic(f) for f in filters):
+            self._unsupported(node, f"{method}(...) 使用正则表达式或函数作为过滤条件")
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr in _SEARCH_METHODS and not self._skip_receiver(func.value):
+            self._check_filters(node, func.attr)
+        if isinstance(func, ast.Attribute):
+            # 方法名本身不按属性访问改写（例如 x.text(...) 不是 .text 属性）
+            func.value = self.visit(func.value)
+        else:
+            node.func = self.visit(func)
+        node.args = [self.visit(arg) for arg in node.args]
+        node.keywords = [self.visit(keyword) for keyword in node.keywords]
+
+        if self._is_soup_constructor(func):
+            self.rewrites["BeautifulSoup"] += 1
+            return _helper_call("_bs_document", node, node.args, node.keywords)
+        if not isinstance(func, ast.Attribute):
+            return node
+
+        owner, method = func.value, func.attr
+        if isinstance(owner, ast.Name) and owner.id in self.imports.soupsieve_modules:
+            return self._soupsieve_call(node, owner.id, method)
+        if isinstance(owner, ast.Name) and owner.id in self.imports.bs4_modules:
+            self._unsupported(node, f"不支持的 bs4 调用 {owner.id}.{method}(...)")
+            return node
+        if self._skip_receiver(owner):
+            return node
+
+        if method in _SEARCH_METHODS and any(
+            k.arg in ("string", "text") and not (isinstance(k.value, ast.Constant) and k.value.value is None)
+            for k in node.keywords
+        ):
+            self._unsupported(node, f"{method}(...) 按文本内容过滤（string / text）")
+        if method in ("select", "select_one"):
+            self._check_selector(node, node.args[0] if node.args else None)
+
+        if method in _METHOD_CALLS:
+            self.rewrites[method] += 1
+            return _helper_call(_METHOD_CALLS[method], node, [owner, *node.args], node.keywords)
+        if method in _RELATED_CALLS:
+            self.rewrites[method] += 1
+            return _helper_call(
+                "_bs_find_related", node, [owner, ast.Constant(_RELATED_CALLS[method]), *node.args], node.keywords
+            )
+        if method in _UNSUPPORTED:
+            self._unsupported(node, f"不支持的 BeautifulSoup 用法 .{method}(...)")
+        return node
+
+    def _soupsieve_call(self, node: ast.Call, module: str, function: str) -> ast.AST:
+        if function not in _SOUPSIEVE_CALLS:
+            self._unsupported(node, f"不支持的 soupsieve 调用 {module}.{function}(...)")
+            return node
+        self._check_selector(node, node.args[0] if node.args else None)
+        self.rewrites[f"soupsieve.{function}"] += 1
+        if function == "compile":
+            return _helper_call("_bs_compile", node, node.args, node.keywords)
+        if len(node.args) < 2:
+            self._unsupported(node, f"{module}.{function}(...) 缺少位置参数")
+            return node
+        # soupsieve.select(选择器, 标签) -> _bs_select(标签, 选择器)
+        selector, tag = node.args[0], node.args[1]
+        keywords = [k for k in node.keywords if k.arg == "limit"] if function == "select" else []
+        helper = "_bs_select" if function == "select" else "_bs_select_one"
+        return _helper_call(helper, node, [tag, selector], keywords)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        node.value = self.visit(node.value)
+        if not isinstance(node.ctx, ast.Load) or self._skip_receiver(node.value):
+            return node
+
+        attr = node.attr
+        if attr in _ATTRIBUTE_ACCESS:
+            self.rewrites[f".{attr}"] += 1
+            return _helper_call(_ATTRIBUTE_ACCESS[attr], node, [node.value])
+        if attr in ("strings", "stripped_strings"):
+            self.rewrites[f".{attr}"] += 1
+            return _helper_call("_bs_strings", node, [node.value, ast.Constant(attr == "stripped_strings")])
+        if attr in _TAG_NAMES:
+            self.rewrites[".<tag>"] += 1
+            return _helper_call("_bs_child", node, [node.value, ast.Constant(attr)])
+        if attr in _UNSUPPORTED:
+            self._unsupported(node, f"不支持的 BeautifulSoup 用法 .{attr}")
+        return node
+
+    def visit_Subscript(self, node: ast.Subscript):
+        node.value = self.visit(node.value)
+        node.slice = self.visit(node.slice)
+        key = _constant_string(node.slice)
+        if key is None or not isinstance(node.ctx, ast.Load) or self._skip_receiver(node.value):
+            return node
+        self.rewrites["[attr]"] += 1
+        return _helper_call("_bs_item", node, [node.value, node.slice])
+
+
+def _runtime_statements() -> List[ast.stmt]:
+    """运行时模块的语句（去掉模块文档字符串）"""
+    body = ast.parse(inspect.getsource(bs4_runtime)).body
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant):
+        body = body[1:]
+    return body
+
+
+def _used_names(nodes: List[ast.AST]) -> set:
+    return {n.id for node in nodes for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def _drop_unused_imports(module: ast.Module, candidates: set):
+    """删除不再使用的 bs4 / soupsieve 顶层导入"""
+    used = _used_names([s for s in module.body if not isinstance(s, (ast.Import, ast.ImportFrom))])
+    body = []
+    for statement in module.body:
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            statement.names = [
+                alias for alias in statement.names
+                if (alias.asname or alias.name.split(".")[0]) not in candidates
+                or (alias.asname or alias.name.split(".")[0]) in used
+            ]
+            if not statement.names:
+                continue
+        body.append(statement)
+    module.body = body
+
+
+def _insert_runtime(module: ast.Module):
+    """运行时代码插入到开头的导入语句之后"""
+    index = 0
+    for i, statement in enumerate(module.body):
+        is_docstring = i == 0 and isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant)
+        if isinstance(statement, (ast.Import, ast.ImportFrom)) or is_docstring:
+            index = i + 1
+        else:
+            break
+    module.body[index:index] = _runtime_statements()
+
+
+def transpile_parser_code(code: str) -> Dict:
+    """
+    把基于 BeautifulSoup 的解析器代码转译为基于 lxml 的代码
+
+    改写 BeautifulSoup(...)、select / select_one、find / find_all（及 find_parent 等）、get_text、.get(attr)、
+    .text / .string / .name / .parent / .attrs、soup.title 形式的子标签访问、tag['attr'] 和 soupsieve.compile；
+    改写后的调用在运行时检查接收者类型，dict.get、str.find 等非 bs4 调用保持原样。
+    if __name__ == '__main__' 部分不改写
+
+    Args:
+        code: 解析器代码
+
+    Returns:
+        {'transpilable', 'code'（不可转译时为 None）, 'reasons', 'rewrites': {用法: 改写次数}}
+    """
+    result = {'transpilable': False, 'code': None, 'reasons': [], 'rewrites': {}}
+    try:
+        module = ast.parse(code)
+    except SyntaxError as e:
+        result['reasons'].append(f"语法错误: {e}")
+        return result
+
+    imports = _Imports()
+    imports.visit(module)
+    if not imports.soup_names and not imports.bs4_modules:
+        result['reasons'].append("解析器未使用 BeautifulSoup")
+        return result
+
+    collisions = sorted({
+        name for name in _used_names([module]) | {
+            n.name for n in ast.walk(module) if isinstance(n, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef))
+        } if name.lower().startswith("_bs")
+    })
+    if collisions:
+        result['reasons'].append(f"解析器中的名称与转译运行时冲突: {', '.join(collisions)}")
+        return result
+
+    transpiler = _Transpiler(imports)
+    module.body = [
+        statement if _is_main_guard(statement) else transpiler.visit(statement)
+        for statement in module.body
+    ]
+
+    # 改写后仍直接引用 bs4 的名称（如 isinstance(x, Tag)、BeautifulSoup 作为参数传递）无法转译
+    parse_path = [s for s in module.body if not _is_main_guard(s) and not isinstance(s, (ast.Import, ast.ImportFrom))]
+    leftover = _used_names(parse_path) & (
+        imports.soup_names | imports.bs4_modules | imports.soupsieve_modules | imports.bs4_other_names
+    )
+    for name in sorted(leftover):
+        transpiler.reasons.append(f"解析路径中仍直接使用 {name}")
+
+    result['rewrites'] = dict(transpiler.rewrites)
+    result['reasons'] = transpiler.reasons
+    if transpiler.reasons:
+        return result
+
+    _drop_unused_imports(
+        module, imports.soup_names | imports.bs4_modules | imports.soupsieve_modules | imports.bs4_other_names
+    )
+    _insert_runtime(module)
+    ast.fix_missing_locations(module)
+    transpiled = ast.unparse(module) + "\n"
+    try:
+        compile(transpiled, "<transpiled parser>", "exec")
+    except SyntaxError as e:
+        result['reasons'].append(f"转译结果无法编译: {e}")
+        return result
+
+    result['transpilable'] = True
+    result['code'] = transpiled
+    return result
+
+
+def _canonical(data) -> str:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def compare_outcomes(original: List[Dict], candidate: List[Dict], max_mismatches: int = 10) -> Dict:
+    """
+    逐页比较两个解析器的批量解析结果（parse_documents 的输出）
+
+    两边都失败视为一致；一边失败、或解析数据（按 JSON 规范化后）不同视为不一致
+
+    Returns:
+        {'equivalent', 'pages', 'mismatched_pages', 'mismatches': [{'index', 'fields', 'original_error', 'candidate_error'}]}
+    """
+    mismatches = []
+    mismatched = 0
+    for index, (left, right) in enumerate(zip(original, candidate)):
+        if left['error'] and right['error']:
+            continue
+        if not left['error'] and not right['error'] and _canonical(left['data']) == _canonical(right['data']):
+            continue
+        mismatched += 1
+        if len(mismatches) >= max_mismatches:
+            continue
+        fields = []
+        if isinstance(left['data'], dict) and isinstance(right['data'], dict):
+            fields = sorted(
+                key for key in left['data'].keys() | right['data'].keys()
+                if _canonical(left['data'].get(key)) != _canonical(right['data'].get(key))
+            )
+        mismatches.append({
+            'index': index,
+            'fields': fields,
+            'original_error': left['error'],
+            'candidate_error': right['error'],
+        })
+    return {
+        'equivalent': mismatched == 0 and len(original) == len(candidate),
+        'pages': len(original),
+        'mismatched_pages': mismatched,
+        'mismatches': mismatches,
+    }
@@ -0,0 +1,413 @@
+"""
+批量解析
+将已接受的解析器应用到存档的HTML语料（目录、glob、tar 包或 JSONL），
+文档分块后在沙箱进程池中并行解析，结果按输入顺序流式写出（JSONL，或 Parquet / Arrow 分片），
+并定期保存可恢复的检查点
+"""
+import glob
+import gzip
+import json
+import os
+import tarfile
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+from .hashing import content_hash
+from .sandbox import SandboxPool
+
+
+# 目录和 glob 输入中视为HTML文档的文件后缀
+HTML_SUFFIXES = (".html", ".htm", ".xhtml")
+_TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+_JSONL_SUFFIXES = (".jsonl", ".ndjson", ".jsonl.gz", ".ndjson.gz")
+# JSONL 输入中HTML内容和文档ID的候选键
+_HTML_KEYS = ("html", "content", "body")
+_ID_KEYS = ("id", "url", "path")
+# 结果统计中保留的不同错误数
+_MAX_ERROR_KINDS = 20
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace")
+
+
+def _iter_files(paths: List[Path], base: Optional[Path]) -> Iterator[Tuple[str, str]]:
+    for path in paths:
+        doc_id = str(path.relative_to(base)) if base else str(path)
+        yield doc_id, _decode(path.read_bytes())
+
+
+def _iter_tar(path: Path) -> Iterator[Tuple[str, str]]:
+    """按存档顺序流式读取 tar 包中的文件，不解压到磁盘"""
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            f = archive.extractfile(member)
+            if f is not None:
+                yield member.name, _decode(f.read())
+
+
+def _iter_jsonl(path: Path) -> Iterator[Tuple[str, str]]:
+    """读取 JSONL：每行一个对象，HTML 取自 html/content/body，ID 取自 id/url/path（否则为行号）"""
+    opener = gzip.open if path.name.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            html = next((record[k] for k in _HTML_KEYS if isinstance(record.get(k), str)), None)
+            if html is None:
+                raise ValueError(f"{path}:{line_no} 缺少HTML内容（{'/'.join(_HTML_KEYS)}）")
+            doc_id = next((str(record[k]) for k in _ID_KEYS if record.get(k) is not None), f"{path.name}:{line_no}")
+            yield doc_id, html
+
+
+def _list_files(source: str) -> Optional[Tuple[List[Path], Optional[Path]]]:
+    """目录和 glob 输入中的文档文件（已排序）及计算文档ID的基准目录，其他输入返回 None"""
+    path = Path(source)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("*") if p.is_file() and p.name.lower().endswith(HTML_SUFFIXES))
+        return files, path
+    if not path.is_file() and glob.has_magic(source):
+        return sorted(Path(p) for p in glob.glob(source, recursive=True) if os.path.isfile(p)), None
+    return None
+
+
+def input_fingerprint(source: str) -> Dict:
+    """
+    输入的指纹，用于判断检查点是否仍对应同一份输入
+
+    单个文件（tar 包、JSONL、HTML）取大小和修改时间；目录和 glob 取文件数以及首末文档ID
+    """
+    listed = _list_files(source)
+    if listed is None:
+        path = Path(source)
+        if not path.is_file():
+            raise FileNotFoundError(f"找不到输入: {source}")
+        stat = path.stat()
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    files, base = listed
+    ids = [str(p.relative_to(base)) if base else str(p) for p in (files[:1] + files[-1:])]
+    return {'files': len(files), 'first': ids[0] if ids else None, 'last': ids[-1] if ids else None}
+
+
+def iter_documents(source: str) -> Iterator[Tuple[str, str]]:
+    """
+    按确定的顺序遍历输入中的文档
+
+    Args:
+        source: 目录（递归查找 .html/.htm/.xhtml）、glob 模式、tar 包（可压缩）、JSONL（可 gzip）或单个HTML文件
+
+    Yields:
+        (文档ID, HTML)
+    """
+    path = Path(source)
+    name = path.name.lower()
+    listed = _list_files(source)
+    if listed is not None:
+        return _iter_files(*listed)
+    if path.is_file() and name.endswith(_TAR_SUFFIXES):
+        return _iter_tar(path)
+    if path.is_file() and name.endswith(_JSONL_SUFFIXES):
+        return _iter_jsonl(path)
+    if path.is_file():
+        return _iter_files([path], None)
+    raise FileNotFoundError(f"找不到输入: {source}")
+
+
+def _chunks(documents: Iterator[Tuple[str, str]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _atomic_write_json(path: Path, obj: Dict):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonlResultWriter:
+    """
+    JSONL 结果写入器
+
+    每个文档一行 {'id', 'data', 'error', 'parse_time_ms'}；检查点记录已写入的字节数，
+    恢复时截断检查点之后写了一半的内容
+    """
+
+    format = "jsonl"
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def open(self, state: Optional[Dict] = None):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if state:
+            self._file = open(self.path, "r+b")
+            self._file.truncate(state['bytes'])
+            self._file.seek(state['bytes'])
+        else:
+            self._file = open(self.path, "wb")
+
+    def write(self, ids: List[str], outcomes: List[Dict]):
+        lines = [
+            json.dumps({
+                'id': doc_id,
+                'data': outcome['data'],
+                'error': outcome['error'],
+                'parse_time_ms': outcome['parse_time_ms'],
+            }, ensure_ascii=False, default=str)
+            for doc_id, outcome in zip(ids, outcomes)
+        ]
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def checkpoint(self, final: bool = False) -> Optional[Dict]:
+        """
+        落盘并返回恢复所需的状态
+
+        写入器还有未落盘的内容时返回 None（不更新检查点）；JSONL 每次都可以落盘
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'bytes': self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class BulkParseRunner:
+    """
+    批量解析运行器
+
+    - 文档按 chunk_size 分块，同时保持 2 × workers 个块在途，每块在一个沙箱工作进程中解析
+    - 结果按输入顺序写出；每写完一块更新检查点（已完成的文档数和写入器状态）
+    - resume 时校验输入和解析器哈希，跳过已完成的文档并从检查点继续写入
+    """
+
+    def __init__(
+        self,
+        parser_path: str,
+        workers: int = None,
+        chunk_size: int = 64,
+        cpu_seconds: float = 10.0,
+        memory_mb: int = 1024,
+        timeout_seconds: float = 30.0,
+        progress_seconds: float = 10.0
+    ):
+        self.parser_path = str(parser_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.progress_seconds = progress_seconds
+        self._pool_options = {
+            'cpu_seconds': cpu_seconds, 'memory_mb': memory_mb, 'timeout_seconds': timeout_seconds,
+        }
+
+    @staticmethod
+    def checkpoint_path(output_path: str) -> Path:
+        return Path(f"{output_path}.checkpoint.json")
+
+    def run(self, source: str, output_path: str, resume: bool = True, writer=None, monitor=None) -> Dict:
+        """
+        解析输入中的全部文档
+
+        Args:
+            source: 输入（见 iter_documents）
+            output_path: 输出路径
+            resume: 存在检查点时从检查点继续
+            writer: 结果写入器（默认为 JSONL，列式输出见 columnar_output.ColumnarResultWriter）
+            monitor: 字段漂移监控器（见 drift_monitor），每块结果写出后送入，输出进度时和结束时检查
+
+        Returns:
+            {'documents', 'errors', 'resumed_from', 'seconds', 'docs_per_sec', 'error_counts', 'output_path'}，
+            有监控器时另含 'drift'（漂移报告）
+        """
+        writer = writer or JsonlResultWriter(output_path)
+        parser_hash = content_hash(Path(self.parser_path).read_text(encoding="utf-8"))
+        checkpoint_file = self.checkpoint_path(output_path)
+        job = {
+            'source': str(source), 'input': input_fingerprint(source),
+            'parser_hash': parser_hash, 'format': writer.format,
+        }
+
+        state = None
+        completed = 0
+        if resume and checkpoint_file.exists():
+            saved = json.loads(checkpoint_file.read_text(encoding="utf-8"))
+            saved_job = saved.get('job') or {}
+            if saved_job.get('input') != job['input'] and {**saved_job, 'input': job['input']} == job:
+                raise ValueError(
+                    f"输入内容在检查点之后发生了变化（{saved_job.get('input')} -> {job['input']}），"
+                    f"请使用 --no-resume 重新开始: {checkpoint_file}"
+                )
+            if saved_job != job:
+                raise ValueError(f"检查点与当前任务不一致（输入、解析器或输出格式不同）: {checkpoint_file}")
+            state, completed = saved['writer_state'], saved['completed']
+            logger.info(f"从检查点继续: 已完成 {completed} 个文档")
+
+        if monitor is not None and not monitor.mark_fed(output_path) and not completed:
+            # 从头重新解析到同一输出时，之前的结果已经统计过
+            logger.warning(f"该输出之前已送入字段漂移监控，本次不再送入: {output_path}")
+            monitor = None
+
+        documents = iter_documents(source)
+        for _ in range(completed):
+            if next(documents, None) is None:
+                break
+
+        stats = {
+            'documents': 0, 'errors': 0, 'resumed_from': completed, 'seconds': 0.0,
+            'docs_per_sec': None, 'error_counts': {}, 'output_path': str(output_path),
+        }
+        start = last_report = time.perf_counter()
+        pool = SandboxPool(workers=self.workers, **self._pool_options)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        writer.open(state)
+        try:
+            chunks = _chunks(documents, self.chunk_size)
+            pending = deque()
+
+            def submit_next() -> bool:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return False
+                ids = [doc_id for doc_id, _ in chunk]
+                htmls = [h for _, h in chunk]
+                pending.append((ids, htmls, executor.submit(pool.parse_chunk, self.parser_path, htmls)))
+                return True
+
+            while len(pending) < self.workers * 2 and submit_next():
+                pass
+
+            while pending:
+                ids, htmls, future = pending.popleft()
+                outcomes = future.result()
+                submit_next()
+
+                writer.write(ids, outcomes)
+                if monitor is not None:
+                    monitor.observe_chunk(ids, outcomes, htmls)
+                completed += len(ids)
+                self._save_checkpoint(checkpoint_file, job, completed, writer.checkpoint())
+                self._count(stats, outcomes)
+
+                now = time.perf_counter()
+                if now - last_report >= self.progress_seconds:
+                    last_report = now
+                    rate = stats['documents'] / (now - start)
+                    logger.info(
+                        f"已解析 {completed} 个文档（本次 {stats['documents']}），"
+                        f"{rate:.1f} 文档/秒，错误 {stats['errors']}"
+                    )
+                    if monitor is not None:
+                        monitor.check_and_alert()
+                        monitor.save()
+
+            self._save_checkpoint(checkpoint_file, job, completed, writer.checkpoint(final=True))
+            if monitor is not None:
+                stats['drift'] = monitor.check_and_alert()
+        finally:
+            if monitor is not None:
+                monitor.save()
+            writer.close()
+            executor.shutdown(wait=False, cancel_futures=True)
+            pool.close()
+
+        stats['seconds'] = time.perf_counter() - start
+        if stats['seconds'] > 0:
+            stats['docs_per_sec'] = stats['documents'] / stats['seconds']
+        logger.success(
+            f"批量解析完成: {stats['documents']} 个文档，错误 {stats['errors']}，"
+            f"耗时 {stats['seconds']:.1f}s（{stats['docs_per_sec'] or 0:.1f} 文档/秒），输出 {output_path}"
+        )
+        return stats
+
+    @staticmethod
+    def _save_checkpoint(path: Path, job: Dict, completed: int, writer_state: Optional[Dict]):
+        if writer_state is not None:
+            _atomic_write_json(path, {'job': job, 'completed': completed, 'writer_state': writer_state})
+
+    @staticmethod
+    def _count(stats: Dict, outcomes: List[Dict]):
+        stats['documents'] += len(outcomes)
+        for outcome in outcomes:
+            if not outcome['error']:
+                continue
+            stats['errors'] += 1
+            error = outcome['error'][:200]
+            counts = stats['error_counts']
+            if error in counts or len(counts) < _MAX_ERROR_KINDS:
+                counts[error] = counts.get(error, 0) + 1
+
+
+def bulk_parse(
+    parser_path: str,
+    source: str,
+    output_path: str,
+    resume: bool = True,
+    output_format: str = "jsonl",
+    schema_path: str = None,
+    compression: str = "zstd",
+    row_group_size: int = 10000,
+    row_groups_per_file: int = 10,
+    drift_monitor: bool = False,
+    **options
+) -> Dict:
+    """
+    批量解析的便捷入口
+
+    Args:
+        parser_path: 解析器代码路径
+        source: 输入（目录、glob、tar 包、JSONL 或单个HTML文件）
+        output_path: 输出路径（jsonl 为文件，parquet / arrow 为分片目录）
+        resume: 存在检查点时从检查点继续
+        output_format: jsonl / parquet / arrow
+        schema_path: 列式输出使用的 Schema 配置（默认从注册表查找解析器对应的配置）
+        compression: 列式输出的压缩算法（none 表示不压缩）
+        row_group_size: 列式输出每个行组的行数
+        row_groups_per_file: 列式输出每个分片文件的行组数
+        drift_monitor: 是否把结果送入解析器版本的字段漂移监控（见 drift_monitor.monitor_for_parser）
+        **options: BulkParseRunner 的参数（workers / chunk_size / cpu_seconds / ...）
+
+    Returns:
+        运行统计（见 BulkParseRunner.run）
+    """
+    writer = None
+    if output_format != JsonlResultWriter.format:
+        from .columnar_output import ColumnarResultWriter, load_schema_fields, schema_path_for_parser
+
+        schema_path = schema_path or schema_path_for_parser(parser_path)
+        if not schema_path:
+            raise ValueError(f"找不到解析器的 Schema 配置，请指定 schema_path: {parser_path}")
+        writer = ColumnarResultWriter(
+            output_path,
+            load_schema_fields(schema_path),
+            format=output_format,
+            compression=compression,
+            row_group_size=row_group_size,
+            row_groups_per_file=row_groups_per_file,
+        )
+    monitor = None
+    if drift_monitor:
+        from .drift_monitor import monitor_for_parser
+
+        monitor = monitor_for_parser(parser_path)
+    return BulkParseRunner(parser_path, **options).run(
+        source, output_path, resume=resume, writer=writer, monitor=monitor
+    )
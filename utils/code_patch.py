@@ -0,0 +1,218 @@
+"""
+按函数粒度的代码补丁
+解析LLM输出的函数替换补丁，并在本地基于AST应用，检测冲突
+"""
+import ast
+import re
+import textwrap
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+class PatchConflict(Exception):
+    """补丁无法干净地应用到原始代码"""
+
+
+# 补丁块：@@ REPLACE <名称> / @@ ADD <名称> / @@ IMPORT，以 @@ END 结束
+_BLOCK_PATTERN = re.compile(
+    r"^@@\s*(REPLACE|ADD|IMPORT)\b[ \t]*([\w.]*)[ \t]*\n(.*?)^@@\s*END\s*$",
+    re.MULTILINE | re.DOTALL
+)
+
+PATCH_FORMAT_INSTRUCTIONS = """只输出需要修改的部分，不要输出完整文件。每个修改是一个补丁块：
+
+@@ REPLACE WebPageParser.方法名
+（该方法修改后的完整定义，从 def 开始）
+@@ END
+
+@@ ADD WebPageParser.新方法名
+（新增方法的完整定义；不带类名前缀时表示新增模块级函数）
+@@ END
+
+@@ IMPORT
+（需要新增的 import 语句）
+@@ END
+
+规则：
+1. REPLACE 的名称必须是原始代码中已存在的函数、方法或类，块内定义的名字必须与之一致
+2. 未出现在补丁中的代码保持不变，只修改与失败字段相关的方法
+3. 不要使用 markdown 代码块标记，补丁块之外不要输出任何内容"""
+
+
+@dataclass
+class PatchOp:
+    """
+    单个补丁操作
+
+    Attributes:
+        kind: REPLACE / ADD / IMPORT
+        target: 目标名称，如 WebPageParser.parse；IMPORT 为空
+        code: 新代码（已去除公共缩进）
+    """
+    kind: str
+    target: str
+    code: str
+
+
+def parse_patch(text: str) -> List[PatchOp]:
+    """
+    解析补丁文本
+
+    Raises:
+        PatchConflict: 文本中没有任何补丁块
+    """
+    ops = []
+    for kind, target, body in _BLOCK_PATTERN.findall(text or ""):
+        code = textwrap.dedent(body).strip("\n")
+        if kind != "IMPORT" and not target:
+            raise PatchConflict(f"{kind} 补丁块缺少目标名称")
+        ops.append(PatchOp(kind=kind, target=target, code=code))
+
+    if not ops:
+        raise PatchConflict("响应中没有找到补丁块")
+    return ops
+
+
+def _index_definitions(tree: ast.Module) -> Dict[str, ast.AST]:
+    """限定名 -> 定义节点（模块级函数/类及类中的方法）"""
+    definitions = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            definitions[node.name] = node
+        if isinstance(node, ast.ClassDef):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    definitions[f"{node.name}.{child.name}"] = child
+    return definitions
+
+
+def _definition_name(code: str) -> Optional[str]:
+    """补丁代码中定义的名称"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise PatchConflict(f"补丁代码语法错误（第{e.lineno}行）: {e.msg}")
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return node.name
+    return None
+
+
+def _start_line(node: ast.AST) -> int:
+    """定义的起始行（包含装饰器），从1开始"""
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _indent(code: str, indent: str) -> List[str]:
+    return [(indent + line) if line.strip() else "" for line in code.split("\n")]
+
+
+def apply_patch(code: str, ops: List[PatchOp]) -> Tuple[str, List[str]]:
+    """
+    将补丁应用到原始代码
+
+    冲突检测：
+    - REPLACE 的目标在原始代码中不存在，或块内定义的名称与目标不一致
+    - ADD 的目标已存在，或要添加方法的类不存在
+    - 同一目标被多次修改，或替换的范围互相重叠
+    - 应用后的代码无法通过编译
+
+    Returns:
+        (新代码, 修改说明列表)
+
+    Raises:
+        PatchConflict: 补丁无法干净地应用
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise PatchConflict(f"原始代码无法解析，不能应用补丁: {e.msg}")
+
+    definitions = _index_definitions(tree)
+    lines = code.split("\n")
+    touched = set()
+    # (起始行下标, 结束行下标(不含), 替换内容)
+    edits: List[Tuple[int, int, List[str]]] = []
+    imports: List[str] = []
+    changes: List[str] = []
+
+    for op in ops:
+        if op.kind == "IMPORT":
+            imports.extend(line for line in op.code.split("\n") if line.strip())
+            changes.append("新增导入")
+            continue
+
+        if op.target in touched:
+            raise PatchConflict(f"{op.target} 被多次修改")
+        touched.add(op.target)
+
+        name = _definition_name(op.code)
+        expected = op.target.rsplit(".", 1)[-1]
+        if name != expected:
+            raise PatchConflict(f"补丁块 {op.target} 中定义的是 {name}，与目标名称不一致")
+
+        if op.kind == "REPLACE":
+            node = definitions.get(op.target)
+            if node is None:
+                raise PatchConflict(f"原始代码中不存在 {op.target}")
+            start = _start_line(node) - 1
+            indent = re.match(r"\s*", lines[start]).group(0)
+            edits.append((start, node.end_lineno, _indent(op.code, indent)))
+            changes.append(f"替换 {op.target}")
+        else:
+            if op.target in definitions:
+                raise PatchConflict(f"{op.target} 已存在，应使用 REPLACE")
+            if "." in op.target:
+                owner = definitions.get(op.target.rsplit(".", 1)[0])
+                if not isinstance(owner, ast.ClassDef):
+                    raise PatchConflict(f"要添加方法的类 {op.target.rsplit('.', 1)[0]} 不存在")
+                indent = re.match(r"\s*", lines[owner.body[0].lineno - 1]).group(0)
+                edits.append((owner.end_lineno, owner.end_lineno, [""] + _indent(op.code, indent)))
+            else:
+                # 新的模块级函数放在第一个类或函数定义之前，保证其被调用前已定义
+                first = next(
+                    (n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))),
+                    None
+                )
+                at = _start_line(first) - 1 if first else len(lines)
+                edits.append((at, at, op.code.split("\n") + ["", ""]))
+            changes.append(f"新增 {op.target}")
+
+    # 检查替换范围是否重叠（如同时替换类和其中的方法）
+    replaced = sorted((s, e) for s, e, _ in edits if e > s)
+    for (s1, e1), (s2, e2) in zip(replaced, replaced[1:]):
+        if s2 < e1:
+            raise PatchConflict(f"补丁修改的范围重叠（第{s1 + 1}-{e1}行与第{s2 + 1}-{e2}行）")
+
+    # 从后往前应用，保持前面的行号不变
+    for start, end, new_lines in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        lines[start:end] = new_lines
+
+    if imports:
+        existing = {line.strip() for line in lines}
+        new_imports = [line.strip() for line in imports if line.strip() not in existing]
+        if new_imports:
+            at = _import_insertion_line(tree)
+            lines[at:at] = new_imports
+
+    patched = "\n".join(lines)
+    try:
+        compile(patched, "<patched_parser>", "exec")
+    except SyntaxError as e:
+        raise PatchConflict(f"应用补丁后的代码语法错误（第{e.lineno}行）: {e.msg}")
+
+    return patched, changes
+
+
+def _import_insertion_line(tree: ast.Module) -> int:
+    """新增 import 的插入位置：最后一个模块级 import 之后，或模块文档字符串之后"""
+    at = 0
+    for index, node in enumerate(tree.body):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            at = node.end_lineno
+        elif index == 0 and isinstance(node, ast.Expr) and isinstance(getattr(node, "value", None), ast.Constant):
+            at = node.end_lineno
+        else:
+            break
+    return at
@@ -0,0 +1,298 @@
+"""
+流式代码检查
+在LLM逐token输出代码的过程中做增量检查，尽早发现明显错误的生成结果
+"""
+import ast
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, List, Optional
+from loguru import logger
+
+
+# 这些语法错误说明代码只是"还没写完"，而不是写错了
+_INCOMPLETE_MARKERS = (
+    "unterminated triple-quoted string",
+    "was never closed",
+    "unexpected EOF",
+    "expected an indented block",
+)
+
+# 以这些关键字开头的顶格行属于上一个语句块的延续
+_CONTINUATION_PREFIXES = ("else", "elif", "except", "finally", ")", "]", "}")
+
+# 合法的代码起始行
+_CODE_START_PREFIXES = ("import ", "from ", "#", '"""', "'''", "class ", "def ", "@")
+
+
+# 当前上下文中流式生成的取消信号，由调用方通过 stream_cancellation 设置
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("stream_cancel_event", default=None)
+
+
+class StreamAbort(Exception):
+    """流式生成过程中检测到无法挽回的错误，需要中止并重试"""
+
+
+class StreamCancelled(Exception):
+    """调用方已取消流式生成（如锦标赛提前结束），不再重试"""
+
+
+@contextmanager
+def stream_cancellation(event: threading.Event):
+    """
+    在该上下文中发起的流式生成都检查 event，设置后在下一个分片到达时中止
+
+    用于跨过工具调用等无法直接传参的边界，把取消信号传给 stream_code
+    """
+    token = _cancel_event.set(event)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    """当前上下文中的取消信号（没有时为 None）"""
+    return _cancel_event.get()
+
+
+class StreamingCodeChecker:
+    """
+    流式代码检查器
+
+    检查内容：
+    1. 随token到达剥离markdown代码块标记
+    2. 每累积一定字符数，对已完整的顶层语句块尝试 compile()
+    3. 尽早发现缺失的 `WebPageParser` 类或 `parse` 方法
+    """
+
+    def __init__(
+        self,
+        class_name: str = "WebPageParser",
+        method_name: str = "parse",
+        check_interval: int = 800,
+        max_chars_without_class: int = 6000,
+    ):
+        self.class_name = class_name
+        self.method_name = method_name
+        self.check_interval = check_interval
+        self.max_chars_without_class = max_chars_without_class
+
+        self._raw = ""
+        self._code_start: Optional[int] = None
+        self._code_end: Optional[int] = None
+        self._last_check_len = 0
+        self._checked_upto = 0
+        self.class_found = False
+        self.method_found = False
+        self.compile_checks = 0
+        self.usage = None  # 流式响应最后一个分片中的token用量
+
+    @property
+    def done(self) -> bool:
+        """代码块已结束，后续输出可以丢弃"""
+        return self._code_end is not None
+
+    @property
+    def code(self) -> str:
+        """当前已剥离代码块标记的代码"""
+        if self._code_start is None:
+            return ""
+        end = self._code_end if self._code_end is not None else len(self._raw)
+        return self._raw[self._code_start:end]
+
+    def feed(self, chunk: str):
+        """
+        输入新到达的文本片段
+
+        Raises:
+            StreamAbort: 检测到明显错误
+        """
+        if not chunk or self.done:
+            return
+
+        self._raw += chunk
+
+        if self._code_start is None:
+            self._locate_code_start()
+            if self._code_start is None:
+                return
+
+        self._locate_code_end()
+
+        if len(self.code) - self._last_check_len >= self.check_interval:
+            self._last_check_len = len(self.code)
+            self._check_complete_blocks()
+
+    def finalize(self) -> str:
+        """
+        流结束后做完整检查并返回清理后的代码
+
+        Raises:
+            StreamAbort: 代码无法编译或缺少必需的类/方法
+        """
+        code = self.code.strip()
+        if not code:
+            raise StreamAbort("模型没有输出任何代码")
+
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            raise StreamAbort(f"生成的代码存在语法错误: 第{e.lineno}行 {e.msg}")
+
+        self._check_structure(tree)
+        if not self.class_found:
+            raise StreamAbort(f"生成的代码中缺少 {self.class_name} 类")
+        if not self.method_found:
+            raise StreamAbort(f"{self.class_name} 类中缺少 {self.method_name} 方法")
+
+        return code
+
+    def _locate_code_start(self):
+        """等待第一行完整后决定代码起点，并剥离开头的代码块标记"""
+        stripped = self._raw.lstrip()
+        if "\n" not in stripped:
+            return
+
+        offset = len(self._raw) - len(stripped)
+        first_line = stripped.split("\n", 1)[0].strip()
+
+        if first_line.startswith("```"):
+            self._code_start = offset + stripped.index("\n") + 1
+            return
+
+        if not first_line.startswith(_CODE_START_PREFIXES):
+            raise StreamAbort(f"输出不是以代码开头: {first_line[:80]}")
+
+        self._code_start = offset
+
+    def _locate_code_end(self):
+        """遇到顶格的结束代码块标记时截断，之后的说明文字不再需要"""
+        pos = self._raw.find("\n```", self._code_start)
+        if pos >= 0:
+            self._code_end = pos + 1
+
+    def _complete_prefix(self) -> str:
+        """返回最后一个顶格语句起始行之前的代码，即所有已完整的顶层语句块"""
+        lines: List[str] = self.code.split("\n")[:-1]  # 最后一行可能尚未写完
+        boundary = None
+        for idx in range(len(lines) - 1, 0, -1):
+            line = lines[idx]
+            if line and not line[0].isspace() and not line.startswith(_CONTINUATION_PREFIXES):
+                boundary = idx
+                break
+        # 装饰器属于其后的类或函数定义，边界退到装饰器之前
+        while boundary is not None and boundary > 0 and lines[boundary - 1].startswith("@"):
+            boundary -= 1
+        if not boundary:
+            return ""
+        return "\n".join(lines[:boundary])
+
+    def _check_complete_blocks(self):
+        """对已完整的顶层语句块进行编译和结构检查"""
+        prefix = self._complete_prefix()
+        if not prefix or len(prefix) <= self._checked_upto:
+            self._check_class_budget()
+            return
+
+        self.compile_checks += 1
+        try:
+            tree = compile(prefix, "<streamed_parser>", "exec", ast.PyCF_ONLY_AST)
+        except SyntaxError as e:
+            if any(marker in (e.msg or "") for marker in _INCOMPLETE_MARKERS):
+                return
+            raise StreamAbort(f"流式编译失败: 第{e.lineno}行 {e.msg}")
+
+        self._checked_upto = len(prefix)
+        self._check_structure(tree)
+
+        if self.class_found and not self.method_found:
+            raise StreamAbort(f"{self.class_name} 类已结束，但缺少 {self.method_name} 方法")
+
+        self._check_class_budget()
+
+    def _check_class_budget(self):
+        """长时间没有出现目标类，视为生成跑偏"""
+        if not self.class_found and len(self.code) > self.max_chars_without_class:
+            raise StreamAbort(f"已输出 {len(self.code)} 字符仍未出现 {self.class_name} 类")
+
+    def _check_structure(self, tree: ast.Module):
+        """检查目标类和方法是否存在"""
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name == self.class_name:
+                self.class_found = True
+                self.method_found = any(
+                    isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+                    and item.name == self.method_name
+                    for item in node.body
+                )
+            elif self._is_main_guard(node) and not self.class_found:
+                raise StreamAbort(f"已进入 __main__ 部分，但未定义 {self.class_name} 类")
+
+    @staticmethod
+    def _is_main_guard(node: ast.stmt) -> bool:
+        """判断是否为 if __name__ == '__main__' 语句"""
+        if not isinstance(node, ast.If) or not isinstance(node.test, ast.Compare):
+            return False
+        left = node.test.left
+        return isinstance(left, ast.Name) and left.id == "__name__"
+
+
+def _chunk_text(chunk) -> str:
+    """提取流式分片中的文本内容"""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return str(content or "")
+
+
+def stream_code(
+    model,
+    messages: List[dict],
+    checker: StreamingCodeChecker = None,
+    cancel_event: threading.Event = None
+) -> str:
+    """
+    流式调用LLM生成代码，并在生成过程中做增量检查
+
+    Args:
+        model: LangChain 聊天模型
+        messages: 消息列表
+        checker: 代码检查器（可选）
+        cancel_event: 取消信号（可选），每个分片到达时检查，设置后中止生成
+
+    Returns:
+        清理后的完整代码
+
+    Raises:
+        StreamAbort: 检测到明显错误，流已被中止
+        StreamCancelled: 取消信号已设置，流已被中止
+    """
+    checker = checker or StreamingCodeChecker()
+    if cancel_event is not None and cancel_event.is_set():
+        raise StreamCancelled("生成已取消")
+    stream: Iterable = model.stream(messages)
+
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage_metadata", None):
+                checker.usage = chunk.usage_metadata
+            if cancel_event is not None and cancel_event.is_set():
+                raise StreamCancelled(f"生成已取消（已输出 {len(checker.code)} 字符）")
+            checker.feed(_chunk_text(chunk))
+            if checker.done:
+                break
+    finally:
+        # 提前退出时关闭底层连接，停止继续消耗token
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    code = checker.finalize()
+    logger.debug(f"流式生成完成: {len(code)} 字符, 增量编译 {checker.compile_checks} 次")
+    return code
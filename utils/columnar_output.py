@@ -0,0 +1,259 @@
+"""
+列式批量输出
+按解析器 Schema 配置（generate_parser_code 生成的 fields 类型）确定列，把批量解析结果写成 Parquet 或 Arrow IPC 文件
+
+- 列顺序与 Schema 中的字段顺序一致，之后是 _id / _error / _parse_time_ms 三个元数据列；行顺序与输入顺序一致
+- 结果按列追加到缓冲区，满 row_group_size 行（按输入块对齐）时构建一个 RecordBatch（Parquet 中为一个行组）
+- 输出是一个目录，其中的分片文件 part-00000.parquet ... 每满 row_groups_per_file 个行组关闭一次，
+  只有已关闭的分片计入检查点，恢复时删除之后写了一半的分片
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+from .field_scoring import normalize_number
+from .parser_registry import registry_for_parser
+from .stream_parse import is_stream_spec
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+
+# 元数据列，以下划线开头避免与字段名冲突
+ID_COLUMN = "_id"
+ERROR_COLUMN = "_error"
+PARSE_TIME_COLUMN = "_parse_time_ms"
+
+_SUFFIXES = {FORMAT_PARQUET: ".parquet", FORMAT_ARROW: ".arrow"}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("列式输出需要安装 pyarrow: pip install pyarrow")
+
+
+def load_schema_fields(schema_path: str) -> Dict[str, Dict]:
+    """读取 Schema 配置中的字段定义"""
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('fields') or {}
+
+
+def schema_path_for_parser(parser_path: str) -> Optional[str]:
+    """
+    查找注册表中解析器对应的 Schema 配置
+
+    解析器代码位于 <root>/objects/<hash[:2]>/<hash>.py，不在注册表中时返回 None；
+    流式解析规格本身就是 Schema 配置
+    """
+    if is_stream_spec(parser_path):
+        return parser_path
+    registry = registry_for_parser(parser_path)
+    version = registry.get(Path(parser_path).stem) if registry else None
+    return version['config_path'] if version else None
+
+
+def arrow_type(field_type: str):
+    """Schema 字段类型对应的 Arrow 类型：数字为 float64，数组为字符串列表，对象和未知类型为 JSON 字符串"""
+    _require_pyarrow()
+    if field_type == "number":
+        return pa.float64()
+    if field_type == "boolean":
+        return pa.bool_()
+    if field_type == "array":
+        return pa.list_(pa.string())
+    return pa.string()
+
+
+def arrow_schema(fields: Dict[str, Dict]):
+    """字段定义对应的 Arrow Schema（字段顺序保持不变）"""
+    _require_pyarrow()
+    columns = [
+        pa.field(name, arrow_type((info or {}).get('type', 'string')), metadata={
+            'type': str((info or {}).get('type', 'string')),
+            'description': str((info or {}).get('description', '')),
+        })
+        for name, info in fields.items()
+    ]
+    columns += [
+        pa.field(ID_COLUMN, pa.string(), nullable=False),
+        pa.field(ERROR_COLUMN, pa.string()),
+        pa.field(PARSE_TIME_COLUMN, pa.float64()),
+    ]
+    return pa.schema(columns)
+
+
+def _json_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _to_number(value):
+    return None if value is None else normalize_number(value)
+
+
+def _to_boolean(value):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "yes", "1", "是"):
+            return True
+        if lowered in ("false", "no", "0", "否"):
+            return False
+        return None
+    return bool(value)
+
+
+def _to_list(value):
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [_json_text(item) for item in value]
+
+
+_CONVERTERS = {
+    "string": _json_text,
+    "number": _to_number,
+    "boolean": _to_boolean,
+    "array": _to_list,
+}
+
+
+class ColumnarResultWriter:
+    """
+    Parquet / Arrow IPC 结果写入器（接口同 bulk_parse.JsonlResultWriter）
+
+    字段值按 Schema 类型转换后直接追加到各列的缓冲区；与类型不符、无法转换的值记为 null，
+    Schema 之外的字段不写出
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fields: Dict[str, Dict],
+        format: str = FORMAT_PARQUET,
+        compression: str = "zstd",
+        row_group_size: int = 10000,
+        row_groups_per_file: int = 10
+    ):
+        _require_pyarrow()
+        if format not in _SUFFIXES:
+            raise ValueError(f"未知的列式输出格式: {format}")
+        if not fields:
+            raise ValueError("列式输出需要 Schema 字段定义")
+        self.path = Path(path)
+        self.format = format
+        self.compression = None if compression in (None, "", "none") else compression
+        self.row_group_size = max(1, row_group_size)
+        self.row_groups_per_file = max(1, row_groups_per_file)
+
+        self.field_names = list(fields)
+        self.schema = arrow_schema(fields)
+        self._converters = [
+            _CONVERTERS.get((fields[name] or {}).get('type', 'string'), _json_text) for name in self.field_names
+        ]
+        self._reset_columns()
+        self._writer = None
+        self._parts = 0
+        self._part_row_groups = 0
+        self._rows = 0
+
+    def _reset_columns(self):
+        self._columns: List[list] = [[] for _ in self.field_names]
+        self._ids: List[str] = []
+        self._errors: List[Optional[str]] = []
+        self._parse_times: List[Optional[float]] = []
+
+    def _part_path(self, index: int) -> Path:
+        return self.path / f"part-{index:05d}{_SUFFIXES[self.format]}"
+
+    def open(self, state: Optional[Dict] = None):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._parts = state['parts'] if state else 0
+        self._rows = state['rows'] if state else 0
+        # 删除检查点之后的分片（中断时写了一半的分片，或重新开始时的旧输出）
+        for part in sorted(self.path.glob(f"part-*{_SUFFIXES[self.format]}")):
+            index = part.stem.split("-")[-1]
+            if not index.isdigit() or int(index) >= self._parts:
+                part.unlink()
+
+    def write(self, ids: List[str], outcomes: List[Dict]):
+        field_names, converters, columns = self.field_names, self._converters, self._columns
+        for doc_id, outcome in zip(ids, outcomes):
+            data = outcome['data']
+            if not isinstance(data, dict):
+                data = {}
+            for name, convert, column in zip(field_names, converters, columns):
+                column.append(convert(data.get(name)))
+            self._ids.append(doc_id)
+            self._errors.append(outcome['error'])
+            self._parse_times.append(outcome['parse_time_ms'])
+        # 按块对齐行组边界，分片关闭时缓冲区为空，检查点可以覆盖全部已写入的文档
+        if len(self._ids) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        """把缓冲的行写成一个 RecordBatch / 行组"""
+        if not self._ids:
+            return
+        arrays = [pa.array(column, type=self.schema.field(i).type) for i, column in enumerate(self._columns)]
+        arrays += [
+            pa.array(self._ids, type=pa.string()),
+            pa.array(self._errors, type=pa.string()),
+            pa.array(self._parse_times, type=pa.float64()),
+        ]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self._reset_columns()
+
+        if self._writer is None:
+            part_path = self._part_path(self._parts)
+            if self.format == FORMAT_PARQUET:
+                self._writer = pq.ParquetWriter(part_path, self.schema, compression=self.compression)
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                self._writer = pa.ipc.new_file(part_path, self.schema, options=options)
+        if self.format == FORMAT_PARQUET:
+            self._writer.write_batch(batch, row_group_size=batch.num_rows)
+        else:
+            self._writer.write_batch(batch)
+        self._rows += batch.num_rows
+        self._part_row_groups += 1
+        if self._part_row_groups >= self.row_groups_per_file:
+            self._close_part()
+
+    def _close_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._parts += 1
+            self._part_row_groups = 0
+            logger.debug(f"列式输出分片已写入: {self._part_path(self._parts - 1)}")
+
+    def checkpoint(self, final: bool = False) -> Optional[Dict]:
+        """
+        恢复所需的状态
+
+        分片关闭前其内容不可读，只在没有未关闭的分片和缓冲行时返回状态；final 为 True 时先写出全部缓冲行
+        """
+        if final:
+            self._flush()
+            self._close_part()
+        if self._writer is not None or self._ids:
+            return None
+        return {'parts': self._parts, 'rows': self._rows}
+
+    def close(self):
+        # 异常中断时关闭未完成的分片，使其可读；它不在检查点内，恢复时会被删除
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,164 @@
+"""
+字段DOM片段定位
+在页面中找到字段参考值（或字段名）所在的元素，截取其附近的DOM片段供修复时参考
+"""
+import re
+from typing import Dict, List, Optional
+from .html_diff import clean_html_tree, compact_element
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+# 用于匹配的参考值前缀长度，过长的文本（如正文）只需要定位到开头
+_MATCH_PREFIX_CHARS = 40
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip().lower()
+
+
+def _smallest_containing(root, needle: str):
+    """沿第一个匹配的分支向下，找到文本包含 needle 的最深层元素"""
+    if needle not in _normalize(root.text_content()):
+        return None
+    element = root
+    while True:
+        child = next(
+            (c for c in element if isinstance(c.tag, str) and needle in _normalize(c.text_content())),
+            None
+        )
+        if child is None:
+            return element
+        element = child
+
+
+def _by_attribute(root, field_name: str):
+    """class 或 id 中包含字段名的第一个元素"""
+    tokens = [t for t in re.split(r"[_\-\s]+", field_name.lower()) if len(t) >= 3]
+    if not tokens:
+        return None
+    for el in root.iter():
+        if not isinstance(el.tag, str):
+            continue
+        attrs = f"{el.get('class') or ''} {el.get('id') or ''} {el.get('itemprop') or ''}".lower()
+        if any(token in attrs for token in tokens):
+            return el
+    return None
+
+
+def _locate(root, field_name: str, expected=None):
+    """按参考值文本或字段名定位字段所在的元素"""
+    element = None
+    if expected not in (None, '', [], {}):
+        value = expected[0] if isinstance(expected, list) else expected
+        if not isinstance(value, dict):
+            needle = _normalize(str(value))[:_MATCH_PREFIX_CHARS]
+            if needle:
+                element = _smallest_containing(root, needle)
+
+    if element is None:
+        element = _by_attribute(root, field_name)
+    return element
+
+
+def _common_ancestor(elements: List):
+    """多个元素的最近公共祖先"""
+    chains = [[el] + list(el.iterancestors()) for el in elements]
+    shared = set(chains[0])
+    for chain in chains[1:]:
+        shared &= set(chain)
+    return next(el for el in chains[0] if el in shared)
+
+
+def locate_field_snippet(html: str, field_name: str, expected=None, max_chars: int = 800) -> Optional[str]:
+    """
+    定位字段在页面中的DOM片段
+
+    优先按参考值文本定位包含它的最深层元素，再向上扩展到父元素以包含标签/容器信息；
+    没有参考值时按 class / id / itemprop 中的字段名定位
+
+    Args:
+        html: 页面HTML
+        field_name: 字段名
+        expected: 视觉提取的参考值（可选）
+        max_chars: 片段最大字符数
+
+    Returns:
+        紧凑的HTML片段，找不到时返回 None
+    """
+    root = clean_html_tree(html or "")
+    if root is None:
+        return None
+
+    element = _locate(root, field_name, expected)
+    if element is None:
+        return None
+
+    # 父元素通常包含字段标签和稳定的容器class，更适合编写选择器
+    parent = element.getparent()
+    if parent is not None and parent.tag not in ("body", "html"):
+        snippet = compact_element(parent)
+        if len(snippet) <= max_chars:
+            return snippet
+
+    snippet = compact_element(element)
+    if len(snippet) > max_chars:
+        snippet = snippet[:max_chars] + "\n<!-- ... (截断) -->"
+    return snippet
+
+
+def distill_page(
+    html: str,
+    field_names: List[str],
+    expected_values: Optional[Dict] = None,
+    max_chars: int = 6000
+) -> Optional[str]:
+    """
+    提炼页面中与目标字段相关的区域
+
+    定位各字段所在的元素，取其最近公共祖先作为内容区域；区域过大时退化为各字段片段的拼接。
+    脚本、样式、注释和内联样式都会被移除，过长的文本会被截断
+
+    Args:
+        html: 页面HTML
+        field_names: 需要关注的字段
+        expected_values: 字段名 -> 视觉提取的参考值（可选）
+        max_chars: 输出的最大字符数
+
+    Returns:
+        紧凑的HTML，无法解析时返回 None
+    """
+    root = clean_html_tree(html or "")
+    if root is None:
+        return None
+
+    expected_values = expected_values or {}
+    located = {}
+    for name in field_names:
+        element = _locate(root, name, expected_values.get(name))
+        if element is not None:
+            located[name] = element
+
+    if located:
+        region = compact_element(_common_ancestor(list(located.values())))
+        if len(region) <= max_chars:
+            return region
+
+        # 公共区域过大时只保留每个字段附近的片段
+        per_field = max(max_chars // len(located), 200)
+        parts = []
+        for name, element in located.items():
+            parent = element.getparent()
+            target = parent if parent is not None and parent.tag not in ("body", "html") else element
+            snippet = compact_element(target)
+            if len(snippet) > per_field:
+                snippet = compact_element(element)[:per_field]
+            parts.append(f"<!-- 字段 {name} -->\n{snippet}")
+        return "\n".join(parts)[:max_chars]
+
+    # 无法定位任何字段时，提供清理后的页面主体
+    body = root.find("body")
+    region = compact_element(body if body is not None else root)
+    if len(region) > max_chars:
+        region = region[:max_chars] + "\n<!-- ... (截断) -->"
+    return region
@@ -0,0 +1,547 @@
+"""
+字段漂移监控
+从批量解析结果中按解析器版本统计每个字段的填充率和取值形态（类型、长度、模式），
+与该版本最初一批记录的基线比较，站点悄悄改版导致字段大面积为空或形态变化时发出告警
+
+- 每个字段的统计是固定长度的计数数组（类型、长度分桶、模式哈希分桶），内存与记录数无关
+- 滚动窗口由 window_buckets 个计数桶组成的环实现，每个桶覆盖 window_size / window_buckets 条记录
+- 类型和模式分布之间的差异用总变差距离（0 表示相同，1 表示完全不相交）；长度是有序的，
+  用对数分桶上的推土机距离（单位为二进制位，1.0 相当于长度整体变为两倍或一半），ID 递增这类跨桶的小变化不会误报
+- 最近的失败记录（解析出错，或基线中通常有值的字段为空）保留有限个样本，告警时连同HTML写入注册表的漂移队列，
+  由 ParserAgent.process_drift_alerts 修复或重新生成
+- 基线阶段另外保留少量解析正常的页面（HTML 和当时的解析结果），随告警一起入队，
+  修复后的版本还要在这些页面上通过回归检查
+"""
+import json
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from loguru import logger
+from config.settings import settings
+from .hashing import content_hash
+from .parser_registry import ParserRegistry, _atomic_write, registry_for_parser
+
+
+# 取值类型分类（空值不计入类型和形态分布，只影响填充率）
+_TYPES = ("string", "number", "boolean", "array", "object")
+# 长度按二进制位数分桶：0, 1, 2-3, 4-7, ..., >= 2^14
+_LENGTH_BINS = 16
+# 模式签名按 CRC32 哈希分桶
+_PATTERN_BINS = 32
+# 模式签名保留的字符数
+_PATTERN_CHARS = 12
+
+# 计数数组布局：[记录数, 有值数, 类型..., 长度..., 模式...]
+_RECORDS, _FILLED = 0, 1
+_TYPE_OFFSET = 2
+_LENGTH_OFFSET = _TYPE_OFFSET + len(_TYPES)
+_PATTERN_OFFSET = _LENGTH_OFFSET + _LENGTH_BINS
+_SKETCH_SIZE = _PATTERN_OFFSET + _PATTERN_BINS
+
+# 未提供 Schema 字段时，最多跟踪的字段数
+_MAX_FIELDS = 64
+
+ACTION_FIX = "fix"
+ACTION_REGENERATE = "regenerate"
+
+
+def _is_filled(value) -> bool:
+    """与 field_check 的空值判断一致：None、空容器和空白字符串记为空"""
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return bool(value.strip())
+    if isinstance(value, (list, tuple, dict)):
+        return bool(value)
+    return True
+
+
+def _value_type(value) -> int:
+    if isinstance(value, bool):
+        return _TYPES.index("boolean")
+    if isinstance(value, (int, float)):
+        return _TYPES.index("number")
+    if isinstance(value, (list, tuple)):
+        return _TYPES.index("array")
+    if isinstance(value, dict):
+        return _TYPES.index("object")
+    return _TYPES.index("string")
+
+
+def _length_bin(value) -> int:
+    if isinstance(value, bool):
+        length = 1
+    elif isinstance(value, (int, float)):
+        length = len(str(abs(int(value))))
+    elif isinstance(value, (str, list, tuple, dict)):
+        length = len(value)
+    else:
+        length = len(str(value))
+    return min(length.bit_length(), _LENGTH_BINS - 1)
+
+
+def value_shape(value) -> str:
+    """
+    取值的模式签名：数字记为 9，字母记为 a / A，汉字记为 中，空白记为空格，连续的同类字符合并，
+    其余字符保留；列表取第一个元素的签名
+    """
+    if isinstance(value, (list, tuple)):
+        return "[" + (value_shape(value[0]) if value else "")
+    if isinstance(value, dict):
+        return "{" + ",".join(sorted(str(k) for k in value)[:4])
+    if isinstance(value, bool):
+        return "bool"
+    text = value if isinstance(value, str) else str(value)
+    shape = []
+    for char in text.strip():
+        if char.isdigit():
+            mapped = "9"
+        elif char.isascii() and char.isalpha():
+            mapped = "A" if char.isupper() else "a"
+        elif "一" <= char <= "鿿":
+            mapped = "中"
+        elif char.isspace():
+            mapped = " "
+        elif char.isalpha():
+            mapped = "x"
+        else:
+            mapped = char
+        if not shape or shape[-1] != mapped:
+            shape.append(mapped)
+            if len(shape) >= _PATTERN_CHARS:
+                break
+    return "".join(shape)
+
+
+def _observe_value(sketch: List[int], value):
+    sketch[_RECORDS] += 1
+    if not _is_filled(value):
+        return
+    sketch[_FILLED] += 1
+    sketch[_TYPE_OFFSET + _value_type(value)] += 1
+    sketch[_LENGTH_OFFSET + _length_bin(value)] += 1
+    sketch[_PATTERN_OFFSET + zlib.crc32(value_shape(value).encode("utf-8")) % _PATTERN_BINS] += 1
+
+
+def _distance(a: List[int], b: List[int], start: int, end: int) -> float:
+    """两个计数分布（a[start:end] 与 b[start:end]）之间的总变差距离"""
+    total_a, total_b = sum(a[start:end]), sum(b[start:end])
+    if not total_a or not total_b:
+        return 0.0
+    return 0.5 * sum(abs(a[i] / total_a - b[i] / total_b) for i in range(start, end))
+
+
+def _shift(a: List[int], b: List[int], start: int, end: int) -> float:
+    """两个有序分桶分布之间的推土机距离（以桶为单位）"""
+    total_a, total_b = sum(a[start:end]), sum(b[start:end])
+    if not total_a or not total_b:
+        return 0.0
+    distance = cumulative_a = cumulative_b = 0.0
+    for i in range(start, end):
+        cumulative_a += a[i] / total_a
+        cumulative_b += b[i] / total_b
+        distance += abs(cumulative_a - cumulative_b)
+    return distance
+
+
+def _fill_rate(sketch: List[int]) -> Optional[float]:
+    return sketch[_FILLED] / sketch[_RECORDS] if sketch[_RECORDS] else None
+
+
+class FieldDriftMonitor:
+    """
+    单个解析器版本的字段漂移监控
+
+    前 baseline_size 条记录构成基线（之后不再变化），其后的记录进入滚动窗口；
+    窗口内有至少 min_records 条记录时才与基线比较。
+    提供 registry 时，状态保存在 <root>/drift/<版本哈希>.json，漂移告警加入注册表的漂移队列
+    """
+
+    def __init__(
+        self,
+        version_hash: str,
+        fields: List[str] = None,
+        baseline_size: int = 1000,
+        window_size: int = 1000,
+        window_buckets: int = 10,
+        min_records: int = 200,
+        fill_drop_threshold: float = 0.2,
+        shape_threshold: float = 0.3,
+        length_threshold: float = 1.0,
+        max_samples: int = 5,
+        baseline_pages: int = 10,
+        registry: Optional[ParserRegistry] = None
+    ):
+        self.version_hash = version_hash
+        self.registry = registry
+        self.baseline_size = max(1, baseline_size)
+        self.window_buckets = max(1, window_buckets)
+        self.bucket_size = max(1, window_size // self.window_buckets)
+        self.min_records = min_records
+        self.fill_drop_threshold = fill_drop_threshold
+        self.shape_threshold = shape_threshold
+        self.length_threshold = length_threshold
+
+        self.fields: List[str] = list(fields or [])
+        self._fixed_fields = bool(fields)
+        self.records = 0
+        self.errors = 0
+        self.baseline_records = 0
+        self.baseline_errors = 0
+        self.baseline: Dict[str, List[int]] = {}
+        # 滚动窗口：每个桶为 {'records', 'errors', 'fields': {字段名: 计数数组}}
+        self.buckets = deque(maxlen=self.window_buckets)
+        # 距上次告警的记录数，告警后要等窗口完全更新才会再次告警
+        self.since_alert = None
+        # 最近的失败记录：(文档ID, HTML 或 None, 原因)
+        self.samples = deque(maxlen=max(1, max_samples))
+        # 基线阶段解析正常的页面：{'id', 'html_path', 'data', 'baseline': True}（只在有注册表且提供HTML时保留）
+        self.baseline_pages = max(0, baseline_pages)
+        self.baseline_samples: List[Dict] = []
+        # 已送入监控的批量解析输出（绝对路径），同一输出不重复统计
+        self.fed_outputs: List[str] = []
+
+    def _new_bucket(self) -> Dict:
+        return {'records': 0, 'errors': 0, 'fields': {}}
+
+    def _tracked(self, data: Dict) -> List[str]:
+        if not self._fixed_fields:
+            for name in data:
+                if name not in self.fields and len(self.fields) < _MAX_FIELDS:
+                    self.fields.append(name)
+        return self.fields
+
+    def observe(self, doc_id: str, outcome: Dict, html: str = None):
+        """记录一个文档的解析结果（{'data', 'error', ...}，与批量解析输出一致）"""
+        data = outcome.get('data') if isinstance(outcome.get('data'), dict) else {}
+        error = outcome.get('error')
+        self.records += 1
+        self.errors += bool(error)
+        if self.since_alert is not None:
+            self.since_alert += 1
+
+        in_baseline = self.baseline_records < self.baseline_size
+        if in_baseline:
+            self.baseline_records += 1
+            self.baseline_errors += bool(error)
+        else:
+            if not self.buckets or self.buckets[-1]['records'] >= self.bucket_size:
+                self.buckets.append(self._new_bucket())
+            bucket = self.buckets[-1]
+            bucket['records'] += 1
+            bucket['errors'] += bool(error)
+
+        empty = []
+        for name in self._tracked(data):
+            value = data.get(name)
+            sketches = self.baseline if in_baseline else bucket['fields']
+            sketch = sketches.get(name)
+            if sketch is None:
+                sketch = sketches[name] = [0] * _SKETCH_SIZE
+            _observe_value(sketch, value)
+            if not in_baseline and not _is_filled(value):
+                baseline_fill = _fill_rate(self.baseline.get(name, [0] * _SKETCH_SIZE))
+                if baseline_fill and baseline_fill >= 0.5:
+                    empty.append(name)
+
+        if not in_baseline and (error or empty):
+            reason = f"解析出错: {str(error)[:200]}" if error else "字段为空: " + ", ".join(empty)
+            self.samples.append((doc_id, html, reason))
+        elif in_baseline and not error and data and html and self.registry is not None \
+                and len(self.baseline_samples) < self.baseline_pages:
+            self.baseline_samples.append(
+                {'id': doc_id, 'html_path': self._store_page(html), 'data': data, 'baseline': True}
+            )
+
+    def mark_fed(self, output_path: str) -> bool:
+        """记录批量解析输出已送入监控，之前已送入过时返回 False"""
+        key = str(Path(output_path).resolve())
+        if key in self.fed_outputs:
+            return False
+        self.fed_outputs.append(key)
+        return True
+
+    def observe_chunk(self, ids: List[str], outcomes: List[Dict], documents: List[str] = None):
+        for index, (doc_id, outcome) in enumerate(zip(ids, outcomes)):
+            self.observe(doc_id, outcome, documents[index] if documents else None)
+
+    def window(self) -> Tuple[int, int, Dict[str, List[int]]]:
+        """滚动窗口的 (记录数, 出错数, 字段 -> 计数数组)"""
+        records = errors = 0
+        merged: Dict[str, List[int]] = {}
+        for bucket in self.buckets:
+            records += bucket['records']
+            errors += bucket['errors']
+            for name, sketch in bucket['fields'].items():
+                total = merged.setdefault(name, [0] * _SKETCH_SIZE)
+                for i, count in enumerate(sketch):
+                    total[i] += count
+        return records, errors, merged
+
+    def check(self) -> Dict:
+        """
+        比较滚动窗口与基线
+
+        Returns:
+            {'drifted', 'records', 'window_records', 'baseline_error_rate', 'window_error_rate',
+             'fields': {字段名: {'baseline_fill', 'window_fill', 'fill_drop', 'type_distance',
+                                 'length_shift', 'pattern_distance', 'drifted'}},
+             'drifted_fields', 'action'}
+        """
+        records, errors, window = self.window()
+        report = {
+            'version_hash': self.version_hash,
+            'drifted': False,
+            'records': self.records,
+            'window_records': records,
+            'baseline_error_rate': self.baseline_errors / self.baseline_records if self.baseline_records else None,
+            'window_error_rate': errors / records if records else None,
+            'fields': {},
+            'drifted_fields': [],
+            'action': None,
+        }
+        if records < self.min_records or self.baseline_records < self.baseline_size:
+            return report
+
+        empty_sketch = [0] * _SKETCH_SIZE
+        for name in self.fields:
+            base = self.baseline.get(name, empty_sketch)
+            current = window.get(name, empty_sketch)
+            baseline_fill, window_fill = _fill_rate(base), _fill_rate(current)
+            fill_drop = (baseline_fill or 0.0) - (window_fill or 0.0)
+            stats = {
+                'baseline_fill': baseline_fill,
+                'window_fill': window_fill,
+                'fill_drop': fill_drop,
+                'type_distance': _distance(base, current, _TYPE_OFFSET, _LENGTH_OFFSET),
+                'length_shift': _shift(base, current, _LENGTH_OFFSET, _PATTERN_OFFSET),
+                'pattern_distance': _distance(base, current, _PATTERN_OFFSET, _SKETCH_SIZE),
+            }
+            stats['drifted'] = (
+                fill_drop >= self.fill_drop_threshold
+                or max(stats['type_distance'], stats['pattern_distance']) >= self.shape_threshold
+                or stats['length_shift'] >= self.length_threshold
+            )
+            report['fields'][name] = stats
+            if stats['drifted']:
+                report['drifted_fields'].append(name)
+
+        error_rise = (report['window_error_rate'] or 0.0) - (report['baseline_error_rate'] or 0.0)
+        report['error_rise'] = error_rise
+        report['drifted'] = bool(report['drifted_fields']) or error_rise >= self.fill_drop_threshold
+        if report['drifted']:
+            # 一半以上的字段漂移（或解析大面积出错）说明模板整体变了，重新生成；否则修复个别字段
+            widespread = len(report['drifted_fields']) * 2 > len(self.fields) or error_rise >= 0.5
+            report['action'] = ACTION_REGENERATE if widespread else ACTION_FIX
+        return report
+
+    def should_alert(self, report: Dict) -> bool:
+        """漂移且距上次告警已经过了完整的窗口"""
+        window_size = self.bucket_size * self.window_buckets
+        return report['drifted'] and (self.since_alert is None or self.since_alert >= window_size)
+
+    def check_and_alert(self) -> Dict:
+        """检查漂移，需要时把告警加入漂移队列（没有注册表时只记录日志）"""
+        report = self.check()
+        if not self.should_alert(report):
+            return report
+        self.since_alert = 0
+        if self.registry is None:
+            logger.warning(
+                f"解析器 {self.version_hash[:12]} 字段漂移（不在注册表中，无法加入队列）: "
+                + "; ".join(format_drift_report(report))
+            )
+            return report
+        report['alert_id'] = self._enqueue(report)
+        return report
+
+    def _store_page(self, html: str) -> str:
+        """页面HTML按内容哈希保存在 <root>/drift/pages 下"""
+        path = self.registry.root / "drift" / "pages" / f"{content_hash(html)}.html"
+        if not path.exists():
+            _atomic_write(path, html)
+        return str(path)
+
+    def _enqueue(self, report: Dict) -> Optional[int]:
+        """加入漂移队列：失败样本（HTML 保存到注册表目录）和基线页面（用于回归检查）"""
+        samples = []
+        for doc_id, html, reason in self.samples:
+            samples.append({'id': doc_id, 'reason': reason, 'html_path': self._store_page(html) if html else None})
+        # 失败样本既没有HTML、ID也不是URL时，修复和重新生成都无从下手
+        if not any(s['html_path'] or str(s['id']).startswith(('http://', 'https://')) for s in samples):
+            logger.warning(
+                f"解析器 {self.version_hash[:12]} 字段漂移，但失败样本没有HTML且ID不是URL，无法处理，不加入队列"
+                "（drift 命令可用 --input 提供原始HTML）: " + "; ".join(format_drift_report(report))
+            )
+            return None
+        samples.extend(self.baseline_samples)
+
+        alert_id = self.registry.add_drift_alert(self.version_hash, report['action'], report, samples)
+        if alert_id is None:
+            logger.info(f"解析器 {self.version_hash[:12]} 已有待处理的漂移告警")
+        else:
+            logger.warning(
+                f"解析器 {self.version_hash[:12]} 字段漂移，已加入队列（{report['action']}，{len(self.samples)} 个失败样本，"
+                f"{len(self.baseline_samples)} 个基线页面）: "
+                + "; ".join(format_drift_report(report))
+            )
+        return alert_id
+
+    def _state_path(self) -> Optional[Path]:
+        return self.registry.root / "drift" / f"{self.version_hash}.json" if self.registry else None
+
+    def save(self):
+        """保存状态（没有注册表时不保存）"""
+        path = self._state_path()
+        if path is not None:
+            _atomic_write(path, json.dumps(self.state()))
+
+    def state(self) -> Dict:
+        """可 JSON 序列化的状态（不含样本的HTML）"""
+        return {
+            'version_hash': self.version_hash,
+            'fields': self.fields,
+            'records': self.records,
+            'errors': self.errors,
+            'baseline_records': self.baseline_records,
+            'baseline_errors': self.baseline_errors,
+            'baseline': self.baseline,
+            'buckets': list(self.buckets),
+            'since_alert': self.since_alert,
+            'samples': [[doc_id, None, reason] for doc_id, _, reason in self.samples],
+            'baseline_samples': self.baseline_samples,
+            'fed_outputs': self.fed_outputs,
+        }
+
+    def load_state(self, state: Dict):
+        if state.get('version_hash') != self.version_hash:
+            raise ValueError(f"漂移状态属于其他解析器版本: {state.get('version_hash')}")
+        if not self._fixed_fields:
+            self.fields = state['fields']
+        self.records = state['records']
+        self.errors = state.get('errors', 0)
+        self.baseline_records = state['baseline_records']
+        self.baseline_errors = state['baseline_errors']
+        self.baseline = state['baseline']
+        self.buckets.extend(state['buckets'])
+        self.since_alert = state['since_alert']
+        self.samples.extend(tuple(sample) for sample in state['samples'])
+        self.baseline_samples = state.get('baseline_samples', [])
+        self.fed_outputs = state.get('fed_outputs', [])
+
+
+def format_drift_report(report: Dict) -> List[str]:
+    """漂移报告的可读摘要（每个漂移字段一行）"""
+    lines = []
+    for name in report['drifted_fields']:
+        stats = report['fields'][name]
+        lines.append(
+            f"{name}: 填充率 {stats['baseline_fill'] or 0:.1%} -> {stats['window_fill'] or 0:.1%}，"
+            f"类型距离 {stats['type_distance']:.2f}，长度偏移 {stats['length_shift']:.2f}，模式距离 {stats['pattern_distance']:.2f}"
+        )
+    if report.get('error_rise', 0) >= 0.01:
+        lines.append(
+            f"解析错误率 {report['baseline_error_rate'] or 0:.1%} -> {report['window_error_rate'] or 0:.1%}"
+        )
+    return lines
+
+
+def iter_output_records(output_path: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    读取批量解析输出，产出 (文档ID, {'data', 'error'})
+
+    JSONL 文件逐行读取；Parquet / Arrow 分片目录按批读取（需要 pyarrow）
+    """
+    from .columnar_output import ERROR_COLUMN, ID_COLUMN, PARSE_TIME_COLUMN
+
+    path = Path(output_path)
+    if path.is_file():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record['id'], {'data': record.get('data'), 'error': record.get('error')}
+        return
+
+    import pyarrow.dataset as ds
+
+    parts = sorted(path.glob("part-*"))
+    if not parts:
+        raise FileNotFoundError(f"找不到批量解析输出: {output_path}")
+    format = "parquet" if parts[0].suffix == ".parquet" else "arrow"
+    dataset = ds.dataset([str(p) for p in parts], format=format)
+    meta = (ID_COLUMN, ERROR_COLUMN, PARSE_TIME_COLUMN)
+    for batch in dataset.to_batches():
+        for row in batch.to_pylist():
+            data = {name: value for name, value in row.items() if name not in meta}
+            yield row[ID_COLUMN], {'data': data, 'error': row[ERROR_COLUMN]}
+
+
+def load_monitor(
+    version_hash: str,
+    registry: Optional[ParserRegistry] = None,
+    fields: List[str] = None
+) -> FieldDriftMonitor:
+    """按配置创建监控器，注册表中保存过该版本的状态时从状态继续"""
+    monitor = FieldDriftMonitor(
+        version_hash,
+        fields=fields,
+        baseline_size=settings.drift_baseline_size,
+        window_size=settings.drift_window_size,
+        window_buckets=settings.drift_window_buckets,
+        min_records=settings.drift_min_records,
+        fill_drop_threshold=settings.drift_fill_drop_threshold,
+        shape_threshold=settings.drift_shape_threshold,
+        length_threshold=settings.drift_length_threshold,
+        max_samples=settings.drift_max_samples,
+        baseline_pages=settings.drift_baseline_pages,
+        registry=registry
+    )
+    path = monitor._state_path()
+    if path is not None and path.exists():
+        monitor.load_state(json.loads(path.read_text(encoding="utf-8")))
+    return monitor
+
+
+def monitor_for_parser(parser_path: str) -> FieldDriftMonitor:
+    """解析器对应的监控器（字段取自 Schema 配置，状态和告警保存在解析器所在的注册表中）"""
+    from .columnar_output import load_schema_fields, schema_path_for_parser
+
+    schema_path = schema_path_for_parser(parser_path)
+    fields = list(load_schema_fields(schema_path)) if schema_path else None
+    version_hash = content_hash(Path(parser_path).read_text(encoding="utf-8"))
+    return load_monitor(version_hash, registry_for_parser(parser_path), fields)
+
+
+def feed_records(
+    monitor: FieldDriftMonitor,
+    records: Iterable[Tuple[str, Dict]],
+    check_every: int = 1000,
+    documents: Iterable[Tuple[str, str]] = None
+) -> Dict:
+    """
+    把已有的批量解析输出送入监控器，每 check_every 条记录检查一次
+
+    Args:
+        documents: 批量解析的输入（见 bulk_parse.iter_documents，可选），与输出按顺序一一对应，
+            提供时失败样本和基线页面带有HTML，告警可以直接处理
+
+    Returns:
+        最后一次检查的漂移报告
+    """
+    documents = iter(documents) if documents is not None else None
+    count = 0
+    for doc_id, outcome in records:
+        html = None
+        if documents is not None:
+            source_id, html = next(documents, (None, None))
+            if source_id != doc_id:
+                raise ValueError(f"批量解析输出与输入不对应: 输出 {doc_id}，输入 {source_id}")
+        monitor.observe(doc_id, outcome, html)
+        count += 1
+        if count % check_every == 0:
+            monitor.check_and_alert()
+    report = monitor.check_and_alert()
+    monitor.save()
+    return report
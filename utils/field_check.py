@@ -0,0 +1,153 @@
+"""
+字段级检查
+逐字段检查解析结果：缺失、为空、类型错误，或与视觉提取的参考值不一致
+"""
+import difflib
+import re
+from typing import Dict, List, Optional
+
+
+FIELD_OK = "ok"
+FIELD_MISSING = "missing"
+FIELD_EMPTY = "empty"
+FIELD_WRONG_TYPE = "wrong_type"
+FIELD_MISMATCH = "mismatch"
+
+# 会导致页面验证失败的状态；参考值来自视觉模型，不一致只作为提示
+FAILING_STATUSES = (FIELD_MISSING, FIELD_EMPTY, FIELD_WRONG_TYPE)
+
+STATUS_LABELS = {
+    FIELD_OK: "正常",
+    FIELD_MISSING: "缺失",
+    FIELD_EMPTY: "为空",
+    FIELD_WRONG_TYPE: "类型错误",
+    FIELD_MISMATCH: "与参考值不一致",
+}
+
+_NUMBER = re.compile(r"^[^\d\-+]*[-+]?\d[\d,，]*(\.\d+)?[^\d]*$")
+_WHITESPACE = re.compile(r"\s+")
+
+# 文本相似度低于该值视为不一致
+_MATCH_RATIO = 0.8
+
+
+def _type_matches(value, expected_type: str) -> bool:
+    """检查值是否符合 schema 声明的类型，未知类型不检查"""
+    if expected_type == "string":
+        return isinstance(value, str)
+    if expected_type == "number":
+        if isinstance(value, bool):
+            return False
+        if isinstance(value, (int, float)):
+            return True
+        # 带单位或货币符号的数字文本（如 "¥1,299.00"）也可以接受
+        return isinstance(value, str) and bool(_NUMBER.match(value.strip()))
+    if expected_type == "array":
+        return isinstance(value, (list, tuple))
+    if expected_type == "object":
+        return isinstance(value, dict)
+    if expected_type == "boolean":
+        return isinstance(value, bool)
+    return True
+
+
+def _normalize_text(value) -> str:
+    return _WHITESPACE.sub(" ", str(value)).strip().lower()
+
+
+def _values_match(actual, expected) -> bool:
+    """标量值的宽松比较：包含关系或文本相似度足够高"""
+    a, e = _normalize_text(actual), _normalize_text(expected)
+    if not e:
+        return True
+    if e in a or (a in e and len(a) >= len(e) * 0.5):
+        return True
+    return difflib.SequenceMatcher(None, a, e).ratio() >= _MATCH_RATIO
+
+
+def check_field(data: Dict, name: str, field_info: Dict, expected=None) -> Dict:
+    """
+    检查单个字段
+
+    Args:
+        data: 解析结果
+        name: 字段名
+        field_info: schema 中的字段定义（type / required 等）
+        expected: 视觉提取的参考值（可选）
+
+    Returns:
+        {'field', 'status', 'required', 'actual', 'expected', 'message'}
+    """
+    field_info = field_info if isinstance(field_info, dict) else {}
+    expected_type = field_info.get('type', '')
+    result = {
+        'field': name, 'status': FIELD_OK, 'required': is_required(field_info),
+        'actual': None, 'expected': expected, 'message': '',
+    }
+
+    if name not in data:
+        result['status'] = FIELD_MISSING
+        result['message'] = "解析结果中没有该字段"
+        return result
+
+    value = data[name]
+    result['actual'] = value
+    if value is None or (isinstance(value, (str, list, tuple, dict)) and not value) or (
+        isinstance(value, str) and not value.strip()
+    ):
+        result['status'] = FIELD_EMPTY
+        result['message'] = f"字段值为空: {value!r}"
+        return result
+
+    if not _type_matches(value, expected_type):
+        result['status'] = FIELD_WRONG_TYPE
+        result['message'] = f"期望类型 {expected_type}，实际为 {type(value).__name__}"
+        return result
+
+    if expected not in (None, '', [], {}) and not isinstance(expected, (list, dict)) \
+            and not isinstance(value, (list, dict)) and not _values_match(value, expected):
+        result['status'] = FIELD_MISMATCH
+        result['message'] = f"提取值 {str(value)[:80]!r} 与参考值 {str(expected)[:80]!r} 不一致"
+
+    return result
+
+
+def check_fields(data: Dict, target_fields: Dict, expected_values: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    检查解析结果中的所有目标字段
+
+    Args:
+        data: 解析结果
+        target_fields: 字段名 -> 字段定义
+        expected_values: 字段名 -> 参考值（可选）
+
+    Returns:
+        字段名 -> 检查结果
+    """
+    expected_values = expected_values or {}
+    data = data if isinstance(data, dict) else {}
+    return {
+        name: check_field(data, name, info, expected_values.get(name))
+        for name, info in target_fields.items()
+    }
+
+
+def is_required(field_info) -> bool:
+    return field_info.get('required', True) if isinstance(field_info, dict) else True
+
+
+def failing_fields(field_results: Dict[str, Dict], target_fields: Dict) -> List[str]:
+    """导致页面验证失败的必需字段"""
+    return [
+        name for name, result in field_results.items()
+        if result['status'] in FAILING_STATUSES and is_required(target_fields.get(name))
+    ]
+
+
+def expected_values_from_schema(schema: Dict) -> Dict:
+    """从视觉提取的 schema 中取出各字段的参考值"""
+    return {
+        name: info.get('value')
+        for name, info in (schema or {}).items()
+        if isinstance(info, dict) and 'value' in info
+    }
@@ -0,0 +1,286 @@
+"""
+字段级评分
+将解析结果与视觉提取的参考值逐字段比较，计算加权的页面得分和字段得分
+
+- 文本：Unicode 规范化、大小写和空白归一后计算相似度
+- 数字：去掉货币符号、单位和千分位后按相对误差评分
+- 日期：多种写法统一为 YYYY-MM-DD 后比较
+- 列表：长度在容差内视为一致，元素按最佳匹配的相似度评分
+
+得分矩阵（页面 × 字段）和加权汇总使用 numpy 计算，数字比较批量完成，文本相似度按值对缓存
+"""
+import difflib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+import numpy as np
+from .field_check import _type_matches, is_required
+
+
+# 必需字段与可选字段的默认权重，字段定义中的 weight 优先
+REQUIRED_WEIGHT = 1.0
+OPTIONAL_WEIGHT = 0.5
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER_TEXT = re.compile(r"[-+]?\d+(?:\.\d+)?")
+_DATE_PATTERNS = (
+    re.compile(r"(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})"),
+    re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})"),
+)
+_MONTHS = {
+    name: i + 1 for i, name in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+    )
+}
+_MONTH_NAME_DATE = re.compile(r"(\d{1,2})?\s*([a-z]{3})[a-z]*\.?\s+(\d{1,2})?,?\s*(\d{4})")
+
+# 比较长文本（如正文）时只取前缀，避免相似度计算成本随长度平方增长
+_MAX_COMPARE_CHARS = 2000
+# 列表最多比较的参考元素数
+_MAX_LIST_ITEMS = 50
+
+
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, (str, list, tuple, dict)) and not value) or (
+        isinstance(value, str) and not value.strip()
+    )
+
+
+def normalize_text(value) -> str:
+    """文本归一：NFKC 规范化（全角转半角）、小写、合并空白"""
+    text = unicodedata.normalize("NFKC", str(value))
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def normalize_number(value) -> Optional[float]:
+    """
+    数字归一：去掉货币符号、单位和千分位
+
+    Returns:
+        数值，无法识别时返回 None
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = normalize_text(value).replace(",", "")
+    match = _NUMBER_TEXT.search(text)
+    if not match:
+        return None
+    number = float(match.group())
+    if "万" in text[match.end():match.end() + 2]:
+        number *= 10000
+    return number
+
+
+def normalize_date(value) -> Optional[str]:
+    """
+    日期归一为 YYYY-MM-DD
+
+    支持 2024-01-05、2024/1/5、2024年1月5日、01/05/2024、Jan 5, 2024、5 January 2024 等写法
+
+    Returns:
+        归一后的日期，无法识别时返回 None
+    """
+    if not isinstance(value, str):
+        return None
+    text = normalize_text(value)
+    match = _DATE_PATTERNS[0].search(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = _DATE_PATTERNS[1].search(text)
+        if match:
+            month, day, year = match.groups()
+        else:
+            match = _MONTH_NAME_DATE.search(text)
+            if not match or match.group(2) not in _MONTHS:
+                return None
+            day = match.group(1) or match.group(3)
+            if not day:
+                return None
+            month, year = _MONTHS[match.group(2)], match.group(4)
+    month, day = int(month), int(day)
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{int(year):04d}-{month:02d}-{day:02d}"
+
+
+@lru_cache(maxsize=65536)
+def text_similarity(actual: str, expected: str) -> float:
+    """
+    归一化文本的相似度（0~1）
+
+    提取值包含完整参考值（如带有标签前缀）时视为匹配
+    """
+    a, e = normalize_text(actual)[:_MAX_COMPARE_CHARS], normalize_text(expected)[:_MAX_COMPARE_CHARS]
+    if not e:
+        return 1.0
+    if not a:
+        return 0.0
+    if a == e or e in a:
+        return 1.0
+    matcher = difflib.SequenceMatcher(None, a, e, autojunk=False)
+    if matcher.quick_ratio() < 0.3:
+        return matcher.quick_ratio()
+    return matcher.ratio()
+
+
+def _list_score(actual, expected, length_tolerance: float) -> float:
+    """列表得分：长度得分与元素得分各占一半"""
+    expected = list(expected)
+    actual = list(actual)
+    if not expected:
+        return 1.0
+
+    diff = abs(len(actual) - len(expected))
+    if diff <= length_tolerance * len(expected):
+        length_score = 1.0
+    else:
+        length_score = min(len(actual), len(expected)) / max(len(actual), len(expected))
+
+    scalars = [str(item) for item in actual if not isinstance(item, (dict, list))]
+    reference = [str(item) for item in expected[:_MAX_LIST_ITEMS] if not isinstance(item, (dict, list))]
+    if not reference or not scalars:
+        return length_score
+    content_score = float(np.mean([
+        max(text_similarity(item, ref) for item in scalars[:_MAX_LIST_ITEMS * 2]) for ref in reference
+    ]))
+    return 0.5 * length_score + 0.5 * content_score
+
+
+class _ScoreMatrix:
+    """页面 × 字段得分矩阵；数字比较延迟到 finish 时批量计算"""
+
+    def __init__(self, rows: int, cols: int):
+        self.scores = np.zeros((rows, cols), dtype=np.float64)
+        self._number_cells: List[tuple] = []
+        self._numbers: List[tuple] = []
+
+    def add_number(self, row: int, col: int, actual: float, expected: float):
+        self._number_cells.append((row, col))
+        self._numbers.append((actual, expected))
+
+    def finish(self, number_tolerance: float) -> np.ndarray:
+        if self._numbers:
+            rows, cols = np.array(self._number_cells).T
+            actual, expected = np.array(self._numbers, dtype=np.float64).T
+            relative = np.abs(actual - expected) / np.maximum(np.abs(expected), 1e-9)
+            # 相对误差在容差内得满分，超出后线性衰减到 0
+            self.scores[rows, cols] = np.where(
+                relative <= number_tolerance, 1.0, np.clip(1.0 - relative, 0.0, 1.0)
+            )
+        return self.scores
+
+
+def field_weights(target_fields: Dict) -> Dict[str, float]:
+    """各字段的权重：字段定义中的 weight，否则必需字段 1、可选字段 0.5"""
+    weights = {}
+    for name, info in target_fields.items():
+        weight = info.get('weight') if isinstance(info, dict) else None
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+            weight = REQUIRED_WEIGHT if is_required(info) else OPTIONAL_WEIGHT
+        weights[name] = float(weight)
+    return weights
+
+
+def score_records(
+    records: List,
+    target_fields: Dict,
+    expected: Optional[List[Optional[Dict]]] = None,
+    number_tolerance: float = 0.01,
+    list_length_tolerance: float = 0.2
+) -> Dict:
+    """
+    对一批解析结果逐字段评分
+
+    单元格得分：类型错误为 0；缺失或为空时，参考值也明确为空、或可选字段没有非空参考值时为 1，否则为 0；
+    有值但没有参考值时为 1；有参考值时按数字、日期、列表或文本的方式与参考值比较，得分在 0~1 之间
+
+    Args:
+        records: 解析结果列表（非 dict 的结果视为所有字段缺失）
+        target_fields: 字段名 -> 字段定义（type / required / weight）
+        expected: 与 records 对齐的参考值列表，每项为 {字段名: 参考值} 或 None
+        number_tolerance: 数字比较的相对误差容差
+        list_length_tolerance: 列表长度的相对容差
+
+    Returns:
+        {
+            'score': 所有页面得分的平均值,
+            'page_scores': 各页面的加权得分,
+            'field_scores': 字段名 -> 各页面的平均得分,
+            'cell_scores': 各页面的 {字段名: 得分},
+        }
+    """
+    names = list(target_fields)
+    expected = expected or [None] * len(records)
+    if not records or not names:
+        return {
+            'score': 0.0,
+            'page_scores': [0.0] * len(records),
+            'field_scores': {},
+            'cell_scores': [{} for _ in records],
+        }
+
+    matrix = _ScoreMatrix(len(records), len(names))
+    for row, (data, reference) in enumerate(zip(records, expected)):
+        data = data if isinstance(data, dict) else {}
+        reference = reference or {}
+        for col, name in enumerate(names):
+            info = target_fields[name] if isinstance(target_fields[name], dict) else {}
+            value = data.get(name)
+            ref = reference.get(name)
+            if _is_empty(value):
+                # 页面上本来就没有该字段：参考值明确为空，或可选字段没有非空的参考值
+                if (name in reference and _is_empty(ref)) or (not is_required(info) and _is_empty(ref)):
+                    matrix.scores[row, col] = 1.0
+                continue
+            if not _type_matches(value, info.get('type', '')):
+                continue
+
+            if _is_empty(ref):
+                matrix.scores[row, col] = 1.0
+                continue
+
+            if isinstance(ref, (list, tuple)):
+                if isinstance(value, (list, tuple)):
+                    matrix.scores[row, col] = _list_score(value, ref, list_length_tolerance)
+                else:
+                    matrix.scores[row, col] = text_similarity(str(value), str(ref[0]))
+                continue
+            if isinstance(ref, dict) or isinstance(value, (dict, list, tuple)):
+                # 结构化的值没有可靠的比较方式，只检查存在和类型
+                matrix.scores[row, col] = 1.0
+                continue
+
+            if info.get('type') == 'number' or isinstance(ref, (int, float)):
+                actual_number, expected_number = normalize_number(value), normalize_number(ref)
+                if actual_number is not None and expected_number is not None:
+                    matrix.add_number(row, col, actual_number, expected_number)
+                    continue
+
+            expected_date = normalize_date(ref)
+            if expected_date is not None:
+                actual_date = normalize_date(value)
+                if actual_date is not None:
+                    matrix.scores[row, col] = 1.0 if actual_date == expected_date else 0.0
+                    continue
+
+            matrix.scores[row, col] = text_similarity(str(value), str(ref))
+
+    scores = matrix.finish(number_tolerance)
+    weight_map = field_weights(target_fields)
+    weights = np.array([weight_map[name] for name in names], dtype=np.float64)
+    total_weight = weights.sum()
+    page_scores = scores @ weights / total_weight if total_weight else scores.mean(axis=1)
+    field_means = scores.mean(axis=0)
+
+    return {
+        'score': float(page_scores.mean()),
+        'page_scores': [float(s) for s in page_scores],
+        'field_scores': {name: float(field_means[i]) for i, name in enumerate(names)},
+        'cell_scores': [
+            {name: float(scores[row, i]) for i, name in enumerate(names)} for row in range(len(records))
+        ],
+    }
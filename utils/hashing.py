@@ -0,0 +1,17 @@
+"""
+内容哈希工具
+为解析器代码、Schema、页面内容等生成稳定的内容哈希
+"""
+import hashlib
+import json
+from typing import Any
+
+
+def content_hash(text: str) -> str:
+    """计算文本内容的 SHA-256 哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def json_hash(obj: Any) -> str:
+    """计算JSON对象的哈希（键排序，保证同一结构得到同一哈希）"""
+    return content_hash(json.dumps(obj, ensure_ascii=False, sort_keys=True))
@@ -0,0 +1,176 @@
+"""
+多样本差异提取
+对齐多个样本页面的DOM结构，以第一个样本为参考，只保留其他样本中模板之外的差异区域
+"""
+import re
+from typing import Dict, List, Set
+import lxml.html
+from lxml import etree
+
+
+# 与页面模板无关、不需要出现在提示词中的标签
+_DROPPED_TAGS = ("script", "style", "noscript", "svg", "template", "iframe", "link", "meta")
+
+_DIGITS = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+# 差异区域内文本的最大长度
+_MAX_TEXT_CHARS = 80
+
+
+def clean_html_tree(html: str):
+    """解析HTML并移除脚本、样式和注释"""
+    try:
+        root = lxml.html.fromstring(html)
+    except Exception:
+        return None
+    etree.strip_elements(root, *_DROPPED_TAGS, with_tail=False)
+    etree.strip_elements(root, etree.Comment, with_tail=False)
+    return root
+
+
+def _step(el) -> str:
+    """元素在结构路径中的一段：标签 + 归一化后的class"""
+    classes = sorted(_DIGITS.sub("#", c) for c in (el.get("class") or "").split())
+    return el.tag + "".join(f".{c}" for c in classes)
+
+
+def _structural_paths(root) -> Set[str]:
+    """页面中出现的全部结构路径（不含位置序号，因此列表长度不影响对齐）"""
+    paths = set()
+
+    def walk(el, prefix):
+        path = f"{prefix}>{_step(el)}" if prefix else _step(el)
+        paths.add(path)
+        for child in el:
+            if isinstance(child.tag, str):
+                walk(child, path)
+
+    walk(root, "")
+    return paths
+
+
+def compact_element(el) -> str:
+    """序列化差异区域：去掉内联样式，截断过长的文本"""
+    el = lxml.html.fromstring(etree.tostring(el, encoding="unicode"))
+    for node in el.iter():
+        if not isinstance(node.tag, str):
+            continue
+        node.attrib.pop("style", None)
+        for attr in [a for a in node.attrib if a.startswith("on")]:
+            node.attrib.pop(attr)
+        for name in ("text", "tail"):
+            value = getattr(node, name)
+            if value:
+                value = _WHITESPACE.sub(" ", value)
+                if len(value) > _MAX_TEXT_CHARS:
+                    value = value[:_MAX_TEXT_CHARS] + "…"
+                setattr(node, name, value)
+    return etree.tostring(el, encoding="unicode", method="html").strip()
+
+
+def _has_content(el) -> bool:
+    """区域中是否有文本、链接或图片，纯装饰性的空元素不保留"""
+    if (el.text_content() or "").strip():
+        return True
+    return any(node.tag in ("a", "img") for node in el.iter() if isinstance(node.tag, str))
+
+
+def _varying_regions(root, reference_paths: Set[str], max_regions: int, max_region_chars: int) -> List[Dict]:
+    """找出参考样本中不存在的最大子树"""
+    regions = []
+    seen = set()
+
+    def walk(el, prefix):
+        if len(regions) >= max_regions:
+            return
+        path = f"{prefix}>{_step(el)}" if prefix else _step(el)
+        if path not in reference_paths:
+            if path not in seen and _has_content(el):
+                seen.add(path)
+                html = compact_element(el)
+                if len(html) > max_region_chars:
+                    html = html[:max_region_chars] + "\n<!-- ... (截断) -->"
+                regions.append({'path': path, 'html': html})
+            return
+        for child in el:
+            if isinstance(child.tag, str):
+                walk(child, path)
+
+    walk(root, "")
+    return regions
+
+
+def _short_path(path: str, depth: int = 3) -> str:
+    return " > ".join(path.split(">")[-depth:])
+
+
+def build_differential_samples(
+    samples: List[Dict],
+    max_regions: int = 8,
+    max_region_chars: int = 1500
+) -> str:
+    """
+    对齐多个样本页面，生成模板差异说明
+
+    以第一个样本为参考：
+    1. 其他样本中存在、参考样本中不存在的结构（可选区块、不同布局）保留其HTML片段
+    2. 参考样本中存在、但部分样本缺失的结构列出路径
+
+    相同模板中只是文本不同的区域不会重复出现，因此即使样本很多，差异说明也保持紧凑
+
+    Args:
+        samples: [{'url', 'html'}]，第一个为参考样本
+        max_regions: 每个样本最多保留的差异区域数
+        max_region_chars: 每个差异区域的最大字符数
+
+    Returns:
+        差异说明文本，没有可用差异时返回空字符串
+    """
+    if len(samples) < 2:
+        return ""
+
+    roots = [(s.get('url', ''), clean_html_tree(s.get('html') or '')) for s in samples]
+    roots = [(url, root) for url, root in roots if root is not None]
+    if len(roots) < 2:
+        return ""
+
+    reference_url, reference_root = roots[0]
+    reference_paths = _structural_paths(reference_root)
+
+    sections = []
+    missing_counts: Dict[str, int] = {}
+    for idx, (url, root) in enumerate(roots[1:], 2):
+        paths = _structural_paths(root)
+        for path in reference_paths - paths:
+            missing_counts[path] = missing_counts.get(path, 0) + 1
+
+        regions = _varying_regions(root, reference_paths, max_regions, max_region_chars)
+        if not regions:
+            continue
+        blocks = [f"### 样本{idx}: {url}"]
+        for region in regions:
+            blocks.append(f"<!-- 结构路径: {_short_path(region['path'])} -->\n{region['html']}")
+        sections.append("\n".join(blocks))
+
+    # 只报告最外层的缺失结构，子元素缺失是其必然结果
+    missing = sorted(
+        path for path in missing_counts
+        if not any(path.startswith(other + ">") for other in missing_counts)
+    )
+    others = len(roots) - 1
+
+    if not sections and not missing:
+        return ""
+
+    lines = [f"以样本1（{reference_url}）为参考，共对齐 {len(roots)} 个样本。"]
+    if sections:
+        lines.append("## 其他样本中出现、参考样本中没有的区域")
+        lines.extend(sections)
+    if missing:
+        lines.append("## 参考样本中存在、但部分样本缺失的结构（对应字段应视为可选）")
+        lines.extend(
+            f"- {_short_path(path)}（{missing_counts[path]}/{others} 个样本缺失）"
+            for path in missing[:max_regions * 2]
+        )
+    return "\n".join(lines)
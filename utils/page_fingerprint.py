@@ -0,0 +1,79 @@
+"""
+页面结构指纹
+基于标签路径和class词元计算 SimHash，用于识别同一模板的页面
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Iterable, List
+import lxml.html
+
+
+FINGERPRINT_BITS = 64
+
+# 不反映页面模板结构的标签
+_IGNORED_TAGS = {"script", "style", "noscript", "svg", "path", "meta", "link", "br"}
+
+# 参与路径特征的祖先层数
+_PATH_DEPTH = 3
+
+_DIGITS = re.compile(r"\d+")
+
+
+def _structural_features(html: str) -> Counter:
+    """提取结构特征：祖先标签路径 + 带class词元的标签"""
+    features = Counter()
+    try:
+        root = lxml.html.fromstring(html)
+    except Exception:
+        return features
+
+    for el in root.iter():
+        tag = el.tag
+        if not isinstance(tag, str) or tag in _IGNORED_TAGS:
+            continue
+
+        ancestors = [a.tag for a in el.iterancestors() if isinstance(a.tag, str)][:_PATH_DEPTH]
+        features[">".join(reversed(ancestors + [tag]))] += 1
+
+        for token in (el.get("class") or "").split():
+            # 动态生成的class通常带数字，归一化后再参与计算
+            features[f"{tag}.{_DIGITS.sub('#', token)}"] += 1
+
+    return features
+
+
+def _feature_hash(feature: str) -> int:
+    """特征的64位哈希"""
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def structural_fingerprint(html: str) -> int:
+    """
+    计算页面的结构指纹（64位 SimHash）
+
+    重复出现的特征使用双对数权重，避免列表长度不同的同模板页面指纹差异过大
+    """
+    weights = [0.0] * FINGERPRINT_BITS
+    for feature, count in _structural_features(html).items():
+        weight = 1.0 + math.log(1.0 + math.log(count))
+        h = _feature_hash(feature)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += weight if (h >> bit) & 1 else -weight
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个指纹之间的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+def fingerprint_pages(pages: Iterable[str]) -> List[int]:
+    """批量计算页面指纹"""
+    return [structural_fingerprint(html) for html in pages if html]
@@ -0,0 +1,146 @@
+"""
+解析性能剖析
+对单个文档的解析记录峰值内存（tracemalloc）和各提取函数的累计耗时（cProfile），
+提取函数按名称对应到目标字段
+"""
+import cProfile
+import pstats
+import sys
+import tracemalloc
+from typing import Dict, List, Optional
+
+
+# 解析入口方法，其累计耗时包含全部提取函数，不作为提取函数统计
+_ENTRY_POINTS = ("parse", "parse_many", "__init__")
+
+
+def _parser_functions(parser) -> Dict[tuple, str]:
+    """
+    解析器类及其模块中定义的函数
+
+    Returns:
+        (文件名, 起始行号, 函数名) -> 限定名，与 cProfile 统计的键一致
+    """
+    functions = {}
+    candidates = [(f"{type(parser).__name__}.{name}", value) for name, value in vars(type(parser)).items()]
+    module = sys.modules.get(type(parser).__module__)
+    if module is not None:
+        candidates += [(name, value) for name, value in vars(module).items() if callable(value)]
+
+    for qualified, value in candidates:
+        func = getattr(value, "__func__", value)
+        code = getattr(func, "__code__", None)
+        if code is not None and code.co_name not in _ENTRY_POINTS:
+            functions[(code.co_filename, code.co_firstlineno, code.co_name)] = qualified
+    return functions
+
+
+def _field_for(function_name: str, field_names: List[str]) -> Optional[str]:
+    """按函数名匹配字段（取最长的匹配，避免 title 与 subtitle 混淆）"""
+    lowered = function_name.lower()
+    matches = [name for name in field_names if name.lower() in lowered]
+    return max(matches, key=len) if matches else None
+
+
+def profile_document(parser, html: str, field_names: List[str] = None, top_n: int = 5) -> Dict:
+    """
+    剖析单个文档的解析
+
+    tracemalloc 和 cProfile 会拖慢解析，因此这里的耗时只用于比较各提取函数，
+    页面的实际耗时以未剖析时的 parse_time_ms / cpu_time_ms 为准
+
+    Args:
+        parser: WebPageParser 实例
+        html: 文档
+        field_names: 目标字段名（用于把提取函数对应到字段）
+        top_n: 保留最慢的提取函数数量
+
+    Returns:
+        {'peak_memory_kb', 'extractors': [{'function', 'field', 'cumulative_ms', 'calls'}], 'error'}
+    """
+    field_names = field_names or []
+    profile = {'peak_memory_kb': None, 'extractors': [], 'error': None}
+
+    profiler = cProfile.Profile()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        profiler.enable()
+    except ValueError:
+        # 已有其他剖析器在运行（如调试器），只记录内存
+        profiler = None
+    try:
+        parser.parse(html)
+    except Exception as e:
+        profile['error'] = str(e) or type(e).__name__
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        profile['peak_memory_kb'] = max(tracemalloc.get_traced_memory()[1] - baseline, 0) / 1024
+        if not was_tracing:
+            tracemalloc.stop()
+
+    if profiler is None:
+        return profile
+
+    functions = _parser_functions(parser)
+    extractors = []
+    for key, (_, calls, _, cumulative, _) in pstats.Stats(profiler).stats.items():
+        qualified = functions.get(key)
+        if qualified is None:
+            continue
+        extractors.append({
+            'function': qualified,
+            'field': _field_for(key[2], field_names),
+            'cumulative_ms': cumulative * 1000,
+            'calls': calls,
+        })
+    extractors.sort(key=lambda e: e['cumulative_ms'], reverse=True)
+    profile['extractors'] = extractors[:top_n]
+    return profile
+
+
+def merge_extractors(totals: Dict[str, Dict], profile: Optional[Dict]):
+    """把单个页面的剖析结果累加到 函数名 -> {'function', 'field', 'total_ms', 'pages'}"""
+    for extractor in (profile or {}).get('extractors', []):
+        entry = totals.setdefault(
+            extractor['function'],
+            {'function': extractor['function'], 'field': extractor['field'], 'total_ms': 0.0, 'pages': 0}
+        )
+        entry['total_ms'] += extractor['cumulative_ms']
+        entry['pages'] += 1
+
+
+def slowest_extractors(profiles: List[Optional[Dict]], top_n: int = 5) -> List[Dict]:
+    """
+    汇总多个页面的剖析结果，按累计耗时排序提取函数
+
+    Returns:
+        [{'function', 'field', 'total_ms', 'pages'}]
+    """
+    totals: Dict[str, Dict] = {}
+    for profile in profiles:
+        merge_extractors(totals, profile)
+    return sorted(totals.values(), key=lambda e: e['total_ms'], reverse=True)[:top_n]
+
+
+def format_profile(profile: Optional[Dict], parse_time_ms: float = None, cpu_time_ms: float = None) -> str:
+    """将剖析结果格式化为便于阅读（和交给修复器）的文本"""
+    lines = []
+    if parse_time_ms is not None:
+        timing = f"解析耗时 {parse_time_ms:.1f}ms"
+        if cpu_time_ms is not None:
+            timing += f"（CPU {cpu_time_ms:.1f}ms）"
+        lines.append(timing)
+    if profile:
+        if profile.get('peak_memory_kb') is not None:
+            lines.append(f"峰值内存 {profile['peak_memory_kb']:.0f}KB")
+        if profile.get('extractors'):
+            lines.append("最慢的提取函数（剖析模式下的累计耗时）:")
+            for e in profile['extractors']:
+                field = f" [字段 {e['field']}]" if e['field'] else ""
+                lines.append(f"  - {e['function']}{field}: {e['cumulative_ms']:.1f}ms，调用 {e['calls']} 次")
+    return "\n".join(lines)
@@ -0,0 +1,462 @@
+"""
+解析器静态性能检查
+在执行生成的解析器之前基于AST发现已知的低效或危险写法
+"""
+import ast
+import re
+from typing import Dict, FrozenSet, List, Optional
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+
+# 会重新解析整份HTML的构造调用
+_HTML_PARSE_CALLS = {"BeautifulSoup", "fromstring", "document_fromstring", "HTML"}
+
+# 会访问网络的模块
+_NETWORK_MODULES = {
+    "DrissionPage", "requests", "httpx", "aiohttp", "urllib3", "selenium", "playwright",
+    "urllib.request", "http.client",
+}
+
+# 会访问网络的调用
+_NETWORK_CALLS = {"ChromiumPage", "WebPage", "SessionPage", "urlopen"}
+
+# re 模块中接收正则表达式的函数
+_REGEX_FUNCS = {"compile", "search", "match", "fullmatch", "findall", "finditer", "sub", "subn", "split"}
+
+# 判断字符集是否相交时使用的字符样本（Latin-1 加少量常见的非 ASCII 字符）
+_SAMPLE_CHARS = tuple(chr(i) for i in range(256)) + ("\u3000", "中", "\u2014")
+
+_REPEAT_OPS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEAT_OPS.add(sre_constants.POSSESSIVE_REPEAT)
+
+_CATEGORY_PATTERNS = {
+    sre_constants.CATEGORY_DIGIT: re.compile(r"\d"),
+    sre_constants.CATEGORY_NOT_DIGIT: re.compile(r"\D"),
+    sre_constants.CATEGORY_SPACE: re.compile(r"\s"),
+    sre_constants.CATEGORY_NOT_SPACE: re.compile(r"\S"),
+    sre_constants.CATEGORY_WORD: re.compile(r"\w"),
+    sre_constants.CATEGORY_NOT_WORD: re.compile(r"\W"),
+}
+
+# 贪婪的无界匹配
+_UNBOUNDED_WILDCARD = re.compile(r"\.[*+](?!\?)")
+
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+
+def _class_chars(items) -> FrozenSet[str]:
+    """字符类 [...] 可以匹配的样本字符"""
+    negate = False
+    chars = set()
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op == sre_constants.RANGE:
+            chars.update(c for c in _SAMPLE_CHARS if av[0] <= ord(c) <= av[1])
+        elif op == sre_constants.CATEGORY and av in _CATEGORY_PATTERNS:
+            chars.update(c for c in _SAMPLE_CHARS if _CATEGORY_PATTERNS[av].match(c))
+        else:
+            # 无法判断的类别按可以匹配任意字符处理
+            return frozenset(_SAMPLE_CHARS)
+    return frozenset(c for c in _SAMPLE_CHARS if c not in chars) if negate else frozenset(chars)
+
+
+def _pattern_chars(items) -> FrozenSet[str]:
+    """子模式可能消耗的所有样本字符"""
+    chars = set()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op == sre_constants.NOT_LITERAL:
+            chars.update(c for c in _SAMPLE_CHARS if ord(c) != av)
+        elif op == sre_constants.ANY:
+            chars.update(_SAMPLE_CHARS)
+        elif op == sre_constants.IN:
+            chars.update(_class_chars(av))
+        elif op in _REPEAT_OPS:
+            chars.update(_pattern_chars(av[2]))
+        elif op == sre_constants.SUBPATTERN:
+            chars.update(_pattern_chars(av[-1]))
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                chars.update(_pattern_chars(branch))
+        elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            chars.update(_SAMPLE_CHARS)
+    return frozenset(chars)
+
+
+def _inner_repeats(items) -> List:
+    """子模式中（任意深度）无上限的量词，返回各自重复的子模式"""
+    found = []
+    for op, av in items:
+        if op in _REPEAT_OPS:
+            if av[1] == sre_constants.MAXREPEAT:
+                found.append(av[2])
+            found.extend(_inner_repeats(av[2]))
+        elif op == sre_constants.SUBPATTERN:
+            found.extend(_inner_repeats(av[-1]))
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                found.extend(_inner_repeats(branch))
+    return found
+
+
+def _required_separators(items) -> List[FrozenSet[str]]:
+    """子模式顶层必须匹配的单个字符（字面量或字符类）各自的字符集"""
+    separators = []
+    for op, av in items:
+        if op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.IN, sre_constants.ANY):
+            separators.append(_pattern_chars([(op, av)]))
+        elif op == sre_constants.SUBPATTERN:
+            separators.extend(_required_separators(av[-1]))
+        elif op in _REPEAT_OPS and av[0] >= 1:
+            separators.extend(_required_separators(av[2]))
+    return separators
+
+
+def _nested_quantifiers(items, findings: List[tuple]):
+    r"""
+    查找量词内部嵌套的无上限量词，每项为 (是否可能灾难性回溯, 描述)
+
+    外层无上限重复的内容中，若存在一个必须匹配、且与所有内层重复字符集都不相交的分隔字符，
+    例如 (\d+\.)+、([^,]+,)+，各轮重复的边界是确定的，回溯是线性的；
+    没有这样的分隔符时（如 (a+)+、(\w+\s?)+），同一段文本有指数级的划分方式
+    """
+    for op, av in items:
+        if op in _REPEAT_OPS:
+            low, high, body = av
+            inner = _inner_repeats(body)
+            if inner:
+                if high != sre_constants.MAXREPEAT:
+                    findings.append((False, f"外层重复次数有上限 ({low}, {high})"))
+                else:
+                    inner_chars = frozenset().union(*(_pattern_chars(r) for r in inner))
+                    separated = any(not (sep & inner_chars) for sep in _required_separators(body))
+                    findings.append((not separated, "内层重复之间有分隔符" if separated else "内层重复之间没有分隔符"))
+            _nested_quantifiers(body, findings)
+        elif op == sre_constants.SUBPATTERN:
+            _nested_quantifiers(av[-1], findings)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                _nested_quantifiers(branch, findings)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _nested_quantifiers(av[1], findings)
+
+
+def analyze_nested_quantifiers(pattern: str) -> List[tuple]:
+    """分析正则表达式中的嵌套量词，无法解析时返回空列表"""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    findings = []
+    _nested_quantifiers(list(parsed), findings)
+    return findings
+
+
+def _finding(rule: str, severity: str, node: Optional[ast.AST], message: str) -> Dict:
+    return {
+        'rule': rule,
+        'severity': severity,
+        'line': getattr(node, 'lineno', None),
+        'message': message,
+    }
+
+
+def _call_name(node: ast.Call) -> str:
+    """调用的函数名（取属性访问的最后一段）"""
+    func = node.func
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    if isinstance(func, ast.Name):
+        return func.id
+    return ""
+
+
+def _call_owner(node: ast.Call) -> str:
+    """属性调用的对象名，例如 re.search 返回 're'"""
+    func = node.func
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+        return func.value.id
+    return ""
+
+
+def _is_main_guard(node: ast.AST) -> bool:
+    """判断是否为 if __name__ == '__main__' 语句"""
+    return (
+        isinstance(node, ast.If)
+        and isinstance(node.test, ast.Compare)
+        and isinstance(node.test.left, ast.Name)
+        and node.test.left.id == "__name__"
+    )
+
+
+class _ParserLinter(ast.NodeVisitor):
+    """遍历AST并收集问题"""
+
+    def __init__(self, class_name: str = "WebPageParser"):
+        self.class_name = class_name
+        self.findings: List[Dict] = []
+        # 函数名 -> 该函数中构建文档树的调用
+        self.html_parse_calls: Dict[str, List[ast.Call]] = {}
+        self._function = "<module>"
+        self._loop_depth = 0
+        self._scope_depth = 0
+        self._in_parser_class = False
+        # parse_many 的文档序列参数，逐个文档的循环不算作重复解析
+        self._document_iterables = set()
+        # 是否在 parse_many 内部：其中剩余的循环内解析只作为警告，不阻止运行
+        self._in_parse_many = False
+
+    @property
+    def _on_parse_path(self) -> bool:
+        """模块顶层（导入时执行）或解析器类内部（解析时执行）"""
+        return self._scope_depth == 0 or self._in_parser_class
+
+    def visit_If(self, node: ast.If):
+        # __main__ 部分只在命令行运行时执行，不在导入和解析路径上
+        if _is_main_guard(node) and self._scope_depth == 0:
+            return
+        self.generic_visit(node)
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        saved, self._in_parser_class = self._in_parser_class, self._in_parser_class or node.name == self.class_name
+        self.generic_visit(node)
+        self._in_parser_class = saved
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        saved = self._document_iterables, self._function, self._in_parse_many
+        if self._in_parser_class and node.name == "parse_many":
+            self._document_iterables = {arg.arg for arg in node.args.args[1:2]}
+            self._in_parse_many = True
+        self._function = f"{saved[1]}.{node.name}"
+        self.generic_visit(node)
+        self._document_iterables, self._function, self._in_parse_many = saved
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_For(self, node: ast.For):
+        # 迭代对象只求值一次，不算在循环体内
+        self.visit(node.iter)
+        self.visit(node.target)
+        per_document = self._is_document_iter(node.iter)
+        if not per_document:
+            self._loop_depth += 1
+        for child in node.body + node.orelse:
+            self.visit(child)
+        if not per_document:
+            self._loop_depth -= 1
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node: ast.While):
+        self._loop_depth += 1
+        self.generic_visit(node)
+        self._loop_depth -= 1
+
+    def _is_document_iter(self, node: ast.AST) -> bool:
+        """逐个文档的迭代：parse_many 的文档参数本身，或 enumerate(文档) / zip(文档, ...)"""
+        if isinstance(node, ast.Name):
+            return node.id in self._document_iterables
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.args:
+            if node.func.id == "enumerate":
+                return self._is_document_iter(node.args[0])
+            if node.func.id == "zip":
+                return any(self._is_document_iter(arg) for arg in node.args)
+        return False
+
+    def _visit_comprehension(self, node: ast.AST):
+        generators = node.generators
+        # 第一个生成器的迭代对象只求值一次；遍历文档参数时每个元素是一个文档，不算作循环
+        self.visit(generators[0].iter)
+        per_document = self._is_document_iter(generators[0].iter)
+        if not per_document:
+            self._loop_depth += 1
+        self.visit(generators[0].target)
+        for condition in generators[0].ifs:
+            self.visit(condition)
+        # 之后的生成器在每个文档内部循环
+        nested = per_document and len(generators) > 1
+        if nested:
+            self._loop_depth += 1
+        for generator in generators[1:]:
+            self.visit(generator)
+        for field in ("elt", "key", "value"):
+            if hasattr(node, field):
+                self.visit(getattr(node, field))
+        if nested:
+            self._loop_depth -= 1
+        if not per_document:
+            self._loop_depth -= 1
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self._check_network_module(node, alias.name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = node.module or ""
+        self._check_network_module(node, module)
+
+    def generic_visit(self, node: ast.AST):
+        if not isinstance(node, _SCOPE_NODES):
+            super().generic_visit(node)
+            return
+
+        # 进入新的函数作用域时，外层循环不再直接包裹其中的代码
+        saved_loop_depth, self._loop_depth = self._loop_depth, 0
+        self._scope_depth += 1
+        super().generic_visit(node)
+        self._scope_depth -= 1
+        self._loop_depth = saved_loop_depth
+
+    def visit_Call(self, node: ast.Call):
+        name = _call_name(node)
+        in_loop = self._loop_depth > 0
+
+        if name in _HTML_PARSE_CALLS:
+            self.html_parse_calls.setdefault(self._function, []).append(node)
+            if in_loop:
+                # parse_many 中无法确认循环是否逐个文档，只提示不阻止
+                self.findings.append(_finding(
+                    "html-parse-in-loop", "warning" if self._in_parse_many else "error", node,
+                    f"在循环中调用 {name}(...) 重新解析HTML，应只解析一次并复用文档树"
+                ))
+
+        if name in ("find_all", "findAll") and self._matches_everything(node):
+            self.findings.append(_finding(
+                "find-all-everything", "error" if in_loop else "warning", node,
+                f"{name}({'True' if node.args else ''}) 会遍历整棵文档树"
+                + ("，且位于循环中" if in_loop else "") + "，应使用具体的标签或选择器"
+            ))
+
+        if name in ("select", "select_one") and self._is_wildcard_selector(node) and in_loop:
+            self.findings.append(_finding(
+                "select-everything-in-loop", "error", node,
+                f"在循环中使用 {name}('*') 遍历整棵文档树，应使用具体的选择器"
+            ))
+
+        if _call_owner(node) == "re" and name in _REGEX_FUNCS:
+            self._check_regex(node, name)
+
+        if name in _NETWORK_CALLS and self._on_parse_path:
+            self.findings.append(_finding(
+                "network-call", "error", node,
+                f"解析路径中调用 {name}(...) 访问网络，解析器只能处理传入的HTML"
+            ))
+
+        self.generic_visit(node)
+
+    def _check_network_module(self, node: ast.AST, module: str):
+        if not self._on_parse_path:
+            return
+        if any(module == m or module.startswith(m + ".") for m in _NETWORK_MODULES):
+            self.findings.append(_finding(
+                "network-import", "error", node,
+                f"在导入或解析路径中引入网络模块 {module}，应移到 if __name__ == '__main__' 部分"
+            ))
+
+    @staticmethod
+    def _matches_everything(node: ast.Call) -> bool:
+        """find_all(True) 或不带任何过滤条件的 find_all()"""
+        if node.args:
+            first = node.args[0]
+            return isinstance(first, ast.Constant) and first.value is True
+        return not any(kw.arg not in ("limit", "recursive") for kw in node.keywords)
+
+    @staticmethod
+    def _is_wildcard_selector(node: ast.Call) -> bool:
+        return bool(node.args) and isinstance(node.args[0], ast.Constant) and node.args[0].value == "*"
+
+    def _check_regex(self, node: ast.Call, name: str):
+        pattern = node.args[0] if node.args else None
+        if isinstance(pattern, ast.Constant) and isinstance(pattern.value, str):
+            nested = analyze_nested_quantifiers(pattern.value)
+            catastrophic = [reason for dangerous, reason in nested if dangerous]
+            if catastrophic:
+                self.findings.append(_finding(
+                    "catastrophic-regex", "error", node,
+                    f"正则表达式 {pattern.value!r} 含嵌套量词且{catastrophic[0]}，可能导致灾难性回溯"
+                ))
+            elif nested:
+                self.findings.append(_finding(
+                    "nested-quantifier", "warning", node,
+                    f"正则表达式 {pattern.value!r} 含嵌套量词（{nested[0][1]}），回溯有界，但应确认必要性"
+                ))
+            elif _UNBOUNDED_WILDCARD.search(pattern.value) and self._has_dotall(node):
+                self.findings.append(_finding(
+                    "unbounded-regex", "warning", node,
+                    f"正则表达式 {pattern.value!r} 在 DOTALL 模式下使用贪婪的 .* / .+，会扫描到文档末尾"
+                ))
+
+        for arg in node.args[1:]:
+            if self._is_whole_document(arg):
+                self.findings.append(_finding(
+                    "regex-on-document", "warning", node,
+                    f"re.{name}(...) 作用于整份序列化文档，应先用选择器缩小范围"
+                ))
+
+    @staticmethod
+    def _has_dotall(node: ast.Call) -> bool:
+        flags = [kw.value for kw in node.keywords if kw.arg == "flags"] + node.args[2:]
+        return any("DOTALL" in ast.dump(flag) or "'S'" in ast.dump(flag) for flag in flags)
+
+    @staticmethod
+    def _is_whole_document(node: ast.AST) -> bool:
+        """str(soup)、soup.prettify()、soup.decode() 等序列化整份文档的表达式"""
+        if not isinstance(node, ast.Call):
+            return False
+        if isinstance(node.func, ast.Name) and node.func.id == "str":
+            return bool(node.args) and isinstance(node.args[0], ast.Name) and "soup" in node.args[0].id.lower()
+        return _call_name(node) in ("prettify", "decode")
+
+
+def lint_parser_code(code: str) -> List[Dict]:
+    """
+    静态检查解析器代码中的性能问题
+
+    Args:
+        code: 解析器代码
+
+    Returns:
+        问题列表，每项包含 rule / severity (error|warning) / line / message
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [{'rule': 'syntax', 'severity': 'error', 'line': e.lineno, 'message': f"语法错误: {e.msg}"}]
+
+    linter = _ParserLinter()
+    linter.visit(tree)
+
+    # 同一个函数中多次构建文档树，通常是对同一份HTML重复解析
+    for calls in linter.html_parse_calls.values():
+        if len(calls) > 1:
+            lines = ", ".join(str(call.lineno) for call in calls)
+            linter.findings.append(_finding(
+                "repeated-html-parse", "warning", calls[1],
+                f"HTML被解析了 {len(calls)} 次（第 {lines} 行），应只解析一次并传递文档树"
+            ))
+
+    return sorted(linter.findings, key=lambda f: (f['severity'] != 'error', f['line'] or 0))
+
+
+def has_blocking_findings(findings: List[Dict]) -> bool:
+    """是否存在需要拒绝执行的问题"""
+    return any(f['severity'] == 'error' for f in findings)
+
+
+def format_findings(findings: List[Dict]) -> str:
+    """格式化问题列表，用于日志和修复提示词"""
+    return "\n".join(
+        f"[{f['severity']}] 第{f['line']}行 {f['rule']}: {f['message']}" for f in findings
+    )
@@ -0,0 +1,167 @@
+"""
+解析器模块加载器
+按内容哈希为每个解析器版本分配独立的模块命名空间，并在磁盘上缓存编译后的字节码
+"""
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import types
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+from config.settings import settings
+from .hashing import content_hash
+from .stream_parse import StreamingParser, is_stream_spec
+
+
+# 生成解析器模块的命名空间前缀
+MODULE_PREFIX = "generated_parser_v_"
+
+
+class ParserLoader:
+    """
+    解析器模块加载器
+
+    - 模块名为 generated_parser_v_<内容哈希>，不同版本互不覆盖，相同内容只加载一次
+    - 编译后的字节码按 <内容哈希>.<解释器标签>.bin 缓存在磁盘上，再次加载时不重新编译
+    - 常驻模块数量超过 max_modules 时按最近最少使用的顺序卸载
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_modules: int = 512):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_modules = max_modules
+        self._modules: "OrderedDict[str, types.ModuleType]" = OrderedDict()
+        self._lock = threading.RLock()
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def module_name(version_hash: str) -> str:
+        return f"{MODULE_PREFIX}{version_hash}"
+
+    def _bytecode_path(self, version_hash: str) -> Optional[Path]:
+        if not self.cache_dir:
+            return None
+        tag = sys.implementation.cache_tag or "py"
+        return self.cache_dir / f"{version_hash}.{tag}.bin"
+
+    def _compile(self, source: str, version_hash: str, parser_path: str) -> types.CodeType:
+        """读取字节码缓存，不存在或损坏时重新编译并写入缓存"""
+        cache_path = self._bytecode_path(version_hash)
+        if cache_path and cache_path.exists():
+            try:
+                return marshal.loads(cache_path.read_bytes())
+            except (EOFError, ValueError, TypeError) as e:
+                logger.warning(f"字节码缓存损坏，重新编译: {cache_path} ({str(e)})")
+
+        code = compile(source, parser_path, "exec")
+        if cache_path:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=".tmp_", suffix=".bin")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(marshal.dumps(code))
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logger.warning(f"写入字节码缓存失败: {str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return code
+
+    def load_module(self, parser_path: str) -> types.ModuleType:
+        """
+        加载解析器模块
+
+        Args:
+            parser_path: 解析器代码路径
+
+        Returns:
+            模块对象（相同内容的文件返回同一个模块）
+        """
+        source = Path(parser_path).read_text(encoding="utf-8")
+        version_hash = content_hash(source)
+
+        with self._lock:
+            module = self._modules.get(version_hash)
+            if module is not None:
+                self._modules.move_to_end(version_hash)
+                return module
+
+            name = self.module_name(version_hash)
+            module = types.ModuleType(name)
+            module.__file__ = str(parser_path)
+            module.__version_hash__ = version_hash
+            # 注册到 sys.modules，使模块内的 dataclass、pickle 等能找到自身
+            sys.modules[name] = module
+            try:
+                exec(self._compile(source, version_hash, str(parser_path)), module.__dict__)
+            except BaseException:
+                sys.modules.pop(name, None)
+                raise
+
+            self._modules[version_hash] = module
+            while self.max_modules and len(self._modules) > self.max_modules:
+                evicted, _ = self._modules.popitem(last=False)
+                sys.modules.pop(self.module_name(evicted), None)
+                logger.debug(f"卸载最久未使用的解析器模块: {evicted[:12]}")
+
+        return module
+
+    def load_parser(self, parser_path: str):
+        """
+        加载解析器并创建 WebPageParser 实例
+
+        parser_path 是 JSON 流式解析规格时创建 StreamingParser（见 stream_parse）
+        """
+        if is_stream_spec(parser_path):
+            return StreamingParser.from_file(parser_path, chunk_size=settings.stream_parse_chunk_size)
+        module = self.load_module(parser_path)
+        if not hasattr(module, "WebPageParser"):
+            raise Exception("解析器中未找到WebPageParser类")
+        return module.WebPageParser()
+
+    def unload(self, version_hash: str) -> bool:
+        """
+        卸载解析器模块（磁盘上的字节码缓存保留）
+
+        Returns:
+            模块是否曾被加载
+        """
+        with self._lock:
+            module = self._modules.pop(version_hash, None)
+            sys.modules.pop(self.module_name(version_hash), None)
+        return module is not None
+
+    def unload_all(self):
+        """卸载全部解析器模块"""
+        with self._lock:
+            for version_hash in list(self._modules):
+                self.unload(version_hash)
+
+    def loaded(self) -> List[str]:
+        """当前常驻的解析器版本哈希"""
+        with self._lock:
+            return list(self._modules)
+
+    def stats(self) -> Dict:
+        """加载器状态"""
+        cached = len(list(self.cache_dir.glob("*.bin"))) if self.cache_dir else 0
+        return {'resident_modules': len(self.loaded()), 'bytecode_cache_entries': cached}
+
+
+_default_loader: Optional[ParserLoader] = None
+_default_lock = threading.Lock()
+
+
+def get_parser_loader() -> ParserLoader:
+    """进程内共享的解析器加载器（按配置创建）"""
+    global _default_loader
+    with _default_lock:
+        if _default_loader is None:
+            _default_loader = ParserLoader(
+                cache_dir=settings.parser_bytecode_cache_dir or None,
+                max_modules=settings.parser_loader_max_modules
+            )
+        return _default_loader
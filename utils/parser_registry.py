@@ -0,0 +1,489 @@
+"""
+解析器注册表
+按内容哈希存储解析器版本，使用 SQLite 索引元数据，并为每个 (域名, 模板) 维护原子的 current 指针
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+from .hashing import content_hash, json_hash
+from .page_fingerprint import hamming_distance
+
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS versions (
+    hash TEXT PRIMARY KEY,
+    domain TEXT,
+    template TEXT,
+    schema_hash TEXT,
+    model TEXT,
+    parent_hash TEXT,
+    validation_score REAL,
+    success_rate REAL,
+    avg_parse_time_ms REAL,
+    max_parse_time_ms REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_versions_domain ON versions (domain, template);
+
+CREATE TABLE IF NOT EXISTS current (
+    domain TEXT NOT NULL,
+    template TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (domain, template)
+);
+
+CREATE TABLE IF NOT EXISTS fingerprints (
+    hash TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    domain TEXT,
+    template TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (hash, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_domain ON fingerprints (domain, template);
+
+CREATE TABLE IF NOT EXISTS fix_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    domain TEXT,
+    template TEXT,
+    start_hash TEXT,
+    final_hash TEXT,
+    iterations INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    html_context INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS drift_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL,
+    domain TEXT,
+    template TEXT,
+    action TEXT NOT NULL,
+    report TEXT NOT NULL,
+    samples TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result_hash TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_drift_alerts_status ON drift_alerts (status);
+
+CREATE TABLE IF NOT EXISTS pointer_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    domain TEXT NOT NULL,
+    template TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    changed_at REAL NOT NULL
+);
+"""
+
+# 漂移告警状态
+DRIFT_PENDING = "pending"
+DRIFT_DONE = "done"
+DRIFT_FAILED = "failed"
+
+# 可以通过 update_metrics 更新的元数据列
+_METRIC_COLUMNS = ('validation_score', 'success_rate', 'avg_parse_time_ms', 'max_parse_time_ms')
+
+
+def _atomic_write(path: Path, content: str):
+    """先写临时文件再原子替换，避免并发读到半个文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp_", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ParserRegistry:
+    """
+    解析器注册表
+
+    目录结构：
+        <root>/objects/<hash[:2]>/<hash>.py   解析器代码（内容寻址，写入后不再修改）
+        <root>/schemas/<schema_hash>.json     Schema配置
+        <root>/registry.db                    SQLite索引
+
+    同一份代码只会存储一次；切换或回滚版本只需移动 current 指针，不需要重写文件
+    """
+
+    def __init__(self, root: str = "parser_registry"):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.schemas_dir = self.root / "schemas"
+        self.db_path = self.root / "registry.db"
+
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.schemas_dir.mkdir(parents=True, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA_SQL)
+
+    @contextmanager
+    def _connect(self):
+        """每次操作使用独立连接，支持多线程和多进程并发访问"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def path_for(self, version_hash: str) -> Path:
+        """解析器版本对应的代码文件路径"""
+        return self.objects_dir / version_hash[:2] / f"{version_hash}.py"
+
+    def schema_path_for(self, schema_hash: str) -> Path:
+        """Schema配置对应的文件路径"""
+        return self.schemas_dir / f"{schema_hash}.json"
+
+    def put(
+        self,
+        code: str,
+        config: Dict = None,
+        domain: str = None,
+        template: str = None,
+        model: str = None,
+        parent_hash: str = None
+    ) -> Dict:
+        """
+        存储一个解析器版本（相同内容重复存储是幂等的）
+
+        Args:
+            code: 解析器代码
+            config: Schema配置
+            domain: 域名
+            template: 模板/布局类型
+            model: 生成代码使用的模型
+            parent_hash: 修复前的版本哈希
+
+        Returns:
+            版本信息
+        """
+        version_hash = content_hash(code)
+        parser_path = self.path_for(version_hash)
+        if not parser_path.exists():
+            _atomic_write(parser_path, code)
+
+        schema_hash = None
+        if config is not None:
+            schema_hash = json_hash(config)
+            schema_path = self.schema_path_for(schema_hash)
+            if not schema_path.exists():
+                _atomic_write(schema_path, json.dumps(config, ensure_ascii=False, indent=2))
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO versions
+                    (hash, domain, template, schema_hash, model, parent_hash, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (version_hash, domain or '', template or '', schema_hash, model, parent_hash, time.time())
+            )
+
+        logger.debug(f"注册解析器版本: {version_hash[:12]}")
+        return self.get(version_hash)
+
+    def get(self, version_hash: str) -> Optional[Dict]:
+        """获取版本信息"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM versions WHERE hash = ?", (version_hash,)).fetchone()
+        return self._row_to_version(row) if row else None
+
+    def update_metrics(self, version_hash: str, **metrics):
+        """
+        更新版本的验证指标
+
+        Args:
+            version_hash: 版本哈希
+            **metrics: validation_score / success_rate / avg_parse_time_ms / max_parse_time_ms
+        """
+        unknown = set(metrics) - set(_METRIC_COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的指标: {', '.join(sorted(unknown))}")
+        if not metrics:
+            return
+
+        assignments = ", ".join(f"{column} = ?" for column in metrics)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE versions SET {assignments} WHERE hash = ?",
+                (*metrics.values(), version_hash)
+            )
+
+    def set_current(self, domain: str, template: str, version_hash: str):
+        """原子地更新 (域名, 模板) 的 current 指针（指向的版本不变时不写入历史）"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT hash FROM current WHERE domain = ? AND template = ?", (domain or '', template or '')
+            ).fetchone()
+            if row and row['hash'] == version_hash:
+                return
+            conn.execute(
+                """
+                INSERT INTO current (domain, template, hash, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (domain, template) DO UPDATE SET hash = excluded.hash, updated_at = excluded.updated_at
+                """,
+                (domain or '', template or '', version_hash, now)
+            )
+            conn.execute(
+                "INSERT INTO pointer_history (domain, template, hash, changed_at) VALUES (?, ?, ?, ?)",
+                (domain or '', template or '', version_hash, now)
+            )
+        logger.info(f"current 指针更新: {domain}/{template} -> {version_hash[:12]}")
+
+    def get_current(self, domain: str, template: str) -> Optional[Dict]:
+        """获取 (域名, 模板) 当前使用的版本"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT hash FROM current WHERE domain = ? AND template = ?",
+                (domain or '', template or '')
+            ).fetchone()
+        return self.get(row['hash']) if row else None
+
+    def rollback(self, domain: str, template: str) -> Optional[Dict]:
+        """
+        将 current 指针回滚到上一个不同的版本（跳过历史中连续重复的记录）
+
+        Returns:
+            回滚后的版本信息，没有可回滚的版本时返回 None
+        """
+        domain, template = domain or '', template or ''
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, hash FROM pointer_history
+                WHERE domain = ? AND template = ? ORDER BY id DESC
+                """,
+                (domain, template)
+            ).fetchall()
+            previous = next((row for row in rows if row['hash'] != rows[0]['hash']), None) if rows else None
+            if previous is None:
+                return None
+
+            conn.execute(
+                "DELETE FROM pointer_history WHERE domain = ? AND template = ? AND id > ?",
+                (domain, template, previous['id'])
+            )
+            conn.execute(
+                "UPDATE current SET hash = ?, updated_at = ? WHERE domain = ? AND template = ?",
+                (previous['hash'], time.time(), domain, template)
+            )
+
+        logger.info(f"current 指针回滚: {domain}/{template} -> {previous['hash'][:12]}")
+        return self.get(previous['hash'])
+
+    def add_fingerprints(self, version_hash: str, fingerprints: List[int], domain: str = None, template: str = None):
+        """记录已验证解析器对应的页面结构指纹"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO fingerprints (hash, fingerprint, domain, template, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(version_hash, f"{fp:016x}", domain or '', template or '', now) for fp in fingerprints]
+            )
+
+    def find_by_fingerprints(
+        self,
+        fingerprints: List[int],
+        max_distance: int,
+        domain: str,
+        template: str = None,
+        schema_hash: str = None
+    ) -> List[Dict]:
+        """
+        在同一 (域名, 模板) 下查找结构指纹相近的已验证解析器
+
+        每个版本取其与各样本指纹的最小距离，再对样本求平均，
+        只返回所有样本都在 max_distance 以内的版本，按平均距离升序排列
+
+        Args:
+            fingerprints: 样本页面的结构指纹
+            max_distance: 最大汉明距离
+            domain: 域名（必需，只在该域名的指纹中查找）
+            template: 模板/布局类型
+            schema_hash: 只返回使用该 Schema 配置的版本
+
+        Returns:
+            版本信息列表，附带 fingerprint_distance
+        """
+        if not fingerprints or not domain:
+            return []
+
+        query = """
+            SELECT f.hash, f.fingerprint FROM fingerprints f JOIN versions v ON v.hash = f.hash
+            WHERE f.domain = ? AND f.template = ?
+        """
+        params = [domain, template or '']
+        if schema_hash is not None:
+            query += " AND v.schema_hash = ?"
+            params.append(schema_hash)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        known: Dict[str, List[int]] = {}
+        for row in rows:
+            known.setdefault(row['hash'], []).append(int(row['fingerprint'], 16))
+
+        matches = []
+        for version_hash, stored in known.items():
+            distances = [min(hamming_distance(fp, other) for other in stored) for fp in fingerprints]
+            if max(distances) <= max_distance:
+                matches.append((sum(distances) / len(distances), version_hash))
+
+        results = []
+        for distance, version_hash in sorted(matches):
+            version = self.get(version_hash)
+            if version:
+                version['fingerprint_distance'] = distance
+                results.append(version)
+        return results
+
+    def record_fix_run(
+        self,
+        start_hash: str,
+        final_hash: str,
+        iterations: int,
+        passed: bool,
+        html_context: bool,
+        domain: str = None,
+        template: str = None
+    ):
+        """记录一次迭代修复的结果，用于跟踪修复所需的迭代次数"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO fix_runs
+                    (domain, template, start_hash, final_hash, iterations, passed, html_context, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (domain or '', template or '', start_hash, final_hash, iterations,
+                 int(passed), int(html_context), time.time())
+            )
+
+    def fix_run_stats(self) -> List[Dict]:
+        """
+        按是否提供HTML上下文汇总迭代修复结果
+
+        Returns:
+            [{'html_context', 'runs', 'pass_rate', 'avg_iterations_to_pass'}]
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT html_context,
+                       COUNT(*) AS runs,
+                       AVG(passed) AS pass_rate,
+                       AVG(CASE WHEN passed THEN iterations END) AS avg_iterations_to_pass
+                FROM fix_runs GROUP BY html_context ORDER BY html_context
+                """
+            ).fetchall()
+        return [dict(row, html_context=bool(row['html_context'])) for row in rows]
+
+    def add_drift_alert(self, version_hash: str, action: str, report: Dict, samples: List[Dict]) -> Optional[int]:
+        """
+        加入一条字段漂移告警（见 drift_monitor）
+
+        Returns:
+            告警ID；该版本已有待处理的告警时不重复加入，返回 None
+        """
+        version = self.get(version_hash) or {}
+        now = time.time()
+        with self._connect() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM drift_alerts WHERE hash = ? AND status = ?", (version_hash, DRIFT_PENDING)
+            ).fetchone()
+            if exists:
+                return None
+            cursor = conn.execute(
+                """
+                INSERT INTO drift_alerts
+                    (hash, domain, template, action, report, samples, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (version_hash, version.get('domain', ''), version.get('template', ''), action,
+                 json.dumps(report, ensure_ascii=False), json.dumps(samples, ensure_ascii=False),
+                 DRIFT_PENDING, now, now)
+            )
+            return cursor.lastrowid
+
+    def drift_alerts(self, status: str = DRIFT_PENDING) -> List[Dict]:
+        """按创建顺序列出告警，status 为 None 时列出全部"""
+        query, params = "SELECT * FROM drift_alerts", []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY id"
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            dict(row, report=json.loads(row['report']), samples=json.loads(row['samples']))
+            for row in rows
+        ]
+
+    def update_drift_alert(self, alert_id: int, status: str, result_hash: str = None):
+        """更新告警的处理结果"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE drift_alerts SET status = ?, result_hash = ?, updated_at = ? WHERE id = ?",
+                (status, result_hash, time.time(), alert_id)
+            )
+
+    def list_versions(self, domain: str = None, template: str = None) -> List[Dict]:
+        """列出版本，按创建时间倒序"""
+        query = "SELECT * FROM versions"
+        conditions, params = [], []
+        if domain is not None:
+            conditions.append("domain = ?")
+            params.append(domain)
+        if template is not None:
+            conditions.append("template = ?")
+            params.append(template)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._row_to_version(row) for row in rows]
+
+    def _row_to_version(self, row: sqlite3.Row) -> Dict:
+        """数据库行转换为版本信息"""
+        version = dict(row)
+        version['parser_path'] = str(self.path_for(version['hash']))
+        version['config_path'] = (
+            str(self.schema_path_for(version['schema_hash'])) if version['schema_hash'] else None
+        )
+        return version
+
+
+def registry_for_parser(parser_path: str) -> Optional[ParserRegistry]:
+    """
+    解析器代码所在的注册表
+
+    注册表中的代码位于 <root>/objects/<hash[:2]>/<hash>.py，不在注册表中时返回 None
+    """
+    path = Path(parser_path)
+    root = path.parent.parent.parent
+    if path.parent.parent.name != "objects" or not (root / "registry.db").exists():
+        return None
+    return ParserRegistry(str(root))
@@ -0,0 +1,81 @@
+"""
+提示词前缀缓存
+将提示词组织为"稳定前缀 + 可变负载"，并在后端支持时附加缓存标记
+"""
+from typing import Dict, List
+from urllib.parse import urlparse
+from config.settings import settings
+
+
+# 支持显式 cache_control 标记的模型前缀
+_CACHE_CONTROL_MODEL_PREFIXES = ("claude",)
+
+
+def _backend_supports_cache_control(api_base: str) -> bool:
+    """API Base 的主机是否在已知支持 cache_control 的后端列表中（含子域名）"""
+    host = (urlparse(api_base or "").hostname or "").lower()
+    return any(host == known or host.endswith("." + known) for known in settings.prompt_cache_hosts)
+
+
+def cache_hints_enabled(model_name: str, api_base: str = None) -> bool:
+    """
+    判断是否为该模型附加缓存标记
+
+    PROMPT_CACHE_MODE:
+        off:  关闭（默认；OpenAI 等后端仍会对相同前缀自动缓存）
+        auto: 仅当模型为Claude系列且后端在 PROMPT_CACHE_HOSTS 中时启用，
+              不认识 cache_control 的 OpenAI 兼容中转可能拒绝或错误转发带标记的内容块
+        on:   始终启用
+    """
+    mode = settings.prompt_cache_mode
+    if mode == "on":
+        return True
+    if mode != "auto":
+        return False
+    if not (model_name or "").lower().startswith(_CACHE_CONTROL_MODEL_PREFIXES):
+        return False
+    return _backend_supports_cache_control(api_base or settings.openai_api_base)
+
+
+def _text_block(text: str, cache: bool) -> Dict:
+    """构建文本内容块"""
+    block = {"type": "text", "text": text}
+    if cache:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def build_cached_messages(
+    system_text: str,
+    stable_text: str,
+    variable_text: str,
+    model_name: str
+) -> List[Dict]:
+    """
+    构建有利于前缀缓存的消息列表
+
+    消息顺序固定为：静态系统指令 → 同一任务内不变的负载 → 每次调用都会变化的负载，
+    前两部分在重复调用之间逐字节一致，可以命中后端的前缀缓存
+
+    Args:
+        system_text: 静态系统指令（所有调用共享）
+        stable_text: 同一任务内不变的负载（如目标结构、参考HTML）
+        variable_text: 每次调用变化的负载
+        model_name: 模型名称，决定是否附加 cache_control 标记
+    """
+    if not cache_hints_enabled(model_name):
+        return [
+            {"role": "system", "content": system_text},
+            {"role": "user", "content": "\n".join(t for t in (stable_text, variable_text) if t)},
+        ]
+
+    user_blocks = []
+    if stable_text:
+        user_blocks.append(_text_block(stable_text, cache=True))
+    if variable_text:
+        user_blocks.append(_text_block(variable_text, cache=False))
+
+    return [
+        {"role": "system", "content": [_text_block(system_text, cache=True)]},
+        {"role": "user", "content": user_blocks},
+    ]
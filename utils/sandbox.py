@@ -0,0 +1,328 @@
+"""
+解析器沙箱
+在独立的工作进程池中运行生成的解析器，限制每次解析的CPU时间、内存和墙钟时间，结果通过IPC返回
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from loguru import logger
+from .batch_parse import parse_documents
+from .parse_profile import profile_document
+from .parser_loader import get_parser_loader
+
+
+class SandboxLoadError(Exception):
+    """解析器在工作进程中加载失败"""
+
+
+class ParseTimeout(BaseException):
+    """
+    单次解析超出CPU时间限制
+
+    继承 BaseException，避免被生成代码中的 except Exception 吞掉
+    """
+
+
+def _on_cpu_limit(signum, frame):
+    raise ParseTimeout()
+
+
+def _apply_memory_limit(memory_mb: int):
+    """限制工作进程的地址空间，超出时解析抛出 MemoryError"""
+    if not memory_mb:
+        return
+    try:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"无法设置沙箱内存限制: {str(e)}")
+
+
+def _set_cpu_timer(seconds: float):
+    """按进程CPU时间计时（ITIMER_PROF），超时触发 SIGPROF"""
+    if seconds and hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_PROF, seconds)
+
+
+def _portable(outcome: Dict) -> Dict:
+    """确保结果可以通过IPC传输（解析结果按JSON兼容的形式序列化）"""
+    data = outcome.get('data')
+    if data is not None:
+        try:
+            data = json.loads(json.dumps(data, ensure_ascii=False, default=str))
+        except (TypeError, ValueError):
+            data = str(data)
+    return dict(outcome, data=data)
+
+
+def _profile_with_limit(parser, html: str, field_names: List[str], cpu_seconds: float) -> Dict:
+    """在CPU时间限制下剖析单个文档"""
+    _set_cpu_timer(cpu_seconds)
+    try:
+        return profile_document(parser, html, field_names)
+    except ParseTimeout:
+        return {'peak_memory_kb': None, 'extractors': [], 'error': f"剖析超出CPU时间限制 ({cpu_seconds}s)"}
+    finally:
+        _set_cpu_timer(0)
+
+
+def _failure(error: str, details: str = '', timed_out: bool = False) -> Dict:
+    failure = {'data': None, 'error': error, 'details': details, 'parse_time_ms': None, 'cpu_time_ms': None}
+    if timed_out:
+        # 超时与机器负载有关，调用方据此区分于确定性的解析错误
+        failure['timed_out'] = True
+    return failure
+
+
+def _worker_main(conn, cpu_seconds: float, memory_mb: int):
+    """
+    工作进程主循环
+
+    接收 (parser_path, documents, profile_fields)，逐个文档返回 ('result', 序号, 结果)，结束时返回 ('done',)；
+    profile_fields 不为 None 时，解析成功的文档再剖析一次，结果附在 'profile' 中；
+    解析器加载失败时返回 ('load_error', 错误信息)
+    """
+    _apply_memory_limit(memory_mb)
+    if hasattr(signal, "SIGPROF"):
+        signal.signal(signal.SIGPROF, _on_cpu_limit)
+
+    loader = get_parser_loader()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+
+        parser_path, documents, profile_fields = job
+        try:
+            # 模块按内容哈希常驻在工作进程中，字节码在工作进程之间通过磁盘缓存共享
+            parser = loader.load_parser(parser_path)
+        except Exception as e:
+            conn.send(('load_error', str(e)))
+            continue
+
+        index = 0
+        while index < len(documents):
+            results = parse_documents(parser, documents[index:])
+            try:
+                while True:
+                    cpu_start = time.process_time()
+                    _set_cpu_timer(cpu_seconds)
+                    try:
+                        outcome = next(results)
+                    except StopIteration:
+                        break
+                    finally:
+                        _set_cpu_timer(0)
+                    outcome['cpu_time_ms'] = (time.process_time() - cpu_start) * 1000
+                    if profile_fields is not None and not outcome['error']:
+                        outcome['profile'] = _profile_with_limit(
+                            parser, documents[index], profile_fields, cpu_seconds
+                        )
+                    conn.send(('result', index, _portable(outcome)))
+                    index += 1
+            except ParseTimeout:
+                # 超时的文档记为失败，其余文档重新开始批量解析
+                conn.send(('result', index, _failure(f"解析超出CPU时间限制 ({cpu_seconds}s)", timed_out=True)))
+                index += 1
+
+        conn.send(('done',))
+
+
+class _Worker:
+    """单个工作进程及其通信管道"""
+
+    def __init__(self, ctx, cpu_seconds: float, memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, cpu_seconds, memory_mb), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        """强制结束工作进程"""
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.conn.close()
+
+    def stop(self):
+        """通知工作进程退出"""
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=5)
+        except (OSError, BrokenPipeError):
+            pass
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class SandboxPool:
+    """
+    解析器沙箱进程池
+
+    - 每个文档的解析受 CPU 时间限制（ITIMER_PROF）和墙钟超时保护，超时或崩溃的工作进程会被重建
+    - 工作进程的地址空间受 memory_mb 限制
+    - 文档按工作进程数分块并行解析，多个线程（如锦标赛候选）可以共享同一个进程池
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        cpu_seconds: float = 10.0,
+        memory_mb: int = 1024,
+        timeout_seconds: float = 30.0,
+        start_method: str = "spawn"
+    ):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.timeout_seconds = timeout_seconds
+        self._ctx = multiprocessing.get_context(start_method)
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._closed = False
+        atexit.register(self.close)
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.cpu_seconds, self.memory_mb)
+
+    def _acquire(self) -> _Worker:
+        """获取空闲工作进程，不足时按需启动"""
+        with self._lock:
+            if self._idle.empty() and self._started < self.workers:
+                self._started += 1
+                return self._spawn()
+        return self._idle.get()
+
+    def _release(self, worker: _Worker):
+        self._idle.put(worker if worker.alive() else self._spawn())
+
+    def parse_documents(
+        self,
+        parser_path: str,
+        documents: List[str],
+        profile_fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        在沙箱中批量解析文档
+
+        Args:
+            parser_path: 解析器代码路径
+            documents: HTML 文档列表
+            profile_fields: 不为 None 时剖析每个解析成功的文档（字段名用于对应提取函数）
+
+        Returns:
+            与输入顺序一致的结果列表，每项为 {'data', 'error', 'details', 'parse_time_ms', 'cpu_time_ms'}，
+            剖析时另含 'profile'（见 utils.parse_profile.profile_document）
+
+        Raises:
+            SandboxLoadError: 解析器加载失败
+        """
+        if self._closed:
+            raise RuntimeError("沙箱进程池已关闭")
+        if not documents:
+            return []
+
+        size = -(-len(documents) // self.workers)
+        chunks = [documents[i:i + size] for i in range(0, len(documents), size)]
+        futures = [
+            self._executor.submit(self._run_chunk, parser_path, chunk, profile_fields) for chunk in chunks
+        ]
+
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def parse_chunk(
+        self,
+        parser_path: str,
+        documents: List[str],
+        profile_fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        在一个工作进程中解析一块文档（不再拆分）
+
+        供调用方自行分块并保持多个块同时在途（如批量解析大量文档），返回格式同 parse_documents
+        """
+        if self._closed:
+            raise RuntimeError("沙箱进程池已关闭")
+        if not documents:
+            return []
+        return self._run_chunk(parser_path, documents, profile_fields)
+
+    def _run_chunk(
+        self,
+        parser_path: str,
+        documents: List[str],
+        profile_fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """在一个工作进程中解析一块文档，处理超时和崩溃"""
+        results: List[Optional[Dict]] = [None] * len(documents)
+        worker = self._acquire()
+        offset = 0
+        try:
+            worker.conn.send((parser_path, documents, profile_fields))
+            while True:
+                current = next((i for i, r in enumerate(results) if r is None), len(documents))
+                failure = None
+                try:
+                    if not worker.conn.poll(self.timeout_seconds):
+                        failure = _failure(f"解析超出墙钟时间限制 ({self.timeout_seconds}s)", timed_out=True)
+                    else:
+                        message = worker.conn.recv()
+                except (EOFError, OSError):
+                    failure = _failure("沙箱工作进程异常退出（可能超出内存限制或崩溃）")
+
+                if failure is not None:
+                    # 结束当前工作进程，当前文档记为失败，其余文档交给新的工作进程
+                    logger.warning(f"沙箱解析失败: {failure['error']}")
+                    worker.kill()
+                    worker = self._spawn()
+                    results[current] = failure
+                    if current + 1 >= len(documents):
+                        break
+                    offset = current + 1
+                    worker.conn.send((parser_path, documents[offset:], profile_fields))
+                    continue
+
+                kind = message[0]
+                if kind == 'load_error':
+                    raise SandboxLoadError(message[1])
+                if kind == 'done':
+                    break
+                _, index, outcome = message
+                results[offset + index] = outcome
+        finally:
+            self._release(worker)
+
+        return [r if r is not None else _failure("沙箱未返回结果") for r in results]
+
+    def close(self):
+        """关闭全部工作进程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=False)
+        while not self._idle.empty():
+            self._idle.get().stop()
@@ -0,0 +1,121 @@
+"""
+序贯检验
+逐个（或逐批）累积页面验证结果，在成功率相对阈值的高低已经有统计结论时提前停止
+
+- wilson：Wilson 置信区间完全位于阈值之上判定通过，完全位于阈值之下判定失败
+- sprt：Wald 序贯概率比检验，H0: p = 阈值 - δ，H1: p = 阈值 + δ
+"""
+import math
+from statistics import NormalDist
+from typing import Optional, Tuple
+
+
+DECISION_PASS = "pass"
+DECISION_FAIL = "fail"
+
+METHOD_WILSON = "wilson"
+METHOD_SPRT = "sprt"
+
+
+def wilson_interval(successes: int, trials: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """
+    成功率的 Wilson 置信区间
+
+    Args:
+        successes: 成功次数
+        trials: 试验次数
+        confidence: 置信水平
+
+    Returns:
+        (下界, 上界)，没有试验时为 (0, 1)
+    """
+    if trials <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+class SequentialTest:
+    """
+    成功率相对阈值的序贯检验
+
+    每次 update 记录一个页面的验证结果；decision 在得出结论后为 pass / fail，否则为 None
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        method: str = METHOD_WILSON,
+        confidence: float = 0.95,
+        indifference: float = 0.1,
+        min_trials: int = 5
+    ):
+        if method not in (METHOD_WILSON, METHOD_SPRT):
+            raise ValueError(f"未知的序贯检验方法: {method}")
+        self.threshold = threshold
+        self.method = method
+        self.confidence = confidence
+        self.min_trials = min_trials
+        self.successes = 0
+        self.trials = 0
+
+        # SPRT 的两个假设与判定边界，第一类和第二类错误率都取 1 - confidence
+        self.p0 = min(max(threshold - indifference, 1e-6), 1 - 1e-6)
+        self.p1 = min(max(threshold + indifference, 1e-6), 1 - 1e-6)
+        error_rate = 1 - confidence
+        self._upper = math.log((1 - error_rate) / error_rate)
+        self._lower = math.log(error_rate / (1 - error_rate))
+        self._llr = 0.0
+
+    def update(self, passed: bool) -> Optional[str]:
+        """记录一个结果，返回当前结论"""
+        self.trials += 1
+        if passed:
+            self.successes += 1
+            self._llr += math.log(self.p1 / self.p0)
+        else:
+            self._llr += math.log((1 - self.p1) / (1 - self.p0))
+        return self.decision
+
+    @property
+    def rate(self) -> float:
+        return self.successes / self.trials if self.trials else 0.0
+
+    @property
+    def interval(self) -> Tuple[float, float]:
+        return wilson_interval(self.successes, self.trials, self.confidence)
+
+    @property
+    def decision(self) -> Optional[str]:
+        if self.trials < self.min_trials:
+            return None
+        if self.method == METHOD_SPRT:
+            if self._llr >= self._upper:
+                return DECISION_PASS
+            if self._llr <= self._lower:
+                return DECISION_FAIL
+            return None
+
+        low, high = self.interval
+        if low >= self.threshold:
+            return DECISION_PASS
+        if high < self.threshold:
+            return DECISION_FAIL
+        return None
+
+    def summary(self) -> dict:
+        low, high = self.interval
+        return {
+            'method': self.method,
+            'decision': self.decision,
+            'successes': self.successes,
+            'trials': self.trials,
+            'success_rate': self.rate,
+            'confidence': self.confidence,
+            'interval': [low, high],
+            'threshold': self.threshold,
+        }
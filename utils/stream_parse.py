@@ -0,0 +1,306 @@
+"""
+流式解析
+按声明式字段选择器，用 lxml 的增量解析器（HTMLPullParser）单遍扫描文档，处理完的子树立即丢弃，
+内存占用只取决于嵌套深度和单个被提取元素（或列表项）的大小，与文档总大小无关
+
+规格沿用 Schema 配置格式，字段定义中增加 selector（CSS）和可选的 attribute：
+
+    {
+      "fields": {
+        "title":  {"type": "string", "selector": "h1.title"},
+        "price":  {"type": "number", "selector": "div.info span.price"},
+        "images": {"type": "array",  "selector": "div.gallery img", "attribute": "src"},
+        "items":  {"type": "array",  "selector": "ul.list > li", "fields": {
+            "name": {"selector": "a.name"},
+            "url":  {"selector": "a.name", "attribute": "href"}
+        }}
+      }
+    }
+
+- 顶层选择器在元素开始时按祖先栈匹配，只支持标签、#id、.class、属性选择器以及后代/子代组合符
+- 非数组字段取第一个匹配；数组字段取全部匹配，带 fields 时每个匹配是一个列表项，
+  列表项内的子字段在该项结束时用完整的 CSS（cssselect）在项内求值
+- 所有非数组字段都已取到且没有数组字段时提前结束扫描
+
+生成流程写出的 Schema 配置只有 type / description / required，不含 selector，流式规格需要手工补充
+"""
+import json
+from pathlib import Path
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+from cssselect import GenericTranslator, SelectorError, parse as parse_css
+from cssselect.parser import Attrib, Class, CombinedSelector, Element, Hash
+from lxml import etree
+from .field_scoring import normalize_number
+
+
+# 每次送入增量解析器的字符数
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# 提取文本时跳过的元素
+_NON_TEXT_TAGS = ("script", "style", "template")
+
+_translator = GenericTranslator()
+
+
+class _Step:
+    """复合选择器中的一步：标签、id、class 和属性条件，combinator 为与左侧一步的关系"""
+
+    __slots__ = ("tag", "element_id", "classes", "attributes", "combinator")
+
+    def __init__(self):
+        self.tag = None
+        self.element_id = None
+        self.classes = []
+        self.attributes = []
+        self.combinator = None
+
+    def matches(self, element) -> bool:
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        if self.element_id is not None and element.get("id") != self.element_id:
+            return False
+        if self.classes:
+            classes = (element.get("class") or "").split()
+            if any(name not in classes for name in self.classes):
+                return False
+        return all(_attribute_matches(element.get(name), operator, value) for name, operator, value in self.attributes)
+
+
+def _attribute_matches(actual: Optional[str], operator: str, value: Optional[str]) -> bool:
+    if actual is None:
+        return False
+    if operator == "exists":
+        return True
+    if operator == "=":
+        return actual == value
+    if operator == "~=":
+        return value in actual.split()
+    if operator == "|=":
+        return actual == value or actual.startswith(value + "-")
+    if operator == "^=":
+        return bool(value) and actual.startswith(value)
+    if operator == "$=":
+        return bool(value) and actual.endswith(value)
+    if operator == "*=":
+        return bool(value) and value in actual
+    return False
+
+
+def _compile_step(tree, step: _Step):
+    if isinstance(tree, Element):
+        step.tag = tree.element.lower() if tree.element else None
+    elif isinstance(tree, Class):
+        step.classes.append(tree.class_name)
+        _compile_step(tree.selector, step)
+    elif isinstance(tree, Hash):
+        step.element_id = tree.id
+        _compile_step(tree.selector, step)
+    elif isinstance(tree, Attrib):
+        value = tree.value.value if hasattr(tree.value, "value") else tree.value
+        step.attributes.append((tree.attrib.lower(), tree.operator, value))
+        _compile_step(tree.selector, step)
+    else:
+        raise ValueError(f"流式解析不支持的选择器: {type(tree).__name__}")
+
+
+def compile_stream_selector(css: str) -> List[List[_Step]]:
+    """
+    把 CSS 选择器编译为可在祖先栈上匹配的步骤序列（逗号分隔的每个选择器一组，从左到右）
+
+    Raises:
+        ValueError: 语法错误，或包含伪类、函数、兄弟组合符等无法在元素开始时判断的部分
+    """
+    try:
+        selectors = parse_css(css)
+    except SelectorError as e:
+        raise ValueError(f"选择器语法错误: {css} ({e})")
+
+    compiled = []
+    for selector in selectors:
+        if selector.pseudo_element:
+            raise ValueError(f"流式解析不支持伪元素: {css}")
+        steps = []
+        tree = selector.parsed_tree
+        while isinstance(tree, CombinedSelector):
+            if tree.combinator not in (" ", ">"):
+                raise ValueError(f"流式解析不支持组合符 '{tree.combinator}': {css}")
+            step = _Step()
+            _compile_step(tree.subselector, step)
+            step.combinator = tree.combinator
+            steps.append(step)
+            tree = tree.selector
+        step = _Step()
+        _compile_step(tree, step)
+        steps.append(step)
+        steps.reverse()
+        compiled.append(steps)
+    return compiled
+
+
+def _matches_path(steps: List[_Step], element, index: int) -> bool:
+    """steps[index] 匹配 element，之前的各步按组合符匹配它的祖先（回溯搜索；祖先此时尚未结束，没有被丢弃）"""
+    step = steps[index]
+    if not step.matches(element):
+        return False
+    if index == 0:
+        return True
+    parent = element.getparent()
+    if step.combinator == ">":
+        return parent is not None and _matches_path(steps, parent, index - 1)
+    while parent is not None:
+        if _matches_path(steps, parent, index - 1):
+            return True
+        parent = parent.getparent()
+    return False
+
+
+def _text(element) -> Optional[str]:
+    """元素的文本（跳过脚本和样式，空白合并为单个空格），为空时返回 None"""
+    if next(element.iter(*_NON_TEXT_TAGS), None) is not None:
+        etree.strip_elements(element, *_NON_TEXT_TAGS, with_tail=False)
+    text = " ".join("".join(element.itertext()).split())
+    return text or None
+
+
+def _value(element, attribute: Optional[str], field_type: str):
+    if attribute:
+        value = element.get(attribute)
+        value = value.strip() if value is not None else None
+    else:
+        value = _text(element)
+    if field_type == "number" and value is not None:
+        return normalize_number(value)
+    return value
+
+
+class _Field:
+    """一个顶层字段"""
+
+    def __init__(self, name: str, definition: Dict):
+        self.name = name
+        self.type = definition.get("type", "string")
+        self.attribute = definition.get("attribute")
+        self.multiple = self.type == "array"
+        self.paths = compile_stream_selector(definition["selector"])
+        # 列表项子字段：名称 -> (XPath, attribute, type)
+        self.item_fields = None
+        if definition.get("fields"):
+            self.item_fields = {}
+            for sub_name, sub in definition["fields"].items():
+                if not sub.get("selector"):
+                    raise ValueError(f"列表字段 {name} 的子字段 {sub_name} 缺少 selector")
+                try:
+                    xpath = _translator.css_to_xpath(sub["selector"], prefix="descendant-or-self::")
+                except SelectorError as e:
+                    raise ValueError(f"选择器语法错误: {sub['selector']} ({e})")
+                self.item_fields[sub_name] = (etree.XPath(xpath), sub.get("attribute"), sub.get("type", "string"))
+
+    def extract(self, element):
+        if self.item_fields is None:
+            return _value(element, self.attribute, "string" if self.multiple else self.type)
+        item = {}
+        for name, (xpath, attribute, field_type) in self.item_fields.items():
+            found = xpath(element)
+            if field_type == "array":
+                item[name] = [_value(e, attribute, "string") for e in found]
+            else:
+                item[name] = _value(found[0], attribute, field_type) if found else None
+        return item
+
+
+def load_stream_spec(path: str) -> Dict[str, Dict]:
+    """读取流式解析规格（Schema 配置）中带 selector 的字段"""
+    with open(path, "r", encoding="utf-8") as f:
+        fields = json.load(f).get("fields") or {}
+    return {name: definition for name, definition in fields.items() if (definition or {}).get("selector")}
+
+
+def is_stream_spec(parser_path: str) -> bool:
+    """解析器路径是否是流式解析规格（JSON）而不是解析器代码"""
+    return Path(parser_path).suffix.lower() == ".json"
+
+
+class StreamingParser:
+    """
+    按声明式选择器单遍提取字段的解析器，接口与生成的 WebPageParser 相同（parse / parse_many），
+    可以直接用于批量解析、沙箱和验证
+
+    另有 parse_stream，从文件对象中分块读取，整个文档不必读入内存
+    """
+
+    def __init__(self, fields: Dict[str, Dict], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if not fields:
+            raise ValueError("流式解析规格中没有带 selector 的字段（生成的 Schema 配置不含 selector，需要手工补充）")
+        self.fields = [_Field(name, definition) for name, definition in fields.items()]
+        self.chunk_size = max(1, chunk_size)
+        # 按选择器最后一步的标签索引，每个元素只检查可能匹配的字段；不限定标签的选择器对所有元素检查
+        self._by_tag: Dict[Optional[str], List[tuple]] = {}
+        for field in self.fields:
+            for steps in field.paths:
+                self._by_tag.setdefault(steps[-1].tag, []).append((field, steps))
+        self._any_tag = self._by_tag.pop(None, [])
+
+    @classmethod
+    def from_file(cls, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "StreamingParser":
+        return cls(load_stream_spec(path), chunk_size=chunk_size)
+
+    def parse(self, html: str) -> Dict:
+        return self._run(html[i:i + self.chunk_size] for i in range(0, len(html), self.chunk_size))
+
+    def parse_many(self, htmls: Iterable[str]) -> Iterator[Dict]:
+        for html in htmls:
+            yield self.parse(html)
+
+    def parse_stream(self, stream: IO) -> Dict:
+        """从文件对象（文本或二进制）中分块读取并解析"""
+        return self._run(iter(lambda: stream.read(self.chunk_size), stream.read(0)))
+
+    def _run(self, chunks: Iterable) -> Dict:
+        result = {field.name: [] if field.multiple else None for field in self.fields}
+        pending = [field for field in self.fields if not field.multiple]
+        stop_early = len(pending) == len(self.fields)
+
+        parser = etree.HTMLPullParser(events=("start", "end"), remove_comments=True, remove_pis=True)
+        by_tag, any_tag = self._by_tag, self._any_tag
+        # 正在提取的元素及其匹配到的字段（按嵌套顺序）
+        open_captures: List[tuple] = []
+        # 已匹配到（可能尚未结束）的非数组字段，嵌套的后续匹配不再提取
+        claimed = set()
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == "start":
+                    candidates = by_tag.get(element.tag)
+                    if candidates is None and not any_tag:
+                        continue
+                    matched = []
+                    for field, steps in (candidates or []) + any_tag:
+                        if field not in matched and (field.multiple or field.name not in claimed) \
+                                and _matches_path(steps, element, len(steps) - 1):
+                            matched.append(field)
+                    if matched:
+                        claimed.update(field.name for field in matched if not field.multiple)
+                        open_captures.append((element, matched))
+                    continue
+
+                if open_captures and open_captures[-1][0] is element:
+                    _, matched = open_captures.pop()
+                    for field in matched:
+                        value = field.extract(element)
+                        if field.multiple:
+                            result[field.name].append(value)
+                        else:
+                            result[field.name] = value
+                # 没有仍在提取中的祖先时，丢弃已处理的子树和之前的兄弟节点
+                if not open_captures:
+                    element.clear(keep_tail=False)
+                    parent = element.getparent()
+                    if parent is not None:
+                        while element.getprevious() is not None:
+                            del parent[0]
+
+            if stop_early and not open_captures and len(claimed) == len(pending):
+                break
+        parser.close()
+        return result
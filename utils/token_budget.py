@@ -0,0 +1,240 @@
+"""
+Token预算与统计
+使用本地分词器估算提示词大小，按优先级在各段落之间分配预算，并记录每次调用的估算与实际token数
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from loguru import logger
+
+
+_TRUNCATION_MARKER = "\n... (截断)"
+
+# 分词器不可用时的估算系数（字符数 / token）
+_CHARS_PER_TOKEN = 3.0
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """懒加载 tiktoken 分词器，不可用时返回 None 并退化为按字符估算"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken 分词器不可用，按字符数估算token: {str(e)}")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return int(len(text) / _CHARS_PER_TOKEN) + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    """估算消息列表的token数（仅统计文本内容）"""
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += count_tokens(content)
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到指定token数以内（包含截断标记）"""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    keep = max(max_tokens - count_tokens(_TRUNCATION_MARKER), 0)
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:int(keep * _CHARS_PER_TOKEN)] + _TRUNCATION_MARKER
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:keep]) + _TRUNCATION_MARKER
+
+
+@dataclass
+class PromptSection:
+    """
+    提示词段落
+
+    Attributes:
+        name: 段落名称
+        content: 段落内容
+        priority: 优先级，数值越大越重要，预算不足时优先压缩低优先级段落
+        min_tokens: 压缩时保留的最少token数
+        shrinkable: 是否允许压缩（固定的指令文本不允许）
+    """
+    name: str
+    content: str
+    priority: int = 0
+    min_tokens: int = 0
+    shrinkable: bool = True
+
+
+class TokenBudget:
+    """按优先级在提示词段落之间分配token预算"""
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+
+    def allocate(self, sections: List[PromptSection]) -> Dict[str, str]:
+        """
+        分配预算
+
+        预算不足时从优先级最低的段落开始压缩，每个段落最多压缩到 min_tokens，
+        直到总量不超过预算
+
+        Returns:
+            段落名称 -> 分配后的内容
+        """
+        sizes = {s.name: count_tokens(s.content) for s in sections}
+        overflow = sum(sizes.values()) - self.max_tokens
+        result = {s.name: s.content for s in sections}
+
+        if overflow <= 0:
+            return result
+
+        for section in sorted(sections, key=lambda s: s.priority):
+            if overflow <= 0:
+                break
+            if not section.shrinkable:
+                continue
+
+            reducible = sizes[section.name] - section.min_tokens
+            if reducible <= 0:
+                continue
+
+            target = sizes[section.name] - min(reducible, overflow)
+            result[section.name] = truncate_to_tokens(section.content, target)
+            new_size = count_tokens(result[section.name])
+            overflow -= sizes[section.name] - new_size
+            logger.debug(f"压缩提示词段落 {section.name}: {sizes[section.name]} -> {new_size} tokens")
+
+        if overflow > 0:
+            logger.warning(f"提示词在压缩后仍超出预算 {overflow} tokens")
+
+        return result
+
+
+class TokenLedger:
+    """记录每次LLM调用的估算token数与实际token数"""
+
+    def __init__(self):
+        self._records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, call: str, estimated_tokens: int, response=None, prefix_tokens: int = None) -> Dict:
+        """
+        记录一次调用
+
+        Args:
+            call: 调用名称（如 code_generation、code_fix）
+            estimated_tokens: 调用前估算的提示词token数
+            response: LLM响应（可选），从 usage_metadata 中读取实际用量
+            prefix_tokens: 可缓存的稳定前缀token数（可选）
+        """
+        usage = _extract_usage(response)
+        details = usage.get('input_token_details') or {}
+        entry = {
+            'call': call,
+            'estimated_tokens': estimated_tokens,
+            'prefix_tokens': prefix_tokens,
+            'input_tokens': usage.get('input_tokens'),
+            'output_tokens': usage.get('output_tokens'),
+            'cache_read_tokens': details.get('cache_read'),
+            'cache_creation_tokens': details.get('cache_creation'),
+        }
+        with self._lock:
+            self._records.append(entry)
+
+        if entry['input_tokens']:
+            logger.debug(
+                f"[{call}] 提示词token: 估算 {estimated_tokens}, 实际 {entry['input_tokens']}, "
+                f"输出 {entry['output_tokens']}, 可缓存前缀 {prefix_tokens or 0}, "
+                f"缓存命中 {entry['cache_read_tokens'] or 0}, 缓存写入 {entry['cache_creation_tokens'] or 0}"
+            )
+        else:
+            logger.debug(f"[{call}] 提示词token: 估算 {estimated_tokens}")
+        return entry
+
+    def records(self, call: Optional[str] = None) -> List[Dict]:
+        """获取调用记录"""
+        with self._lock:
+            return [r for r in self._records if call is None or r['call'] == call]
+
+    def mark(self) -> int:
+        """当前记录数，作为 summary(since=...) 的起点，用于只汇总某一次运行的调用"""
+        with self._lock:
+            return len(self._records)
+
+    def summary(self, since: int = 0) -> Dict[str, Dict]:
+        """按调用名称汇总估算与实际token数（since 为 mark() 返回的起点）"""
+        summary: Dict[str, Dict] = {}
+        for r in self.records()[since:]:
+            item = summary.setdefault(r['call'], {
+                'calls': 0, 'estimated_tokens': 0, 'prefix_tokens': 0, 'input_tokens': 0,
+                'output_tokens': 0, 'cache_read_tokens': 0, 'cache_creation_tokens': 0,
+            })
+            item['calls'] += 1
+            item['estimated_tokens'] += r['estimated_tokens']
+            for key in ('prefix_tokens', 'input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_creation_tokens'):
+                item[key] += r[key] or 0
+
+        for item in summary.values():
+            # 实际输入中命中缓存的比例，用于评估前缀缓存的效果
+            item['cache_hit_rate'] = (
+                item['cache_read_tokens'] / item['input_tokens'] if item['input_tokens'] else 0.0
+            )
+        return summary
+
+    @staticmethod
+    def format_summary(summary: Dict[str, Dict]) -> List[str]:
+        """把 summary() 的结果格式化为每个调用名称一行"""
+        lines = []
+        for call, item in summary.items():
+            line = f"{call}: {item['calls']} 次调用，提示词估算 {item['estimated_tokens']} tokens"
+            if item['prefix_tokens']:
+                line += f"，可缓存前缀 {item['prefix_tokens']}"
+            if item['input_tokens']:
+                line += (
+                    f"，实际输入 {item['input_tokens']}，输出 {item['output_tokens']}，"
+                    f"缓存命中 {item['cache_read_tokens']} ({item['cache_hit_rate']:.1%})，"
+                    f"缓存写入 {item['cache_creation_tokens']}"
+                )
+            lines.append(line)
+        return lines
+
+    def reset(self):
+        """清空记录"""
+        with self._lock:
+            self._records.clear()
+
+
+def _extract_usage(response) -> Dict:
+    """从 LangChain 响应中读取token用量"""
+    usage = getattr(response, 'usage_metadata', None)
+    if isinstance(response, dict):
+        usage = response
+    return dict(usage) if usage else {}
+
+
+# 全局统计实例
+token_ledger = TokenLedger()
@@ -0,0 +1,158 @@
+"""
+验证结果缓存
+按 (解析器内容哈希, 页面键) 在本地 SQLite 中记录单个页面的验证结果，
+页面键由页面内容哈希和检查条件（目标字段、参考值、评分阈值）共同决定
+"""
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+from .hashing import json_hash
+
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS page_results (
+    parser_hash TEXT NOT NULL,
+    page_key TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (parser_hash, page_key)
+);
+CREATE INDEX IF NOT EXISTS idx_page_results_page ON page_results (page_key, created_at);
+CREATE TABLE IF NOT EXISTS url_outcomes (
+    url TEXT PRIMARY KEY,
+    success INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# SQLite 单条语句的参数数量上限较小，批量查询按块进行
+_QUERY_CHUNK = 500
+
+
+def page_key(page_hash: str, checks: Dict) -> str:
+    """页面内容哈希与检查条件组合成的缓存键"""
+    return json_hash([page_hash, checks])
+
+
+class ValidationCache:
+    """
+    验证结果缓存
+
+    - lookup：同一解析器版本在同一页面、同一检查条件下的结果直接复用
+    - last_outcomes：页面在任意版本上最近一次的成败，用于决定新版本的验证顺序
+    - last_url_outcomes：URL 最近一次的成败，获取HTML之前就能对整个URL列表排序
+    """
+
+    def __init__(self, db_path: str = ".cache/validation.db"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA_SQL)
+
+    @contextmanager
+    def _connect(self):
+        """每次操作使用独立连接，支持多线程和多进程并发访问"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _select(self, sql: str, keys: List[str], *params) -> List[sqlite3.Row]:
+        rows = []
+        with self._connect() as conn:
+            for i in range(0, len(keys), _QUERY_CHUNK):
+                chunk = keys[i:i + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(sql.format(placeholders=placeholders), (*params, *chunk)).fetchall())
+        return rows
+
+    def lookup(self, parser_hash: str, page_keys: List[str]) -> Dict[str, Dict]:
+        """
+        查询已知的验证结果
+
+        Returns:
+            页面键 -> 验证结果（不含 url）
+        """
+        rows = self._select(
+            "SELECT page_key, result FROM page_results WHERE parser_hash = ? AND page_key IN ({placeholders})",
+            page_keys, parser_hash
+        )
+        return {row['page_key']: json.loads(row['result']) for row in rows}
+
+    def last_outcomes(self, page_keys: List[str]) -> Dict[str, bool]:
+        """
+        页面在任意解析器版本上最近一次的验证成败
+
+        Returns:
+            页面键 -> 是否通过（从未验证过的页面不出现）
+        """
+        rows = self._select(
+            """
+            SELECT page_key, success FROM page_results AS r
+            WHERE page_key IN ({placeholders})
+              AND created_at = (SELECT MAX(created_at) FROM page_results WHERE page_key = r.page_key)
+            """,
+            page_keys
+        )
+        return {row['page_key']: bool(row['success']) for row in rows}
+
+    def last_url_outcomes(self, urls: List[str]) -> Dict[str, bool]:
+        """
+        URL 在任意解析器版本、任意页面内容上最近一次的验证成败
+
+        Returns:
+            URL -> 是否通过（从未验证过的URL不出现）
+        """
+        rows = self._select("SELECT url, success FROM url_outcomes WHERE url IN ({placeholders})", urls)
+        return {row['url']: bool(row['success']) for row in rows}
+
+    def store_url_outcomes(self, outcomes: Dict[str, bool]):
+        """记录各URL最近一次的验证成败"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO url_outcomes (url, success, created_at) VALUES (?, ?, ?)",
+                [(url, int(bool(success)), now) for url, success in outcomes.items()]
+            )
+
+    def store(self, parser_hash: str, results: Dict[str, Dict]):
+        """
+        记录验证结果
+
+        Args:
+            parser_hash: 解析器内容哈希
+            results: 页面键 -> 验证结果（url 不会被存储）
+        """
+        now = time.time()
+        rows = [
+            (
+                parser_hash, key, int(bool(result.get('success'))),
+                json.dumps({k: v for k, v in result.items() if k != 'url'}, ensure_ascii=False, default=str),
+                now
+            )
+            for key, result in results.items()
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO page_results (parser_hash, page_key, success, result, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+
+    def stats(self) -> Dict:
+        """缓存规模"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS results, COUNT(DISTINCT parser_hash) AS parsers FROM page_results"
+            ).fetchone()
+        return {'results': row['results'], 'parsers': row['parsers']}
@@ -0,0 +1,191 @@
+"""
+验证报告
+逐个URL的完整验证结果以 JSONL 流式写入报告文件，内存中只保留计数、字段统计和有限数量的失败样本
+"""
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+from loguru import logger
+from .field_check import FIELD_OK
+from .parse_profile import merge_extractors
+
+
+# 按错误信息计数时保留的不同错误数，其余计入 "其他错误"
+_MAX_ERROR_KINDS = 50
+_OTHER_ERRORS = "其他错误"
+# 失败样本中参考值/提取值的最大字符数
+_MAX_VALUE_CHARS = 200
+
+
+def _truncate(text, max_chars: int):
+    if isinstance(text, str) and len(text) > max_chars:
+        return text[:max_chars] + f"...（截断，共 {len(text)} 字符）"
+    return text
+
+
+def _compact_value(value):
+    """样本中的字段值只保留开头部分"""
+    if isinstance(value, str):
+        return _truncate(value, _MAX_VALUE_CHARS)
+    if isinstance(value, (list, tuple)):
+        return [_compact_value(v) for v in value[:5]]
+    if isinstance(value, dict):
+        return _truncate(json.dumps(value, ensure_ascii=False, default=str), _MAX_VALUE_CHARS)
+    return value
+
+
+class ValidationReport:
+    """
+    单次验证的流式报告
+
+    - add：写入一行 JSONL（完整结果），并更新内存中的聚合统计
+    - 内存中只保留失败页面（或存在异常字段的页面）的前 max_samples 个精简样本：
+      不含解析数据，details 截断，只保留未通过的字段
+    - apply：把聚合结果写入 validate_parser 的返回值
+    """
+
+    def __init__(
+        self,
+        parser_path: str,
+        target_fields: Dict = None,
+        report_dir: Optional[str] = None,
+        max_samples: int = 20,
+        max_detail_chars: int = 1000
+    ):
+        self.target_fields = target_fields or {}
+        self.max_samples = max_samples
+        self.max_detail_chars = max_detail_chars
+
+        self.counts = {
+            'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0,
+            'fetch_failed': 0, 'cached': 0, 'over_budget': 0,
+        }
+        self.error_counts: Dict[str, int] = {}
+        self.field_stats: Dict[str, Dict[str, int]] = {name: {} for name in self.target_fields}
+        self.failures = []
+
+        self._parse_time_total = 0.0
+        self._parse_time_count = 0
+        self._parse_time_max = None
+        self._cpu_time_total = 0.0
+        self._cpu_time_count = 0
+        self._peak_memory_kb = None
+        self._extractors: Dict[str, Dict] = {}
+        self._scored = 0
+        self._score_total = 0.0
+        self._field_score_totals = {name: 0.0 for name in self.target_fields}
+
+        self.path = None
+        self._file = None
+        if report_dir:
+            directory = Path(report_dir)
+            directory.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d_%H%M%S')}_{Path(parser_path).stem[:12]}_{uuid.uuid4().hex[:6]}.jsonl"
+            self.path = directory / name
+            self._file = open(self.path, "w", encoding="utf-8")
+
+    def add(self, test: Dict):
+        """记录一个页面的验证结果"""
+        if self._file:
+            self._file.write(json.dumps(test, ensure_ascii=False, default=str) + "\n")
+
+        counts = self.counts
+        counts['total'] += 1
+        counts['passed' if test.get('success') else 'failed'] += 1
+        for flag in ('skipped', 'fetch_failed', 'cached'):
+            if test.get(flag):
+                counts[flag] += 1
+        if test.get('latency_error'):
+            counts['over_budget'] += 1
+
+        if not test.get('success') and test.get('error'):
+            error = _truncate(test['error'], _MAX_VALUE_CHARS)
+            error = error if (
+                error in self.error_counts or len(self.error_counts) < _MAX_ERROR_KINDS
+            ) else _OTHER_ERRORS
+            self.error_counts[error] = self.error_counts.get(error, 0) + 1
+
+        if test.get('parse_time_ms') is not None:
+            self._parse_time_total += test['parse_time_ms']
+            self._parse_time_count += 1
+            self._parse_time_max = max(self._parse_time_max or 0.0, test['parse_time_ms'])
+        if test.get('cpu_time_ms') is not None:
+            self._cpu_time_total += test['cpu_time_ms']
+            self._cpu_time_count += 1
+        profile = test.get('profile')
+        if profile:
+            if profile.get('peak_memory_kb') is not None:
+                self._peak_memory_kb = max(self._peak_memory_kb or 0.0, profile['peak_memory_kb'])
+            merge_extractors(self._extractors, profile)
+
+        field_results = test.get('field_results') or {}
+        for name, field_result in field_results.items():
+            stats = self.field_stats.setdefault(name, {})
+            stats[field_result['status']] = stats.get(field_result['status'], 0) + 1
+
+        # 跳过的页面没有运行，不计入得分
+        if self.target_fields and not test.get('skipped'):
+            self._scored += 1
+            self._score_total += test.get('score', 0.0)
+            for name in self._field_score_totals:
+                self._field_score_totals[name] += field_results.get(name, {}).get('score', 0.0)
+
+        abnormal = {name: r for name, r in field_results.items() if r['status'] != FIELD_OK}
+        if (not test.get('success') or abnormal) and not test.get('skipped') \
+                and len(self.failures) < self.max_samples:
+            self.failures.append(self._sample(test, abnormal))
+
+    def _sample(self, test: Dict, abnormal: Dict[str, Dict]) -> Dict:
+        """精简的失败样本"""
+        return {
+            'url': test['url'],
+            'success': test.get('success', False),
+            'error': _truncate(test.get('error'), self.max_detail_chars),
+            'details': _truncate(test.get('details') or '', self.max_detail_chars),
+            'parse_time_ms': test.get('parse_time_ms'),
+            'cpu_time_ms': test.get('cpu_time_ms'),
+            'score': test.get('score'),
+            'latency_error': test.get('latency_error'),
+            'profile': test.get('profile') if test.get('latency_error') else None,
+            'field_results': {
+                name: dict(r, actual=_compact_value(r.get('actual')), expected=_compact_value(r.get('expected')))
+                for name, r in abnormal.items()
+            },
+        }
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            logger.info(f"验证报告已写入: {self.path}")
+
+    def apply(self, results: Dict):
+        """把聚合结果写入验证结果"""
+        results['counts'] = dict(self.counts)
+        results['error_counts'] = dict(self.error_counts)
+        results['failures'] = self.failures
+        results['report_path'] = str(self.path) if self.path else None
+        if self._parse_time_count:
+            results['avg_parse_time_ms'] = self._parse_time_total / self._parse_time_count
+            results['max_parse_time_ms'] = self._parse_time_max
+        if self._cpu_time_count:
+            results['avg_cpu_time_ms'] = self._cpu_time_total / self._cpu_time_count
+        results['max_peak_memory_kb'] = self._peak_memory_kb
+        results['slowest_extractors'] = sorted(
+            self._extractors.values(), key=lambda e: e['total_ms'], reverse=True
+        )[:5]
+
+        if self.target_fields:
+            results['field_stats'] = self.field_stats
+            if self._scored:
+                results['score'] = self._score_total / self._scored
+                results['field_scores'] = {
+                    name: total / self._scored for name, total in self._field_score_totals.items()
+                }
+
+        if self.counts['over_budget']:
+            results['issues'].append(f"{self.counts['over_budget']} 个页面的解析耗时超出预算")
+        if self.counts['skipped']:
+            results['issues'].append(f"之前失败的页面仍然失败，跳过了 {self.counts['skipped']} 个页面的回归检查")